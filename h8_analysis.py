@@ -0,0 +1,156 @@
+"""
+Headless versions of the analysis steps in h8_ida_disam.py
+
+Each pass reads a RomSpace and returns plain data (lists of dicts) so results can be
+written out as JSON or applied to an IDB later.
+"""
+
+import collections
+
+import h8_rom
+import h8_signatures
+
+#Vector table as loaded at 0x10000 (mirrored at 0x0)
+VECTOR_TABLE_START = 0x10000
+#Entries below this are exception and interrupt vectors, entries above are DTC vectors
+DTC_VECTORS_START = 0x10140
+VECTOR_TABLE_END = 0x10200
+
+#Default location of the MUT request table
+MUT_TABLE_START = 0x2FAD0
+MUT_TABLE_END = 0x2FCEE
+#Requests from here on are commands (actuator tests, clearing faults, calibration, init) handled
+#by the MUT handler itself, their table entries do not point at a variable
+MUT_COMMANDS_START = 0xC0
+
+KnownFunction = collections.namedtuple('KnownFunction', 'address name comment')
+
+#Functions at fixed addresses
+#Addresses are usually the same between ROMs
+KNOWN_FUNCTIONS = (
+	KnownFunction(0x1517C, 'main', 'Main entry point'),
+	KnownFunction(0x20A80, 'start_main_ loop', 'Sets up and then enters main loop'),
+	KnownFunction(0x20024, 'copy_flash_code', 'Copies Flash code into RAM starting at 0xF290\nStart address of copy is in R4\nEnd address of copy is in R1'),
+	KnownFunction(0x14656, 'table_lookup_byte', 'Look up the current BYTE value at the table stored in the stack'),
+	KnownFunction(0x14854, 'table_lookup_word', 'Look up the current WORD value at the table stored in the stack'),
+	KnownFunction(0x14735, 'axis_lookup', 'Look up the current value in the axis stored in the stack'),
+)
+
+KnownVar = collections.namedtuple('KnownVar', 'value optionName varName comment')
+
+#Variables found from the instructions that load them
+#value is the immediate the option is loaded with, the variable is written two instructions later
+KNOWN_VARS = (
+	KnownVar(0x262, 'ecu_option_0', 'ecu_opt_0', 'ECU Option 0'),
+	KnownVar(0x272, 'ecu_option_1', 'ecu_opt_1', 'ECU Option 1'),
+	KnownVar(0x282, 'ecu_option_2', 'ecu_opt_2', 'ECU Option 2'),
+)
+
+#Fields of a DTC register information block
+DTC_FIELDS = (
+	('DTMR', 'Data Transfer Mode'),
+	('DTSR', 'Source Address'),
+	('DTDR', 'Destination Address'),
+	('DTCR', 'Transfer Count'),
+)
+
+def segments():
+	"""
+	Returns the Mode 4 segments createSegments() creates
+	"""
+	return [{'name': s.name, 'start': s.start, 'end': s.end, 'class': s.sclass} for s in h8_rom.SEGMENTS]
+
+def vectorTargets(rom):
+	"""
+	Returns the target of every exception and interrupt vector like createVTEntries()
+	"""
+	targets = []
+	for addr in range(VECTOR_TABLE_START, DTC_VECTORS_START, 4):
+		targets.append({'vector': addr - VECTOR_TABLE_START, 'target': rom.Dword(addr)})
+	return targets
+
+def dtcDescriptors(rom):
+	"""
+	Returns the DTC register information block every DTC vector points to
+	Blocks in RAM are not backed by the ROM so only their address is returned
+	"""
+	descriptors = []
+	counter = 0
+	for addr in range(DTC_VECTORS_START, VECTOR_TABLE_END, 4):
+		j = rom.Dword(addr)
+		descriptor = {'vector': addr - VECTOR_TABLE_START, 'address': j, 'index': counter}
+		if rom.isMapped(j) and rom.isMapped(j + 7):
+			for i, (field, comment) in enumerate(DTC_FIELDS):
+				descriptor[field] = rom.Word(j + i * 2)
+		descriptors.append(descriptor)
+		counter = counter + 1
+	return descriptors
+
+def mutTable(rom, startAddress=MUT_TABLE_START, endAddress=MUT_TABLE_END):
+	"""
+	Returns every MUT request table entry between startAddress and endAddress inclusive like createMutTable()
+	Odd pointers are aligned down to the word they address
+	"""
+	entries = []
+	counter = 0
+	currentAddress = startAddress
+	while currentAddress <= endAddress:
+		value = rom.Word(currentAddress)
+		entries.append({
+			'name': 'MUT_%02X' % counter,
+			'entry': currentAddress,
+			'pointer': value,
+			'address': value - (value % 2),
+		})
+		currentAddress = currentAddress + 2
+		counter = counter + 1
+	return entries
+
+def knownFunctions(rom, functionStart=None, signatures=None):
+	"""
+	Returns the fixed address functions plus every function found by signature like labelKnownFunctions()
+	Without a functionStart resolver signature hits are mapped to functions found by h8_decoder
+	"""
+	functions = [{'address': f.address, 'name': f.name, 'comment': f.comment} for f in KNOWN_FUNCTIONS]
+	if functionStart is None:
+		functionStart = decodedFunctionStart(rom)
+	for signature, address, match in h8_signatures.findFunctions(rom, functionStart, signatures):
+		functions.append({'address': address, 'name': signature.name, 'comment': signature.comment, 'match': match})
+	return functions
+
+def decodedFunctionStart(rom):
+	"""
+	Returns a resolver mapping an address to the start of its containing function using a headless disassembly
+	Addresses outside any decoded function resolve to themselves
+	"""
+	#h8_decoder seeds itself from KNOWN_FUNCTIONS so it is imported here to avoid a circular import
+	import h8_decoder
+	disassembly = h8_decoder.disassemble(rom)
+
+	def functionStart(ea):
+		start = disassembly.functionContaining(ea)
+		return ea if start is None else start
+	return functionStart
+
+def knownVars(disassembly):
+	"""
+	Returns the variables in KNOWN_VARS found through the operand index of a h8_decoder.Disassembly like labelKnownVars()
+	Each result has the instruction using the option value and, if found, the variable it is stored to
+	"""
+	found = []
+	for var in KNOWN_VARS:
+		uses = disassembly.usesOf(var.value)
+		if not uses:
+			continue
+		insn = uses[0]
+		result = {'value': var.value, 'insn': insn.address, 'optionName': var.optionName,
+			'varName': var.varName, 'comment': var.comment, 'var': None}
+
+		#The option is stored to its RAM variable two instructions later
+		store = disassembly.nextInsn(insn)
+		if store is not None:
+			store = disassembly.nextInsn(store)
+		if store is not None:
+			result['var'] = disassembly.absoluteAddress(store)
+		found.append(result)
+	return found
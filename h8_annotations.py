@@ -0,0 +1,500 @@
+"""
+Annotation plans
+
+The labeling steps build an AnnotationPlan in memory (names, comments, data types, patches,
+operand offsets, code, xrefs and segment register values) instead of calling the IDA API item by item. applyPlan()
+then commits a plan to the IDB in one pass sorted by address with logging off by default,
+and dump() writes a plan out as JSON so it can be inspected without touching the IDB.
+
+Planners only need a reader with Byte/Word/Dword: the idc module inside IDA or an
+h8_rom.RomSpace headlessly.
+"""
+
+from __future__ import print_function
+
+import json
+
+import h8_analysis
+import h8_signatures
+
+#Order operations are applied in at the same address
+TYPE = 0
+PATCH = 1
+OFFSET = 2
+CODE = 3
+XREF = 4
+NAME = 5
+COMMENT = 6
+SEGREG = 7
+
+KINDS = ('type', 'patch', 'offset', 'code', 'xref', 'name', 'comment', 'segreg')
+
+#Name flags, mapped to the SN_* constants when applied
+NAME_FLAGS = ('check', 'nocheck', 'nolist')
+
+TYPE_SIZES = {'byte': 1, 'word': 2, 'dword': 4}
+
+#Structures createStructs() defines, applied with MakeStructEx
+STRUCT_TYPES = ('map_3d_byte', 'map_3d_word', 'map_2d_byte', 'map_2d_word', 'axis_table')
+
+def _order(entry):
+	#Sort key of an entry, address and then kind as one integer (KINDS fit in 3 bits)
+	return (entry[0] << 3) | entry[1]
+
+#Arguments shared by the entries the planners append directly
+_BYTE = ('byte',)
+_WORD = ('word',)
+_DWORD = ('dword',)
+_OFFSET = (0, 0)
+
+class AnnotationPlan(object):
+	"""
+	Ordered list of annotations to apply to an IDB
+
+	Every entry is (address, kind, arguments).
+	"""
+
+	def __init__(self, entries=None):
+		self.entries = list(entries) if entries else []
+
+	def __len__(self):
+		return len(self.entries)
+
+	def __iter__(self):
+		return iter(self.entries)
+
+	def extend(self, other):
+		self.entries.extend(other.entries)
+		return self
+
+	def makeType(self, ea, dataType):
+		if dataType not in TYPE_SIZES and dataType not in STRUCT_TYPES:
+			raise ValueError('Unknown data type %s' % dataType)
+		self.entries.append((ea, TYPE, (dataType,)))
+
+	def patch(self, ea, size, value):
+		self.entries.append((ea, PATCH, (size, value)))
+
+	def offset(self, ea, operand=0, base=0):
+		self.entries.append((ea, OFFSET, (operand, base)))
+
+	def code(self, ea, function=True):
+		self.entries.append((ea, CODE, (function,)))
+
+	def xref(self, ea, target, dataRef=False):
+		self.entries.append((ea, XREF, (target, dataRef)))
+
+	def name(self, ea, name, flags='nocheck'):
+		if flags not in NAME_FLAGS:
+			raise ValueError('Unknown name flags %s' % flags)
+		self.entries.append((ea, NAME, (name, flags)))
+
+	def comment(self, ea, comment):
+		self.entries.append((ea, COMMENT, (comment,)))
+
+	def segmentRegister(self, ea, register, value):
+		self.entries.append((ea, SEGREG, (register, value)))
+
+	def sorted(self):
+		"""
+		Returns the entries sorted by address and then by kind, keeping the plan order for equal keys
+		"""
+		return sorted(self.entries, key=_order)
+
+	def counts(self):
+		"""
+		Returns {kind name: number of entries}
+		"""
+		counts = dict((kind, 0) for kind in KINDS)
+		for ea, kind, args in self.entries:
+			counts[KINDS[kind]] = counts[KINDS[kind]] + 1
+		return counts
+
+	def toList(self):
+		return [[ea, KINDS[kind]] + list(args) for ea, kind, args in self.sorted()]
+
+	@classmethod
+	def fromList(cls, items):
+		entries = []
+		for item in items:
+			entries.append((item[0], KINDS.index(item[1]), tuple(item[2:])))
+		return cls(entries)
+
+	def dump(self, path):
+		"""
+		Writes the plan to a JSON file, one entry per line
+		"""
+		with open(path, 'w') as f:
+			f.write('[\n')
+			items = self.toList()
+			for i, item in enumerate(items):
+				f.write(json.dumps(item))
+				f.write(',\n' if i < len(items) - 1 else '\n')
+			f.write(']\n')
+
+	@classmethod
+	def load(cls, path):
+		with open(path) as f:
+			return cls.fromList(json.load(f))
+
+def _defaultApi():
+	#The IDA API is only available inside IDA
+	import idc
+	return idc
+
+def applyPlan(plan, api=None, verbose=False):
+	"""
+	Applies a plan to the IDB in one pass sorted by address
+	api defaults to the idc module. Each operation is only printed when verbose is set.
+	"""
+	if api is None:
+		api = _defaultApi()
+
+	makeType = {
+		'byte': api.MakeByte,
+		'word': api.MakeWord,
+		'dword': api.MakeDword,
+	}
+	patch = {
+		1: api.PatchByte,
+		2: api.PatchWord,
+		4: api.PatchDword,
+	}
+	nameFlags = {
+		'check': api.SN_CHECK,
+		'nocheck': api.SN_NOCHECK,
+		'nolist': api.SN_NOLIST,
+	}
+	makeName = api.MakeNameEx
+	makeComment = api.MakeComm
+	opOff = api.OpOff
+
+	#Branches in order of how common each kind is
+	for ea, kind, args in plan.sorted():
+		if verbose:
+			print('%X %s %s' % (ea, KINDS[kind], ' '.join(str(a) for a in args)))
+		if kind == TYPE:
+			function = makeType.get(args[0])
+			if function is not None:
+				function(ea)
+			else:
+				api.MakeStructEx(ea, -1, args[0])
+		elif kind == NAME:
+			makeName(ea, args[0], nameFlags[args[1]])
+		elif kind == COMMENT:
+			makeComment(ea, args[0])
+		elif kind == PATCH:
+			patch[args[0]](ea, args[1])
+		elif kind == OFFSET:
+			opOff(ea, args[0], args[1])
+		elif kind == CODE:
+			api.MakeCode(ea)
+			if args[0]:
+				api.AutoMark(ea, api.AU_PROC)
+		elif kind == XREF:
+			if args[1]:
+				api.add_dref(ea, args[0], api.dr_R)
+			else:
+				api.AddCodeXref(ea, args[0], api.fl_F)
+		elif kind == SEGREG:
+			api.SetRegEx(ea, args[0], args[1], api.SR_user)
+
+#Names IDA gives unnamed items, replaced like an empty name when reconciling
+AUTO_NAME_PREFIXES = ('unk_', 'byte_', 'word_', 'dword_', 'off_', 'loc_', 'locret_', 'sub_', 'nullsub_',
+	'stru_', 'asc_', 'algn_', 'j_')
+
+#Kinds an analyst edits by hand, differing values of the other kinds are always replaced
+MANUAL_KINDS = (NAME, COMMENT, TYPE)
+
+def _slot(ea, kind, args):
+	#(slot, value) of an entry, a slot holds one value in the IDB and the last entry for it wins
+	if kind == OFFSET or kind == SEGREG:
+		return (ea, kind, args[0]), args[1]
+	if kind == XREF:
+		return (ea, kind, args[0], bool(args[1])), True
+	if kind == PATCH:
+		return (ea, kind), args[1]
+	if kind == CODE:
+		return (ea, kind), True
+	return (ea, kind), args[0]
+
+def slots(plan):
+	"""
+	Returns {slot: (value, entry)} for a plan, a slot is a name, comment, type, patch, operand
+	offset, code flag, xref or segment register of one address
+	"""
+	found = {}
+	for ea, kind, args in plan.sorted():
+		slot, value = _slot(ea, kind, args)
+		found[slot] = (value, (ea, kind, args))
+	return found
+
+def readState(plan, api=None):
+	"""
+	Returns {slot: current value} read from the IDB for every slot of a plan
+
+	Only reads are made, nothing triggers reanalysis. Unset slots read as '' (names,
+	comments and types) or None (offsets, code and xrefs), auto generated names as ''.
+	A struct type reads as its name when a struct of the same size is at the address.
+	"""
+	if api is None:
+		api = _defaultApi()
+	read = {
+		1: api.Byte,
+		2: api.Word,
+		4: api.Dword,
+	}
+	state = {}
+	flags = {}
+	refs = {}
+
+	def flagsAt(ea):
+		if ea not in flags:
+			flags[ea] = api.GetFlags(ea)
+		return flags[ea]
+
+	def refsFrom(ea, dataRef):
+		#Every code or data reference from an address, walked once per address
+		key = (ea, dataRef)
+		if key not in refs:
+			first, following = (api.Dfirst, api.Dnext) if dataRef else (api.Rfirst0, api.Rnext0)
+			found = set()
+			target = first(ea)
+			while target != api.BADADDR:
+				found.add(target)
+				target = following(ea, target)
+			refs[key] = found
+		return refs[key]
+
+	for slot, (value, (ea, kind, args)) in slots(plan).items():
+		if kind == NAME:
+			current = api.Name(ea) or ''
+			if current.startswith(AUTO_NAME_PREFIXES):
+				current = ''
+		elif kind == COMMENT:
+			current = api.GetCommentEx(ea, 0) or ''
+		elif kind == TYPE:
+			itemFlags = flagsAt(ea)
+			current = ''
+			if api.isStruct(itemFlags):
+				if value in STRUCT_TYPES:
+					sid = api.GetStrucIdByName(value)
+					if sid != api.BADADDR and api.ItemSize(ea) == api.GetStrucSize(sid):
+						current = value
+				if current == '':
+					current = 'struct'
+			elif api.isByte(itemFlags):
+				current = 'byte'
+			elif api.isWord(itemFlags):
+				current = 'word'
+			elif api.isDwrd(itemFlags):
+				current = 'dword'
+		elif kind == PATCH:
+			current = read[args[0]](ea)
+		elif kind == OFFSET:
+			isOffset = api.isOff0 if args[0] == 0 else api.isOff1
+			#The base is not read back, an operand that is an offset already counts as planned
+			current = value if isOffset(flagsAt(ea)) else None
+		elif kind == CODE:
+			current = True if api.isCode(flagsAt(ea)) else None
+		elif kind == SEGREG:
+			current = api.GetReg(ea, args[0])
+		else:
+			current = True if args[0] in refsFrom(ea, bool(args[1])) else None
+		state[slot] = current
+	return state
+
+def reconcilePlan(plan, state, previous=None):
+	"""
+	Returns (plan of the changes to apply, number of slots kept because they were edited by hand)
+
+	state is readState() of plan. A slot is changed when the IDB does not hold the planned
+	value and it is a patch, offset, code flag, xref or segment register, or a name, comment or type that is
+	unset or still holds the value of the previous plan (the annotations applied last time,
+	from the annotation database). Names, comments and types holding anything else were
+	changed by hand and are kept.
+	"""
+	previousSlots = slots(previous) if previous is not None else {}
+	changes = AnnotationPlan()
+	kept = 0
+	for slot, (value, entry) in slots(plan).items():
+		current = state.get(slot)
+		if current == value:
+			continue
+		kind = entry[1]
+		last = previousSlots.get(slot)
+		if kind not in MANUAL_KINDS or current in ('', None) or (last is not None and current == last[0]):
+			changes.entries.append(entry)
+		else:
+			kept = kept + 1
+	return changes, kept
+
+def planRegisters(registers):
+	"""
+	Plans the register annotations labelRegisters() makes from its register dictionary
+	"""
+	plan = AnnotationPlan()
+	#Entries are appended directly, the types and flags are known to be valid
+	add = plan.entries.append
+	for key, value in registers.items():
+		if value['type'] == 'word':
+			add((key, TYPE, _WORD))
+			add((key, PATCH, (2, value['initial'])))
+		else:
+			add((key, TYPE, _BYTE))
+			add((key, PATCH, (1, value['initial'])))
+		add((key, NAME, (value['name'], 'nolist')))
+		add((key, COMMENT, (value['comment'],)))
+	return plan
+
+def planVTEntries(reader, vectorTable, nameAt=None):
+	"""
+	Plans the vector table annotations createVTEntries() makes
+
+	reader provides Dword(). DTC register information blocks are only labeled when
+	nameAt(address) is empty or an unk_ name, like createVTEntries() checks with Name().
+	Without nameAt every block is labeled. A block shared by several vectors is labeled
+	once, by the first of them.
+	"""
+	plan = AnnotationPlan()
+	add = plan.entries.append
+	nameCounter = 0
+	#nameAt() reads the IDB before the plan is applied so it cannot see the blocks planned here
+	planned = set()
+	addr = 0x10000
+
+	while addr < 0x10200:
+		add((addr, TYPE, _DWORD))
+		add((addr, OFFSET, _OFFSET))
+		j = reader.Dword(addr)
+
+		if addr < 0x10140:
+			add((j, CODE, (True,)))
+			add((addr, XREF, (j, False)))
+		else:
+			name = nameAt(j) if nameAt is not None else ''
+			if j in planned:
+				#Block shared with an earlier vector
+				add((addr, XREF, (j, True)))
+			elif name == '' or 'unk_' in name:
+				planned.add(j)
+				add((addr, XREF, (j, True)))
+				for i, (field, comment) in enumerate(h8_analysis.DTC_FIELDS):
+					add((j + i * 2, TYPE, _WORD))
+					add((j + i * 2, NAME, ('DTC_vec_%s_%d' % (field, nameCounter), 'nocheck')))
+					add((j + i * 2, COMMENT, (comment,)))
+				nameCounter = nameCounter + 1
+
+		addr = addr + 4
+
+	#The mirrored vector table at 0x0
+	for addr in range(0x000, 0x200, 4):
+		add((addr, TYPE, _DWORD))
+		add((addr, OFFSET, _OFFSET))
+		if addr in vectorTable:
+			vector = vectorTable[addr]
+			add((addr, NAME, (vector['name'], 'nolist')))
+			add((addr, COMMENT, (vector['comment'],)))
+			add((addr + 0x10000, COMMENT, (vector['comment'],)))
+	return plan
+
+def planMutTable(reader, labelDict, startAddress, endAddress):
+	"""
+	Plans the MUT table annotations createMutTable() makes
+	reader provides Word()
+	"""
+	plan = AnnotationPlan()
+	add = plan.entries.append
+	counter = 0
+	currentAddress = startAddress
+
+	while currentAddress <= endAddress:
+		add((currentAddress, TYPE, _WORD))
+		name = 'MUT_%02X' % counter
+		value = reader.Word(currentAddress)
+		add((currentAddress, NAME, (name, 'check')))
+
+		if (value % 2) != 0:
+			value = value - 1
+			add((value, TYPE, _WORD))
+
+		label = labelDict.get(name)
+		if label is not None:
+			if label[0] != '':
+				add((value, NAME, (label[0], 'check')))
+			if label[1] != '':
+				comment = (label[1],)
+				add((value, COMMENT, comment))
+				add((currentAddress, COMMENT, comment))
+
+		currentAddress = currentAddress + 2
+		counter = counter + 1
+	return plan
+
+def planMaps(structures):
+	"""
+	Plans the struct, name and comment of every axis table and map found by h8_mapscan
+	structures are h8_mapscan.Structure
+	"""
+	plan = AnnotationPlan()
+	for structure in structures:
+		plan.makeType(structure.address, structure.kind)
+		if structure.kind == 'axis_table':
+			plan.name(structure.address, 'axis_%X' % structure.address, 'nocheck')
+			plan.comment(structure.address, '%d breakpoints' % structure.columns)
+		else:
+			plan.name(structure.address, 'map_%X' % structure.address, 'nocheck')
+			plan.comment(structure.address, '%d x %d' % (structure.columns, structure.rows))
+	return plan
+
+def planKnownFunctions(rom, functionStart, signatures=None, matches=()):
+	"""
+	Plans the names and comments labelKnownFunctions() gives the fixed address and signature matched functions
+	functionStart maps an address to the start of the function containing it, see h8_signatures.findFunctions()
+	matches are h8_fingerprint.FunctionMatch results, a fingerprint match replaces the fixed address of a function
+	and names functions no signature found
+	"""
+	plan = AnnotationPlan()
+	fingerprinted = dict((match.name, match) for match in matches)
+	for function in h8_analysis.KNOWN_FUNCTIONS:
+		if function.name in fingerprinted:
+			continue
+		plan.name(function.address, function.name, 'nocheck')
+		plan.comment(function.address, function.comment)
+
+	for signature, foundFunctionAddress, foundCode in h8_signatures.findFunctions(rom, functionStart, signatures):
+		fingerprinted.pop(signature.name, None)
+		plan.name(foundFunctionAddress, signature.name, 'nocheck')
+		plan.comment(foundFunctionAddress, signature.comment)
+
+	for match in sorted(fingerprinted.values(), key=lambda m: m.address):
+		plan.name(match.address, match.name, 'nocheck')
+		plan.comment(match.address, '%s\nFingerprint similarity %.2f' % (match.comment, match.score))
+	return plan
+
+def planPageRegisters(ranges):
+	"""
+	Plans the br and dp values setPageRegisters() sets where they change
+	ranges is h8_pages.PageRegisters.ranges()
+	"""
+	plan = AnnotationPlan()
+	for ea, register, value in ranges:
+		plan.segmentRegister(ea, register, value)
+	return plan
+
+def planKnownVars(found):
+	"""
+	Plans the operand offsets, names and comments labelKnownVars() gives the known variables
+	found is h8_analysis.knownVars()
+	"""
+	plan = AnnotationPlan()
+	for var in found:
+		plan.offset(var['insn'], 0, 0)
+		plan.name(var['value'], var['optionName'], 'nocheck')
+		plan.comment(var['value'], var['comment'])
+		plan.comment(var['insn'], var['comment'])
+		#Variable the option is stored to
+		if var['var'] is not None:
+			plan.name(var['var'], var['varName'], 'nocheck')
+			plan.comment(var['var'], var['comment'])
+	return plan
@@ -0,0 +1,181 @@
+"""
+Annotation database
+
+Stores the annotation plans built by h8_annotations in a single SQLite file indexed by
+address so they can be reapplied to a fresh IDB, or read by headless tools, without
+running discovery again. Each plan is stored under the name of the step that built it
+(registers, vectors, mut_table, functions, ...) together with the SHA-1 of the ROM it was
+built from. Steps built only from the h8_definitions family, like the registers, are stored
+under the family's key (see familyKey()) so ROMs of one family share them and other families
+never pick them up. A step is keyed on its name and that hash or family key, so one file
+holds the plans of every ROM and family exported to it.
+"""
+
+import hashlib
+import sqlite3
+import time
+
+import h8_annotations
+
+SCHEMA_VERSION = 3
+
+#Steps built only from the h8_definitions family, stored under its familyKey() instead of the ROM hash
+FAMILY_STEPS = ('registers',)
+
+#rom is the ROM hash or family key, NULL for steps shared by every ROM, so (name, rom) is kept
+#unique by write() rather than a key
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS steps (
+	name TEXT NOT NULL,
+	rom TEXT,
+	created REAL
+);
+CREATE TABLE IF NOT EXISTS annotations (
+	step TEXT NOT NULL,
+	rom TEXT,
+	ea INTEGER NOT NULL,
+	kind INTEGER NOT NULL,
+	arg0,
+	arg1
+);
+CREATE INDEX IF NOT EXISTS steps_name ON steps (name, rom);
+CREATE INDEX IF NOT EXISTS annotations_ea ON annotations (ea, kind);
+CREATE INDEX IF NOT EXISTS annotations_step ON annotations (step, rom);
+"""
+
+def _romCondition(rom):
+	#Condition and parameters matching the rows of one key or a list of keys, and the rows shared by every ROM
+	keys = list(rom) if isinstance(rom, (list, tuple)) else [rom]
+	return '(rom IS NULL OR rom IN (%s))' % ', '.join('?' * len(keys)), keys
+
+def romHash(rom):
+	"""
+	Returns the SHA-1 hex digest of a RomSpace's dump
+	"""
+	return hashlib.sha1(rom.buffer).hexdigest()
+
+def familyKey(definitions):
+	"""
+	Returns the key steps built from an h8_definitions.Definitions are stored under, 'family:<family>/<chip>'
+	"""
+	return 'family:%s/%s' % (definitions.family, definitions.chip)
+
+class AnnotationDatabase(object):
+	"""
+	SQLite file of annotation plans keyed by step name and ROM hash or family key
+
+	Wherever a rom is taken it is one key or a list of keys, such as the ROM hash and
+	the familyKey() of its family.
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self._db = sqlite3.connect(path)
+		version = self._db.execute('PRAGMA user_version').fetchone()[0]
+		if version == 0:
+			self._db.executescript(_SCHEMA)
+			self._db.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+		elif version != SCHEMA_VERSION:
+			self._db.close()
+			raise ValueError('%s has annotation schema version %d, expected %d' % (path, version, SCHEMA_VERSION))
+
+	def close(self):
+		if self._db is not None:
+			self._db.close()
+			self._db = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def write(self, name, plan, rom=None):
+		"""
+		Stores a plan under a step name, replacing what was stored for that step and ROM
+		rom is the SHA-1 of the ROM the plan was built from (see romHash()), the familyKey() of
+		the definitions it was built from, or None if it applies to any ROM
+		"""
+		rows = []
+		for ea, kind, args in plan:
+			args = tuple(int(a) if isinstance(a, bool) else a for a in args)
+			args = args + (None,) * (2 - len(args))
+			rows.append((name, rom, ea, kind, args[0], args[1]))
+
+		with self._db:
+			#IS matches NULL to NULL for the fleet wide steps
+			self._db.execute('DELETE FROM annotations WHERE step = ? AND rom IS ?', (name, rom))
+			self._db.execute('DELETE FROM steps WHERE name = ? AND rom IS ?', (name, rom))
+			self._db.execute('INSERT INTO steps VALUES (?, ?, ?)', (name, rom, time.time()))
+			self._db.executemany('INSERT INTO annotations VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+	def steps(self, rom=None):
+		"""
+		Returns [(step name, ROM hash, family key or None)] sorted by name
+		When rom is given only the steps stored under those keys and the steps shared by every ROM are listed
+		"""
+		if rom is None:
+			return self._db.execute('SELECT name, rom FROM steps ORDER BY name, rom').fetchall()
+		condition, params = _romCondition(rom)
+		return self._db.execute('SELECT name, rom FROM steps WHERE %s ORDER BY name, rom' % condition,
+			params).fetchall()
+
+	def _plan(self, rows):
+		entries = []
+		for ea, kind, arg0, arg1 in rows:
+			if arg1 is None and kind in (h8_annotations.TYPE, h8_annotations.CODE, h8_annotations.COMMENT):
+				args = (arg0,)
+			else:
+				args = (arg0, arg1)
+			entries.append((ea, kind, args))
+		return h8_annotations.AnnotationPlan(entries)
+
+	def read(self, names=None, rom=None):
+		"""
+		Returns the stored annotations as one AnnotationPlan sorted by address
+
+		names limits the plan to some steps. When rom is given steps stored under other keys
+		are left out, steps shared by every ROM (no key) are always included. Without rom the
+		steps of every ROM and family in the file are read.
+		"""
+		query = 'SELECT ea, kind, arg0, arg1 FROM annotations'
+		conditions = []
+		params = []
+		if names is not None:
+			names = list(names)
+			conditions.append('step IN (%s)' % ', '.join('?' * len(names)))
+			params.extend(names)
+		if rom is not None:
+			condition, keys = _romCondition(rom)
+			conditions.append(condition)
+			params.extend(keys)
+		if conditions:
+			query = query + ' WHERE ' + ' AND '.join(conditions)
+		query = query + ' ORDER BY ea, kind, rowid'
+		return self._plan(self._db.execute(query, params))
+
+	def between(self, start, end, rom=None):
+		"""
+		Returns the annotations at addresses start to end (exclusive) as an AnnotationPlan
+		rom limits them to some keys and the steps shared by every ROM as for read()
+		"""
+		query = 'SELECT ea, kind, arg0, arg1 FROM annotations WHERE ea >= ? AND ea < ?'
+		params = [start, end]
+		if rom is not None:
+			condition, keys = _romCondition(rom)
+			query = query + ' AND ' + condition
+			params.extend(keys)
+		return self._plan(self._db.execute(query + ' ORDER BY ea, kind, rowid', params))
+
+	def names(self, rom=None):
+		"""
+		Returns {address: name} for every name annotation
+		rom limits them to some keys and the steps shared by every ROM as for read()
+		"""
+		query = 'SELECT ea, arg0 FROM annotations WHERE kind = ?'
+		params = [h8_annotations.NAME]
+		if rom is not None:
+			condition, keys = _romCondition(rom)
+			query = query + ' AND ' + condition
+			params.extend(keys)
+		return dict(self._db.execute(query + ' ORDER BY rowid', params))
@@ -0,0 +1,149 @@
+"""
+Runs the annotation steps from h8_ida_disam.py headlessly over a directory of ROM dumps
+
+Usage: python h8_batch.py ROM_DIR OUT_DIR [--jobs N] [--mut-start ADDR] [--mut-end ADDR] [--cache DIR]
+
+Every 0x20000 byte file in ROM_DIR is analysed on a process pool and written to
+OUT_DIR/<file name>.json containing the segments, vector targets, DTC descriptors,
+MUT table and labeled functions. With --cache, pass results are reused between ROMs
+that share the regions a pass reads (see h8_cache.py).
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import h8_analysis
+import h8_cache
+import h8_decoder
+import h8_rom
+
+def findRoms(romDir):
+	"""
+	Returns the path of every file in romDir that is the size of a ROM dump
+	"""
+	paths = []
+	for name in sorted(os.listdir(romDir)):
+		path = os.path.join(romDir, name)
+		if os.path.isfile(path) and os.path.getsize(path) == h8_rom.ROM_SIZE:
+			paths.append(path)
+	return paths
+
+def analyseRom(path, mutStart=h8_analysis.MUT_TABLE_START, mutEnd=h8_analysis.MUT_TABLE_END, cache=None):
+	"""
+	Runs every headless pass over a single ROM and returns the results as a dict
+	If an AnalysisCache is given passes whose input regions are unchanged are not rerun
+	When mutStart is None the MUT table is located with h8_mutlocate
+	"""
+	with h8_rom.RomSpace(path) as rom:
+		hashes = h8_cache.regionHashes(rom, None) if cache is not None else None
+		if mutStart is None:
+			#NumPy is only needed when locating the table
+			import h8_mutlocate
+
+			def locate():
+				return list(h8_mutlocate.mutRange(rom, h8_decoder.disassemble(rom).values))
+			mutStart, mutEnd = locate() if cache is None else cache.run('locate', hashes, locate)
+		if cache is not None:
+			hashes['mut'] = h8_cache.mutHash(rom, mutStart, mutEnd)
+		passes = {
+			'vectors': (lambda: h8_analysis.vectorTargets(rom), ()),
+			'dtc': (lambda: h8_analysis.dtcDescriptors(rom), ()),
+			'mut': (lambda: h8_analysis.mutTable(rom, mutStart, mutEnd), (mutStart, mutEnd)),
+			'functions': (lambda: h8_analysis.knownFunctions(rom), ()),
+		}
+		result = {
+			'rom': os.path.basename(path),
+			'sha1': hashlib.sha1(rom.buffer).hexdigest(),
+			'segments': h8_analysis.segments(),
+			'mutRange': [mutStart, mutEnd],
+		}
+		for name, (function, params) in passes.items():
+			if cache is None:
+				result[name] = function()
+			else:
+				result[name] = cache.run(name, hashes, function, params)
+		return result
+
+#Cache opened once per worker process
+_workerCache = {}
+
+def _worker(job):
+	#Runs in the pool, errors are reported per ROM instead of stopping the batch
+	path, outDir, mutStart, mutEnd, cacheDir, cacheBytes = job
+	cache = None
+	if cacheDir is not None:
+		cache = _workerCache.get(cacheDir)
+		if cache is None:
+			cache = _workerCache[cacheDir] = h8_cache.AnalysisCache(cacheDir, cacheBytes)
+	try:
+		result = analyseRom(path, mutStart, mutEnd, cache)
+	except Exception as e:
+		return path, '%s: %s' % (type(e).__name__, e)
+	with open(os.path.join(outDir, os.path.basename(path) + '.json'), 'w') as f:
+		json.dump(result, f, sort_keys=True)
+	return path, None
+
+def runBatch(paths, outDir, jobs=None, mutStart=h8_analysis.MUT_TABLE_START, mutEnd=h8_analysis.MUT_TABLE_END,
+		cacheDir=None, cacheBytes=256 * 1024 * 1024):
+	"""
+	Analyses every ROM in paths on a pool of jobs processes (one per core by default)
+	Pass results are cached in cacheDir when it is given
+	Returns (number of ROMs analysed, {path: error}, elapsed seconds)
+	"""
+	if not os.path.isdir(outDir):
+		os.makedirs(outDir)
+	if jobs is None:
+		jobs = multiprocessing.cpu_count()
+
+	work = [(path, outDir, mutStart, mutEnd, cacheDir, cacheBytes) for path in paths]
+	errors = {}
+	start = time.time()
+	if jobs == 1:
+		results = map(_worker, work)
+		for path, error in results:
+			if error is not None:
+				errors[path] = error
+	else:
+		pool = multiprocessing.Pool(jobs)
+		try:
+			chunkSize = max(1, len(work) // (jobs * 8))
+			for path, error in pool.imap_unordered(_worker, work, chunkSize):
+				if error is not None:
+					errors[path] = error
+		finally:
+			pool.close()
+			pool.join()
+	return len(paths) - len(errors), errors, time.time() - start
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Annotate a directory of H8/500 ROM dumps headlessly')
+	parser.add_argument('romDir', help='directory containing 0x20000 byte ROM dumps')
+	parser.add_argument('outDir', help='directory to write one JSON result per ROM to')
+	parser.add_argument('--jobs', type=int, default=None, help='worker processes (default: one per core)')
+	parser.add_argument('--mut-start', type=lambda x: int(x, 0), default=h8_analysis.MUT_TABLE_START)
+	parser.add_argument('--mut-end', type=lambda x: int(x, 0), default=h8_analysis.MUT_TABLE_END)
+	parser.add_argument('--locate-mut', action='store_true', help='locate the MUT table in every ROM instead of using --mut-start/--mut-end')
+	parser.add_argument('--cache', default=None, help='directory of the region keyed analysis cache')
+	parser.add_argument('--cache-size', type=int, default=256, help='cache size bound in MiB (default: 256)')
+	args = parser.parse_args(argv)
+
+	paths = findRoms(args.romDir)
+	mutStart = None if args.locate_mut else args.mut_start
+	done, errors, elapsed = runBatch(paths, args.outDir, args.jobs, mutStart, args.mut_end,
+		args.cache, args.cache_size * 1024 * 1024)
+
+	for path in sorted(errors):
+		print('%s failed: %s' % (path, errors[path]), file=sys.stderr)
+	rate = done / elapsed if elapsed > 0 else 0.0
+	print('Analysed %d of %d ROMs in %.2fs (%.1f ROMs/s)' % (done, len(paths), elapsed, rate))
+	return 1 if errors else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Benchmarks the h8_ida_disam.py steps outside IDA
+
+The script is run against h8_mock_ida.MockIda over a fleet of ROMs (synthetic ones from
+h8_synth unless a directory of dumps is given). Each step of the #main sequence is timed
+separately and its IDA API calls are counted. Results can be written as JSON and compared
+against a previous run to catch performance regressions.
+
+	python h8_bench.py [--roms 1000] [--rom-dir DIR] [--json OUT] [--baseline OLD.json] [--tolerance 0.2]
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import h8_analysis
+import h8_batch
+import h8_mock_ida
+import h8_synth
+
+SCRIPT = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'h8_ida_disam.py')
+
+#Steps of the script's #main sequence with their arguments
+PHASES = (
+	('loadFile', ()),
+	('createSegments', ()),
+	('createStructs', ()),
+	('setPageRegisters', ()),
+	('labelRegisters', ()),
+	('createVTEntries', ()),
+	('findMutTable', ()),
+	('createMutTable', (h8_analysis.MUT_TABLE_START, h8_analysis.MUT_TABLE_END)),
+	('labelKnownFunctions', ()),
+	('labelMaps', ()),
+	('labelKnownVars', ()),
+)
+
+def runScript(paths, phases=PHASES, script=SCRIPT, quiet=True):
+	"""
+	Runs the script's steps on every ROM and returns {phase: {'seconds': s, 'calls': {api: n}}}
+	Output printed by the script is discarded when quiet is set
+	"""
+	ida = h8_mock_ida.MockIda()
+	namespace = ida.loadScript(script)
+	results = collections.OrderedDict((name, {'seconds': 0.0, 'calls': collections.Counter()}) for name, args in phases)
+
+	stdout = sys.stdout
+	devnull = open(os.devnull, 'w')
+	try:
+		for path in paths:
+			ida.reset(path)
+			for name, args in phases:
+				ida.clearCounters()
+				if quiet:
+					sys.stdout = devnull
+				started = time.time()
+				try:
+					namespace[name](*args)
+				finally:
+					elapsed = time.time() - started
+					sys.stdout = stdout
+				results[name]['seconds'] += elapsed
+				results[name]['calls'].update(ida.calls)
+	finally:
+		devnull.close()
+
+	for name in results:
+		results[name]['calls'] = dict(results[name]['calls'])
+	return results
+
+def runBenchmark(paths, generateSeconds=None):
+	"""
+	Returns the benchmark report for a list of ROM paths
+	"""
+	started = time.time()
+	phases = runScript(paths)
+	report = {
+		'roms': len(paths),
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'total': time.time() - started,
+		'phases': phases,
+	}
+	if generateSeconds is not None:
+		report['generate'] = generateSeconds
+	return report
+
+def compareReports(report, baseline, tolerance=0.2, floor=0.5):
+	"""
+	Returns [(phase, baseline ms per ROM, ms per ROM)] for the phases more than tolerance slower than the baseline
+	Slowdowns under floor milliseconds per ROM are treated as noise
+	"""
+	regressions = []
+	for name, phase in report['phases'].items():
+		old = baseline['phases'].get(name)
+		if old is None:
+			continue
+		current = phase['seconds'] * 1000.0 / report['roms']
+		previous = old['seconds'] * 1000.0 / baseline['roms']
+		if current > previous * (1 + tolerance) and current - previous > floor:
+			regressions.append((name, previous, current))
+	return regressions
+
+def printReport(report):
+	print('%d ROMs, Python %s' % (report['roms'], report['python']))
+	if 'generate' in report:
+		print('%-22s %10.3fs' % ('generate ROMs', report['generate']))
+	for name, phase in report['phases'].items():
+		calls = sum(phase['calls'].values())
+		print('%-22s %10.3fs %10.3fms/ROM %10d API calls' % (name, phase['seconds'],
+			phase['seconds'] * 1000.0 / max(report['roms'], 1), calls))
+	print('%-22s %10.3fs' % ('total', report['total']))
+
+def main():
+	parser = argparse.ArgumentParser(description='Time the h8_ida_disam.py steps against a mock IDA API')
+	parser.add_argument('--roms', type=int, default=100, help='number of synthetic ROMs to generate')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--rom-dir', help='benchmark the dumps in this directory instead of synthetic ROMs')
+	parser.add_argument('--json', help='write the report to this file')
+	parser.add_argument('--baseline', help='report to compare against')
+	parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown per phase before failing')
+	args = parser.parse_args()
+
+	generateSeconds = None
+	directory = None
+	if args.rom_dir:
+		paths = h8_batch.findRoms(args.rom_dir)
+	else:
+		directory = tempfile.mkdtemp(prefix='h8_bench_')
+		started = time.time()
+		paths = h8_synth.writeFleet(directory, args.roms, args.seed)
+		generateSeconds = time.time() - started
+
+	try:
+		report = runBenchmark(paths, generateSeconds)
+	finally:
+		if directory is not None:
+			shutil.rmtree(directory)
+
+	printReport(report)
+	if args.json:
+		with open(args.json, 'w') as f:
+			json.dump(report, f, indent=1, sort_keys=True)
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+		regressions = compareReports(report, baseline, args.tolerance)
+		for name, previous, current in regressions:
+			print('Regression in %s: %.3fms/ROM -> %.3fms/ROM' % (name, previous, current))
+		if regressions:
+			sys.exit(1)
+
+if __name__ == '__main__':
+	main()
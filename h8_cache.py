@@ -0,0 +1,197 @@
+"""
+On disk analysis cache keyed by hashes of the ROM regions each pass reads
+
+Dumps that share code pages but differ in calibration data reuse results for every
+pass that does not read the changed region. Entries are JSON files named by their key.
+The cache is bounded in size and the least recently used entries are evicted first.
+Several worker processes can share a directory: the size is rescanned from disk before
+evicting and whenever a process has written a tenth of the bound since its last scan.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import h8_analysis
+
+#Bump when the output of a headless pass changes so old entries are ignored
+CACHE_VERSION = 2
+
+#Regions of the address space that are hashed individually
+#The MUT table region depends on the range passed to createMutTable() so it is added per call
+REGIONS = {
+	'vectors': (0x0, 0x200),
+	'page00': (0x0, 0x4000),
+	'page01': (0x10000, 0x20000),
+	'page02': (0x20000, 0x30000),
+}
+
+#Regions read by each headless pass
+PASS_REGIONS = {
+	'vectors': ('vectors',),
+	'dtc': ('vectors', 'page00'),
+	'mut': ('mut',),
+	'functions': ('page00', 'page01', 'page02'),
+	'locate': ('page00', 'page01', 'page02'),
+}
+
+#Suffix of entries still being written
+TEMP_SUFFIX = '.tmp'
+
+def regionHashes(rom, mutStart=h8_analysis.MUT_TABLE_START, mutEnd=h8_analysis.MUT_TABLE_END):
+	"""
+	Returns {region name: sha1 hex digest} for every region of a RomSpace
+	The MUT table region is left out when mutStart is None, add it with mutHash() once it is known
+	"""
+	hashes = {}
+	for name, (start, end) in REGIONS.items():
+		hashes[name] = hashlib.sha1(rom.view(start, end)).hexdigest()
+	if mutStart is not None:
+		hashes['mut'] = mutHash(rom, mutStart, mutEnd)
+	return hashes
+
+def mutHash(rom, mutStart, mutEnd):
+	"""
+	Returns the sha1 hex digest of the MUT table region
+	"""
+	return hashlib.sha1(rom.view(mutStart, mutEnd + 2)).hexdigest()
+
+def passKey(name, hashes, params=()):
+	"""
+	Returns the cache key for a pass given the region hashes of the ROM it runs on
+	"""
+	key = hashlib.sha1()
+	key.update(('%s:%d:%r' % (name, CACHE_VERSION, tuple(params))).encode('ascii'))
+	for region in PASS_REGIONS[name]:
+		key.update(hashes[region].encode('ascii'))
+	return key.hexdigest()
+
+class AnalysisCache(object):
+	"""
+	Size bounded on disk cache with least recently used eviction
+
+	Reads refresh an entry's modification time which is used as its last use time so
+	several processes can share one cache directory.
+	"""
+
+	def __init__(self, directory, maxBytes=256 * 1024 * 1024):
+		self.directory = directory
+		self.maxBytes = maxBytes
+		self.hits = 0
+		self.misses = 0
+		self._written = 0
+		if not os.path.isdir(directory):
+			try:
+				os.makedirs(directory)
+			except OSError:
+				#Another worker created it first
+				if not os.path.isdir(directory):
+					raise
+		self._size = sum(size for path, size, used in self._entries())
+
+	def _path(self, key):
+		return os.path.join(self.directory, key[:2], key + '.json')
+
+	def _entries(self):
+		#Yields (path, size, last use time) for every entry on disk
+		for sub in os.listdir(self.directory):
+			subDir = os.path.join(self.directory, sub)
+			if not os.path.isdir(subDir):
+				continue
+			for name in os.listdir(subDir):
+				#Another worker's entry in flight
+				if name.endswith(TEMP_SUFFIX):
+					continue
+				path = os.path.join(subDir, name)
+				try:
+					stat = os.stat(path)
+				except OSError:
+					continue
+				yield path, stat.st_size, stat.st_mtime
+
+	def get(self, key):
+		"""
+		Returns the cached value for key or None
+		"""
+		path = self._path(key)
+		try:
+			with open(path) as f:
+				value = json.load(f)
+		except (IOError, OSError, ValueError):
+			self.misses = self.misses + 1
+			return None
+		try:
+			os.utime(path, None)
+		except OSError:
+			pass
+		self.hits = self.hits + 1
+		return value
+
+	def put(self, key, value):
+		path = self._path(key)
+		subDir = os.path.dirname(path)
+		if not os.path.isdir(subDir):
+			try:
+				os.makedirs(subDir)
+			except OSError:
+				if not os.path.isdir(subDir):
+					raise
+
+		#Write to a temporary file first so other workers never read a partial entry
+		#An entry that cannot be stored (its directory was evicted by another worker) is a cache miss next time
+		tempPath = None
+		try:
+			handle, tempPath = tempfile.mkstemp(dir=subDir, suffix=TEMP_SUFFIX)
+			with os.fdopen(handle, 'w') as f:
+				json.dump(value, f, sort_keys=True)
+			os.rename(tempPath, path)
+			size = os.path.getsize(path)
+		except OSError:
+			if tempPath is not None:
+				try:
+					os.remove(tempPath)
+				except OSError:
+					pass
+			return
+
+		self._size = self._size + size
+		self._written = self._written + size
+		if self._written > self.maxBytes // 10:
+			#Entries written by other workers count towards the bound too
+			self._size = sum(size for path, size, used in self._entries())
+			self._written = 0
+		if self._size > self.maxBytes:
+			self.evict()
+
+	def evict(self, target=None):
+		"""
+		Removes least recently used entries until the cache is below target bytes
+		Defaults to 90% of maxBytes so eviction does not run on every put. The size is taken
+		from disk so entries of every worker sharing the directory count.
+		"""
+		if target is None:
+			target = int(self.maxBytes * 0.9)
+		entries = sorted(self._entries(), key=lambda e: e[2])
+		size = sum(e[1] for e in entries)
+		for path, entrySize, used in entries:
+			if size <= target:
+				break
+			try:
+				os.remove(path)
+			except OSError:
+				continue
+			size = size - entrySize
+		self._size = size
+		self._written = 0
+
+	def run(self, name, hashes, function, params=()):
+		"""
+		Returns the cached result of a pass or runs function() and caches its result
+		"""
+		key = passKey(name, hashes, params)
+		value = self.get(key)
+		if value is None:
+			value = function()
+			self.put(key, value)
+		return value
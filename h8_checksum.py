@@ -0,0 +1,257 @@
+"""
+ROM checksum verification and correction
+
+The checksum is a 16 bit sum of the big endian words of a range of the address space as
+loadFile() lays it out (10000-2FFFF for the whole dump). A ChecksumSpec describes it:
+
+   start, end   range summed, end exclusive, word aligned
+   stored       address of the word holding the expected sum, left out of the sum,
+                or None when the sum has to equal target
+   target       value the sum has to equal when nothing is stored
+   correction   word fix() adjusts to make the sum equal target when nothing is stored
+
+The layout differs between ECU families. familySpec() reads it from the family's checksum
+entry in h8_definitions.json. Families without one, and the functions here when no spec is
+given, use DEFAULT_SPEC: a plain word sum of the whole dump that has to be 0, corrected
+through its last word. The command line takes a family and overrides for each field.
+
+The sum of a whole image is one NumPy reduction. Checksum keeps the running sum of an
+image being edited and updates it from the bytes a patch changes: a byte at an even
+address adds value << 8 to the sum and one at an odd address adds value.
+
+	python h8_checksum.py ROM_DIR [--jobs N] [--family NAME] [--start A] [--end A]
+		[--stored A|none] [--target V] [--correction A]
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import multiprocessing
+import sys
+
+import numpy
+
+import h8_definitions
+import h8_rom
+
+class ChecksumSpec(collections.namedtuple('ChecksumSpec', 'start end stored target correction')):
+	"""
+	Checksum layout, raises ValueError when the words it names are not word aligned inside the dump
+	"""
+	__slots__ = ()
+
+	def __new__(cls, start, end, stored=None, target=0, correction=None):
+		if start & 1 or end & 1:
+			raise ValueError('Checksum range %X-%X is not word aligned' % (start, end))
+		if not h8_rom.ROM_START <= start < end <= h8_rom.ROM_END:
+			raise ValueError('Checksum range %X-%X is outside the dump' % (start, end))
+		if not 0 <= target <= 0xFFFF:
+			raise ValueError('Checksum target %X is not a word' % target)
+		if stored is None and correction is None:
+			raise ValueError('Checksum needs a stored or a correction word')
+		for name, addr in (('stored', stored), ('correction', correction)):
+			if addr is None:
+				continue
+			if addr & 1:
+				raise ValueError('Checksum %s word %X is not word aligned' % (name, addr))
+			if not h8_rom.ROM_START <= addr < h8_rom.ROM_END:
+				raise ValueError('Checksum %s word %X is outside the dump' % (name, addr))
+		if stored is None and not start <= correction < end:
+			raise ValueError('Checksum correction word %X is outside the range summed' % correction)
+		return super(ChecksumSpec, cls).__new__(cls, start, end, stored, target, correction)
+
+DEFAULT_SPEC = ChecksumSpec(h8_rom.ROM_START, h8_rom.ROM_END, None, 0x0000, h8_rom.ROM_END - 2)
+
+def familySpec(family=None):
+	"""
+	Returns the ChecksumSpec of an ECU family from h8_definitions.json, DEFAULT_SPEC if it has none
+	"""
+	layout = h8_definitions.load(family).checksum
+	if layout is None:
+		return DEFAULT_SPEC
+	return ChecksumSpec(**layout)
+
+#Result of verifying one image, expected is the stored word or the target
+Result = collections.namedtuple('Result', 'sum expected valid')
+
+def _image(data):
+	#uint8 view of a dump given as a RomSpace, bytes, bytearray or NumPy array
+	if isinstance(data, numpy.ndarray):
+		return data
+	if isinstance(data, h8_rom.RomSpace):
+		data = data.buffer
+	return numpy.frombuffer(data, numpy.uint8, h8_rom.ROM_SIZE)
+
+def _offset(addr):
+	if not h8_rom.ROM_START <= addr < h8_rom.ROM_END:
+		raise ValueError('Checksum address %X is outside the dump' % addr)
+	return addr - h8_rom.ROM_START
+
+def _word(image, offset):
+	return (int(image[offset]) << 8) | int(image[offset + 1])
+
+def wordSum(images, spec=DEFAULT_SPEC):
+	"""
+	Returns the checksum of one (size,) image or an array of sums of a stacked (N, size) array of images
+	"""
+	start = _offset(spec.start)
+	end = _offset(spec.end - 1) + 1
+	words = numpy.ascontiguousarray(images[..., start:end]).view('>u2')
+	total = words.sum(axis=-1, dtype=numpy.uint64)
+	if spec.stored is not None and spec.start <= spec.stored < spec.end:
+		stored = (_offset(spec.stored) - start) // 2
+		total = total - words[..., stored].astype(numpy.uint64)
+	return total & 0xFFFF
+
+def expected(image, spec=DEFAULT_SPEC):
+	"""
+	Returns the value the checksum of an image has to equal
+	"""
+	if spec.stored is None:
+		return spec.target
+	return _word(image, _offset(spec.stored))
+
+def verify(data, spec=DEFAULT_SPEC):
+	"""
+	Returns the Result of checking a dump
+	"""
+	image = _image(data)
+	total = int(wordSum(image, spec))
+	want = expected(image, spec)
+	return Result(total, want, total == want)
+
+class Checksum(object):
+	"""
+	Running checksum of an editable image
+
+	patch() writes bytes to the image and updates the sum from the changed bytes only.
+	"""
+
+	def __init__(self, data, spec=DEFAULT_SPEC):
+		self.spec = spec
+		self.image = numpy.array(_image(data), numpy.uint8)
+		self.sum = int(wordSum(self.image, spec))
+
+	@property
+	def expected(self):
+		return expected(self.image, self.spec)
+
+	@property
+	def valid(self):
+		return self.sum == self.expected
+
+	def _delta(self, offset, old, new):
+		#Change of the sum when the bytes at offset change from old to new
+		spec = self.spec
+		start = max(offset, _offset(spec.start))
+		end = min(offset + len(new), _offset(spec.end - 1) + 1)
+		if start >= end:
+			return 0
+		changed = new[start - offset:end - offset].astype(numpy.int64) - old[start - offset:end - offset]
+		offsets = numpy.arange(start, end)
+		weights = numpy.where((offsets & 1) == 0, 0x100, 1)
+		if spec.stored is not None:
+			stored = _offset(spec.stored)
+			weights[(offsets >= stored) & (offsets < stored + 2)] = 0
+		return int((changed * weights).sum())
+
+	def patch(self, addr, values):
+		"""
+		Writes bytes to the image at an address and updates the checksum
+		"""
+		offset = _offset(addr)
+		new = numpy.frombuffer(bytearray(values), numpy.uint8)
+		if offset + len(new) > len(self.image):
+			raise ValueError('Patch at %X runs past the end of the dump' % addr)
+		old = self.image[offset:offset + len(new)].copy()
+		self.image[offset:offset + len(new)] = new
+		self.sum = (self.sum + self._delta(offset, old, new)) & 0xFFFF
+
+	def fix(self):
+		"""
+		Makes the checksum valid by writing the stored word or adjusting the correction word
+		Returns the address written
+		"""
+		spec = self.spec
+		if spec.stored is not None:
+			self.patch(spec.stored, [self.sum >> 8, self.sum & 0xFF])
+			return spec.stored
+		current = _word(self.image, _offset(spec.correction))
+		value = (current + spec.target - self.sum) & 0xFFFF
+		self.patch(spec.correction, [value >> 8, value & 0xFF])
+		return spec.correction
+
+	def tobytes(self):
+		return self.image.tobytes()
+
+def _verifyPath(job):
+	path, spec = job
+	try:
+		with h8_rom.RomSpace(path) as rom:
+			return path, verify(rom, spec), None
+	except (IOError, OSError, ValueError) as e:
+		return path, None, '%s: %s' % (type(e).__name__, e)
+
+def verifyMany(paths, spec=DEFAULT_SPEC, jobs=None):
+	"""
+	Verifies every dump in paths on a pool of jobs processes (one per core by default)
+	Returns ({path: Result}, {path: error})
+	"""
+	if jobs is None:
+		jobs = multiprocessing.cpu_count()
+	work = [(path, spec) for path in paths]
+	results = {}
+	errors = {}
+	if jobs == 1:
+		found = map(_verifyPath, work)
+	else:
+		pool = multiprocessing.Pool(jobs)
+		try:
+			found = list(pool.imap_unordered(_verifyPath, work, max(1, len(work) // (jobs * 8))))
+		finally:
+			pool.close()
+			pool.join()
+	for path, result, error in found:
+		if error is not None:
+			errors[path] = error
+		else:
+			results[path] = result
+	return results, errors
+
+def main(argv=None):
+	#Imported here, h8_batch is only needed to list the dumps
+	import h8_batch
+
+	parser = argparse.ArgumentParser(description='Verify the checksum of a directory of ROM dumps')
+	parser.add_argument('romDir')
+	parser.add_argument('--jobs', type=int, default=None, help='worker processes (default: one per core)')
+	parser.add_argument('--family', default=None, help='ECU family whose checksum layout is used (default: the default family)')
+	address = lambda x: None if x.lower() == 'none' else int(x, 16)
+	for field, text in (('start', 'first address summed'), ('end', 'address after the last one summed'),
+			('stored', 'address of the stored checksum word, none for a sum that has to equal the target'),
+			('target', 'value the sum has to equal'), ('correction', 'word fix() adjusts')):
+		parser.add_argument('--' + field, type=(lambda x: int(x, 16)) if field == 'target' else address,
+			default=argparse.SUPPRESS, help='%s in hex' % text)
+	args = parser.parse_args(argv)
+
+	try:
+		spec = familySpec(args.family)
+		spec = ChecksumSpec(**dict((field, getattr(args, field, getattr(spec, field))) for field in spec._fields))
+	except ValueError as e:
+		parser.error(str(e))
+	paths = h8_batch.findRoms(args.romDir)
+	results, errors = verifyMany(paths, spec, args.jobs)
+	bad = 0
+	for path in sorted(results):
+		result = results[path]
+		if not result.valid:
+			bad = bad + 1
+			print('%s: checksum %04X, expected %04X' % (path, result.sum, result.expected))
+	for path in sorted(errors):
+		print('%s failed: %s' % (path, errors[path]), file=sys.stderr)
+	print('%d of %d ROMs valid' % (len(results) - bad, len(paths)))
+	return 1 if bad or errors else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
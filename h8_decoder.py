@@ -0,0 +1,754 @@
+"""
+Table driven H8/500 instruction decoder and recursive descent disassembler
+
+Instructions are decoded through two precomputed 256 entry dispatch tables. The first is
+indexed by the first byte of an instruction. Its general format entries decode an effective
+address prefix (register, @-Rn, @Rn+, @(d,Rn), @aa:8, @aa:16, #xx) and then dispatch the
+following operation byte through the second table, e.g.
+   BF 90          mov:g.w r0, @-sp
+   0C 07 00 48    orc.w   #0x700, sr
+   15 FE 97 D0    bclr.b  #0, @0xFE97
+   F8 FE A0 80    mov:g.w @(0xFEA0,r0), r0
+   D4 48          bset.b  r0, @r4
+
+ORC, ANDC and XORC only take an immediate source, the same operation bytes after any
+other prefix are BSET, BCLR and BNOT with the bit number in a register (BTST uses the 78
+row CMP leaves free). Those instructions have imm BIT_REGISTER and the register in reg.
+
+disassemble() runs a worklist based recursive descent seeded from the vector table entries
+below 0x10140 and the known functions in h8_analysis.KNOWN_FUNCTIONS.
+"""
+
+import bisect
+import collections
+
+import h8_analysis
+import h8_rom
+
+#Decoded instruction
+#   opsize  1 for byte, 2 for word, 0 when the instruction has no operand size
+#   ea      effective address mode (EA_*), eareg is its register
+#   value   displacement, absolute address or immediate of the effective address
+#   reg     register, control register or bit number of the second operand
+#   imm     extra immediate, BIT_REGISTER when reg is the register holding a bit number (#xx:8/16 of MOV:G/CMP:G, MOV:E/MOV:I, ADD:Q, LDM/STM list, ...)
+#   access  how the effective address is accessed (ACCESS_*)
+#   flow    how execution continues (FLOW_*), target is the branch or call target
+Insn = collections.namedtuple('Insn', 'address size mnemonic opsize ea eareg value reg imm access flow target')
+
+#imm of bit operations taking the bit number from a register
+BIT_REGISTER = -1
+
+EA_NONE = 0
+EA_REG = 1
+EA_IND = 2
+EA_PREDEC = 3
+EA_POSTINC = 4
+EA_DISP = 5
+EA_ABS8 = 6
+EA_ABS16 = 7
+EA_IMM = 8
+
+ACCESS_NONE = 0
+ACCESS_READ = 1
+ACCESS_WRITE = 2
+ACCESS_RMW = 3
+
+FLOW_NORMAL = 0
+#Conditional branch, falls through to the next instruction
+FLOW_BRANCH = 1
+FLOW_JUMP = 2
+FLOW_CALL = 3
+FLOW_RETURN = 4
+FLOW_INDIRECT_JUMP = 5
+FLOW_INDIRECT_CALL = 6
+FLOW_INVALID = 7
+
+REGISTER_NAMES = ('r0', 'r1', 'r2', 'r3', 'r4', 'r5', 'fp', 'sp')
+CONTROL_REGISTERS = {0: 'sr', 1: 'ccr', 3: 'br', 4: 'ep', 5: 'dp', 7: 'tp'}
+CONDITIONS = ('bra', 'brn', 'bhi', 'bls', 'bcc', 'bcs', 'bne', 'beq',
+	'bvc', 'bvs', 'bpl', 'bmi', 'bge', 'blt', 'bgt', 'ble')
+
+def _signed8(value):
+	return value - 0x100 if value & 0x80 else value
+
+def _signed16(value):
+	return value - 0x10000 if value & 0x8000 else value
+
+def _pageTarget(addr, offset):
+	#Branches wrap within the 64K page they are in
+	return (addr & 0xFF0000) | (offset & 0xFFFF)
+
+def _invalid(data, off, addr, b):
+	return Insn(addr, 1, '.byte', 0, EA_NONE, 0, b, 0, 0, ACCESS_NONE, FLOW_INVALID, None)
+
+#First byte handlers
+#Each takes (data, offset of the instruction in data, address, first byte) and returns an Insn
+
+def _fixed(mnemonic, flow):
+	def handler(data, off, addr, b):
+		return Insn(addr, 1, mnemonic, 0, EA_NONE, 0, 0, 0, 0, ACCESS_NONE, flow, None)
+	return handler
+
+def _fixedImm(mnemonic, immSize, flow):
+	def handler(data, off, addr, b):
+		if immSize == 1:
+			imm = data[off + 1]
+		else:
+			imm = (data[off + 1] << 8) | data[off + 2]
+		return Insn(addr, 1 + immSize, mnemonic, immSize, EA_NONE, 0, 0, 0, imm, ACCESS_NONE, flow, None)
+	return handler
+
+def _bcc8(data, off, addr, b):
+	target = _pageTarget(addr, addr + 2 + _signed8(data[off + 1]))
+	if b == 0x20:
+		return Insn(addr, 2, 'bra', 0, EA_NONE, 0, 0, 0, 0, ACCESS_NONE, FLOW_JUMP, target)
+	if b == 0x21:
+		return Insn(addr, 2, 'brn', 0, EA_NONE, 0, 0, 0, 0, ACCESS_NONE, FLOW_NORMAL, target)
+	return Insn(addr, 2, CONDITIONS[b & 0xF], 0, EA_NONE, 0, 0, 0, 0, ACCESS_NONE, FLOW_BRANCH, target)
+
+def _bcc16(data, off, addr, b):
+	target = _pageTarget(addr, addr + 3 + _signed16((data[off + 1] << 8) | data[off + 2]))
+	if b == 0x30:
+		return Insn(addr, 3, 'bra', 0, EA_NONE, 0, 0, 0, 0, ACCESS_NONE, FLOW_JUMP, target)
+	if b == 0x31:
+		return Insn(addr, 3, 'brn', 0, EA_NONE, 0, 0, 0, 0, ACCESS_NONE, FLOW_NORMAL, target)
+	return Insn(addr, 3, CONDITIONS[b & 0xF], 0, EA_NONE, 0, 0, 0, 0, ACCESS_NONE, FLOW_BRANCH, target)
+
+def _bsr8(data, off, addr, b):
+	target = _pageTarget(addr, addr + 2 + _signed8(data[off + 1]))
+	return Insn(addr, 2, 'bsr', 0, EA_NONE, 0, 0, 0, 0, ACCESS_NONE, FLOW_CALL, target)
+
+def _bsr16(data, off, addr, b):
+	target = _pageTarget(addr, addr + 3 + _signed16((data[off + 1] << 8) | data[off + 2]))
+	return Insn(addr, 3, 'bsr', 0, EA_NONE, 0, 0, 0, 0, ACCESS_NONE, FLOW_CALL, target)
+
+def _absolute16(mnemonic, flow):
+	def handler(data, off, addr, b):
+		target = (addr & 0xFF0000) | (data[off + 1] << 8) | data[off + 2]
+		return Insn(addr, 3, mnemonic, 0, EA_NONE, 0, 0, 0, 0, ACCESS_NONE, flow, target)
+	return handler
+
+def _absolute24(mnemonic, flow):
+	def handler(data, off, addr, b):
+		target = (data[off + 1] << 16) | (data[off + 2] << 8) | data[off + 3]
+		return Insn(addr, 4, mnemonic, 0, EA_NONE, 0, 0, 0, 0, ACCESS_NONE, flow, target)
+	return handler
+
+def _scb(mnemonic):
+	#SCB/cc Rn, disp: 01/06/07 B8+r d8
+	def handler(data, off, addr, b):
+		second = data[off + 1]
+		if second & 0xF8 != 0xB8:
+			return _invalid(data, off, addr, b)
+		target = _pageTarget(addr, addr + 3 + _signed8(data[off + 2]))
+		return Insn(addr, 3, mnemonic, 2, EA_NONE, 0, 0, second & 7, 0, ACCESS_NONE, FLOW_BRANCH, target)
+	return handler
+
+def _trapa(data, off, addr, b):
+	second = data[off + 1]
+	if second & 0xF0 != 0x10:
+		return _invalid(data, off, addr, b)
+	return Insn(addr, 2, 'trapa', 0, EA_NONE, 0, 0, 0, second & 0xF, ACCESS_NONE, FLOW_INDIRECT_CALL, None)
+
+def _group11(data, off, addr, b):
+	#Register indirect jumps and calls plus page returns
+	second = data[off + 1]
+	if second == 0x19:
+		return Insn(addr, 2, 'prts', 0, EA_NONE, 0, 0, 0, 0, ACCESS_NONE, FLOW_RETURN, None)
+	if second == 0x14:
+		return Insn(addr, 3, 'prtd', 1, EA_NONE, 0, 0, 0, data[off + 2], ACCESS_NONE, FLOW_RETURN, None)
+	if second == 0x1C:
+		return Insn(addr, 4, 'prtd', 2, EA_NONE, 0, 0, 0, (data[off + 2] << 8) | data[off + 3], ACCESS_NONE, FLOW_RETURN, None)
+	mode = second & 0xF0
+	reg = second & 7
+	call = second & 8
+	if mode == 0xC0:
+		mnemonic = 'pjsr' if call else 'pjmp'
+		return Insn(addr, 2, mnemonic, 0, EA_IND, reg, 0, 0, 0, ACCESS_NONE,
+			FLOW_INDIRECT_CALL if call else FLOW_INDIRECT_JUMP, None)
+	mnemonic = 'jsr' if call else 'jmp'
+	flow = FLOW_INDIRECT_CALL if call else FLOW_INDIRECT_JUMP
+	if mode == 0xD0:
+		return Insn(addr, 2, mnemonic, 0, EA_IND, reg, 0, 0, 0, ACCESS_NONE, flow, None)
+	if mode == 0xE0:
+		return Insn(addr, 3, mnemonic, 0, EA_DISP, reg, _signed8(data[off + 2]), 0, 0, ACCESS_NONE, flow, None)
+	if mode == 0xF0:
+		return Insn(addr, 4, mnemonic, 0, EA_DISP, reg, (data[off + 2] << 8) | data[off + 3], 0, 0, ACCESS_NONE, flow, None)
+	return _invalid(data, off, addr, b)
+
+def _short(mnemonic, opsize, ea, access):
+	#Short formats with the register in the low three bits of the first byte
+	def handler(data, off, addr, b):
+		reg = b & 7
+		if ea == EA_NONE:
+			if opsize == 1:
+				return Insn(addr, 2, mnemonic, 1, EA_NONE, 0, 0, reg, data[off + 1], ACCESS_NONE, FLOW_NORMAL, None)
+			return Insn(addr, 3, mnemonic, 2, EA_NONE, 0, 0, reg, (data[off + 1] << 8) | data[off + 2], ACCESS_NONE, FLOW_NORMAL, None)
+		if ea == EA_ABS8:
+			return Insn(addr, 2, mnemonic, opsize, EA_ABS8, 0, data[off + 1], reg, 0, access, FLOW_NORMAL, None)
+		#@(d:8,FP)
+		return Insn(addr, 2, mnemonic, opsize, EA_DISP, 6, _signed8(data[off + 1]), reg, 0, access, FLOW_NORMAL, None)
+	return handler
+
+#Operation byte table for the general format
+#Each entry is (mnemonic, reg, extra immediate size, access, kind) or None if invalid
+#reg is None when the second operand is the extra immediate instead of a register
+OP_NORMAL = 0
+OP_PREFIX = 1
+OP_CONTROL = 2
+#ADD:Q, reg holds the constant
+OP_QUICK = 3
+#Bit operation, reg holds the register with the bit number
+OP_BIT_REGISTER = 4
+
+def _buildOpTable():
+	table = [None] * 256
+	table[0x00] = ('', 0, 0, ACCESS_NONE, OP_PREFIX)
+	table[0x04] = ('cmp:g', None, 1, ACCESS_READ, OP_NORMAL)
+	table[0x05] = ('cmp:g', None, 2, ACCESS_READ, OP_NORMAL)
+	table[0x06] = ('mov:g', None, 1, ACCESS_WRITE, OP_NORMAL)
+	table[0x07] = ('mov:g', None, 2, ACCESS_WRITE, OP_NORMAL)
+	for op, imm in ((0x08, 1), (0x09, 2), (0x0C, -1), (0x0D, -2)):
+		table[op] = ('add:q', imm, 0, ACCESS_RMW, OP_QUICK)
+
+	single = ('swap', 'exts', 'extu', 'clr', 'neg', 'not', 'tst', 'tas',
+		'shal', 'shar', 'shll', 'shlr', 'rotl', 'rotr', 'rotxl', 'rotxr')
+	for i, mnemonic in enumerate(single):
+		access = ACCESS_RMW
+		if mnemonic == 'clr':
+			access = ACCESS_WRITE
+		elif mnemonic == 'tst':
+			access = ACCESS_READ
+		table[0x10 + i] = (mnemonic, 0, 0, access, OP_NORMAL)
+
+	pairs = (
+		(0x20, 'add:g', ACCESS_READ), (0x28, 'adds', ACCESS_READ),
+		(0x30, 'sub', ACCESS_READ), (0x38, 'subs', ACCESS_READ),
+		(0x40, 'or', ACCESS_READ), (0x50, 'and', ACCESS_READ),
+		(0x60, 'xor', ACCESS_READ), (0x70, 'cmp:g', ACCESS_READ),
+		(0x80, 'mov:g', ACCESS_READ), (0x90, 'mov:g', ACCESS_WRITE),
+		(0xA0, 'addx', ACCESS_READ), (0xA8, 'mulxu', ACCESS_READ),
+		(0xB0, 'subx', ACCESS_READ), (0xB8, 'divxu', ACCESS_READ),
+	)
+	for base, mnemonic, access in pairs:
+		for reg in range(8):
+			table[base + reg] = (mnemonic, reg, 0, access, OP_NORMAL)
+
+	control = ((0x48, 'orc', ACCESS_READ), (0x58, 'andc', ACCESS_READ), (0x68, 'xorc', ACCESS_READ),
+		(0x88, 'ldc', ACCESS_READ), (0x98, 'stc', ACCESS_WRITE))
+	for base, mnemonic, access in control:
+		for reg in CONTROL_REGISTERS:
+			table[base + reg] = (mnemonic, reg, 0, access, OP_CONTROL)
+
+	bits = ((0xC0, 'bset', ACCESS_RMW), (0xD0, 'bclr', ACCESS_RMW), (0xE0, 'bnot', ACCESS_RMW), (0xF0, 'btst', ACCESS_READ))
+	for base, mnemonic, access in bits:
+		for bit in range(16):
+			table[base + bit] = (mnemonic, bit, 0, access, OP_NORMAL)
+	return table
+
+OP_TABLE = _buildOpTable()
+
+def _buildRegisterBitTable():
+	#Operation bytes after a prefix other than #xx
+	table = list(OP_TABLE)
+	bits = ((0x48, 'bset', ACCESS_RMW), (0x58, 'bclr', ACCESS_RMW), (0x68, 'bnot', ACCESS_RMW), (0x78, 'btst', ACCESS_READ))
+	for base, mnemonic, access in bits:
+		for reg in range(8):
+			table[base + reg] = (mnemonic, reg, 0, access, OP_BIT_REGISTER)
+	return table
+
+EA_OP_TABLE = _buildRegisterBitTable()
+
+#Operation byte after the 00 prefix
+PREFIX_TABLE = [None] * 256
+for _reg in range(8):
+	PREFIX_TABLE[0x80 + _reg] = ('movfpe', _reg, 0, ACCESS_READ, OP_NORMAL)
+	PREFIX_TABLE[0x90 + _reg] = ('movtpe', _reg, 0, ACCESS_WRITE, OP_NORMAL)
+
+def _general(ea, opsize, eareg, extension):
+	#General format: effective address prefix followed by an operation byte
+	opTable = OP_TABLE if ea == EA_IMM else EA_OP_TABLE
+
+	def handler(data, off, addr, b):
+		if extension == 0:
+			value = 0
+		elif extension == 1:
+			value = data[off + 1]
+			if ea == EA_DISP:
+				value = _signed8(value)
+		else:
+			value = (data[off + 1] << 8) | data[off + 2]
+
+		p = off + 1 + extension
+		entry = opTable[data[p]]
+		size = 2 + extension
+		if entry is None:
+			return _invalid(data, off, addr, b)
+		mnemonic, reg, immSize, access, kind = entry
+		if kind == OP_PREFIX:
+			entry = PREFIX_TABLE[data[p + 1]]
+			if entry is None:
+				return _invalid(data, off, addr, b)
+			mnemonic, reg, immSize, access, kind = entry
+			size = size + 1
+			p = p + 1
+
+		imm = 0
+		if immSize == 1:
+			imm = data[p + 1]
+			size = size + 1
+		elif immSize == 2:
+			imm = (data[p + 1] << 8) | data[p + 2]
+			size = size + 2
+		elif kind == OP_QUICK:
+			imm = reg
+			reg = None
+		elif kind == OP_BIT_REGISTER:
+			imm = BIT_REGISTER
+		if ea == EA_IMM and access != ACCESS_READ:
+			return _invalid(data, off, addr, b)
+		return Insn(addr, size, mnemonic, opsize, ea, eareg, value, reg, imm, access, FLOW_NORMAL, None)
+	return handler
+
+def _buildFirstTable():
+	table = [_invalid] * 256
+	table[0x00] = _fixed('nop', FLOW_NORMAL)
+	table[0x01] = _scb('scb/f')
+	table[0x02] = _fixedImm('ldm', 1, FLOW_NORMAL)
+	table[0x03] = _absolute24('pjsr', FLOW_CALL)
+	table[0x06] = _scb('scb/ne')
+	table[0x07] = _scb('scb/eq')
+	table[0x08] = _trapa
+	table[0x09] = _fixed('trap/vs', FLOW_NORMAL)
+	table[0x0A] = _fixed('rte', FLOW_RETURN)
+	table[0x0E] = _bsr8
+	table[0x0F] = _fixed('unlk', FLOW_NORMAL)
+	table[0x10] = _absolute16('jmp', FLOW_JUMP)
+	table[0x11] = _group11
+	table[0x12] = _fixedImm('stm', 1, FLOW_NORMAL)
+	table[0x13] = _absolute24('pjmp', FLOW_JUMP)
+	table[0x14] = _fixedImm('rtd', 1, FLOW_RETURN)
+	table[0x17] = _fixedImm('link', 1, FLOW_NORMAL)
+	table[0x18] = _absolute16('jsr', FLOW_CALL)
+	table[0x19] = _fixed('rts', FLOW_RETURN)
+	table[0x1A] = _fixed('sleep', FLOW_NORMAL)
+	table[0x1C] = _fixedImm('rtd', 2, FLOW_RETURN)
+	table[0x1E] = _bsr16
+	table[0x1F] = _fixedImm('link', 2, FLOW_NORMAL)
+
+	#Effective address prefixes
+	table[0x04] = _general(EA_IMM, 1, 0, 1)
+	table[0x0C] = _general(EA_IMM, 2, 0, 2)
+	table[0x05] = _general(EA_ABS8, 1, 0, 1)
+	table[0x0D] = _general(EA_ABS8, 2, 0, 1)
+	table[0x15] = _general(EA_ABS16, 1, 0, 2)
+	table[0x1D] = _general(EA_ABS16, 2, 0, 2)
+	for base, ea, extension in ((0xA0, EA_REG, 0), (0xB0, EA_PREDEC, 0), (0xC0, EA_POSTINC, 0),
+			(0xD0, EA_IND, 0), (0xE0, EA_DISP, 1), (0xF0, EA_DISP, 2)):
+		for i in range(16):
+			table[base + i] = _general(ea, 2 if i & 8 else 1, i & 7, extension)
+
+	for i in range(16):
+		table[0x20 + i] = _bcc8
+		table[0x30 + i] = _bcc16
+
+	for i in range(8):
+		table[0x40 + i] = _short('cmp:e', 1, EA_NONE, ACCESS_NONE)
+		table[0x48 + i] = _short('cmp:i', 2, EA_NONE, ACCESS_NONE)
+		table[0x50 + i] = _short('mov:e', 1, EA_NONE, ACCESS_NONE)
+		table[0x58 + i] = _short('mov:i', 2, EA_NONE, ACCESS_NONE)
+		table[0x60 + i] = _short('mov:l', 1, EA_ABS8, ACCESS_READ)
+		table[0x68 + i] = _short('mov:l', 2, EA_ABS8, ACCESS_READ)
+		table[0x70 + i] = _short('mov:s', 1, EA_ABS8, ACCESS_WRITE)
+		table[0x78 + i] = _short('mov:s', 2, EA_ABS8, ACCESS_WRITE)
+		table[0x80 + i] = _short('mov:f', 1, EA_DISP, ACCESS_READ)
+		table[0x88 + i] = _short('mov:f', 2, EA_DISP, ACCESS_READ)
+		table[0x90 + i] = _short('mov:f', 1, EA_DISP, ACCESS_WRITE)
+		table[0x98 + i] = _short('mov:f', 2, EA_DISP, ACCESS_WRITE)
+	return table
+
+FIRST_TABLE = _buildFirstTable()
+
+def decode(data, off, addr):
+	"""
+	Decodes the instruction at offset off of data (a bytearray) which lives at address addr
+	"""
+	try:
+		b = data[off]
+		return FIRST_TABLE[b](data, off, addr, b)
+	except IndexError:
+		return _invalid(data, off, addr, 0)
+
+#Short format instructions whose imm is an operand value
+IMMEDIATE_MNEMONICS = frozenset(('mov:e', 'mov:i', 'cmp:e', 'cmp:i'))
+
+#Single operand instructions
+OP_SINGLE = frozenset(('swap', 'exts', 'extu', 'clr', 'neg', 'not', 'tst', 'tas',
+	'shal', 'shar', 'shll', 'shlr', 'rotl', 'rotr', 'rotxl', 'rotxr'))
+
+def _formatEa(insn):
+	ea = insn.ea
+	reg = REGISTER_NAMES[insn.eareg]
+	if ea == EA_REG:
+		return reg
+	if ea == EA_IND:
+		return '@%s' % reg
+	if ea == EA_PREDEC:
+		return '@-%s' % reg
+	if ea == EA_POSTINC:
+		return '@%s+' % reg
+	if ea == EA_DISP:
+		return '@(0x%X,%s)' % (insn.value, reg) if insn.value >= 0 else '@(-0x%X,%s)' % (-insn.value, reg)
+	if ea in (EA_ABS8, EA_ABS16):
+		return '@0x%X' % insn.value
+	if ea == EA_IMM:
+		return '#0x%X' % insn.value
+	return ''
+
+def formatInsn(insn):
+	"""
+	Returns a readable version of an instruction
+	"""
+	mnemonic = insn.mnemonic
+	if insn.opsize and insn.ea != EA_NONE:
+		mnemonic = mnemonic + ('.b' if insn.opsize == 1 else '.w')
+	if insn.flow == FLOW_INVALID:
+		return '.byte 0x%02X' % insn.value
+	if insn.target is not None:
+		if mnemonic.startswith('scb'):
+			return '%s %s, 0x%X' % (mnemonic, REGISTER_NAMES[insn.reg], insn.target)
+		return '%s 0x%X' % (mnemonic, insn.target)
+
+	ea = _formatEa(insn)
+	name = insn.mnemonic
+	if insn.reg is None:
+		if name == 'add:q':
+			return '%s #%d, %s' % (mnemonic, insn.imm, ea)
+		return '%s #0x%X, %s' % (mnemonic, insn.imm, ea)
+	reg = REGISTER_NAMES[insn.reg]
+	if name in ('mov:e', 'mov:i', 'cmp:e', 'cmp:i'):
+		return '%s #0x%X, %s' % (mnemonic, insn.imm, reg)
+	if name in ('ldm', 'stm', 'rtd', 'prtd', 'link', 'trapa'):
+		return '%s #0x%X' % (mnemonic, insn.imm)
+	if not ea:
+		return mnemonic
+	if name in ('orc', 'andc', 'xorc', 'ldc'):
+		return '%s %s, %s' % (mnemonic, ea, CONTROL_REGISTERS[insn.reg])
+	if name == 'stc':
+		return '%s %s, %s' % (mnemonic, CONTROL_REGISTERS[insn.reg], ea)
+	if name in ('bset', 'bclr', 'bnot', 'btst') and insn.imm == BIT_REGISTER:
+		return '%s %s, %s' % (mnemonic, reg, ea)
+	if name in ('bset', 'bclr', 'bnot', 'btst'):
+		return '%s #%d, %s' % (mnemonic, insn.reg, ea)
+	if insn.flow in (FLOW_INDIRECT_JUMP, FLOW_INDIRECT_CALL) or name in OP_SINGLE:
+		return '%s %s' % (mnemonic, ea)
+	if insn.access == ACCESS_WRITE:
+		return '%s %s, %s' % (mnemonic, reg, ea)
+	return '%s %s, %s' % (mnemonic, ea, reg)
+
+Block = collections.namedtuple('Block', 'start end insns successors')
+
+def vectorSeeds(rom):
+	"""
+	Returns the code addresses in the vector table entries below 0x10140
+	"""
+	seeds = []
+	for addr in range(h8_analysis.VECTOR_TABLE_START, h8_analysis.DTC_VECTORS_START, 4):
+		target = rom.Dword(addr)
+		#Unused vectors are blank or point back into the vector table
+		if target >= 0x200 and rom.isMapped(target):
+			seeds.append(target)
+	return seeds
+
+class Disassembly(object):
+	"""
+	Result of a recursive descent disassembly
+
+	insns maps address to Insn, functions is the set of function entry points and
+	blockStarts the set of addresses that start a basic block.
+
+	An operand index is built while decoding. values maps every immediate and 16 bit
+	displacement to the instructions using it and memory maps every absolute memory
+	operand to (instruction address, ACCESS_*). Absolute operands are resolved with the
+	br and dp values given, which default to what createSegments() sets in IDA, or with
+	the per instruction values setPages() gives them.
+	"""
+
+	def __init__(self, rom, br=0x0, dp=0x0):
+		self.rom = rom
+		self.br = br
+		self.dp = dp
+		self.insns = {}
+		self.functions = set()
+		self.blockStarts = set()
+		self.values = {}
+		self.memory = {}
+		self.pages = {}
+		self._blocks = None
+		self._blockAddresses = None
+		self._owners = None
+		self._memoryAddresses = None
+
+	def _data(self):
+		#One copy of the ROM as a bytearray makes byte indexing cheap in both Python 2 and 3
+		return bytearray(self.rom.buffer)
+
+	def run(self, seeds, functions=True):
+		"""
+		Disassembles everything reachable from seeds
+		Seeds are treated as function entry points when functions is True
+		"""
+		data = self._data()
+		insns = self.insns
+		blockStarts = self.blockStarts
+		calls = self.functions
+		romStart = h8_rom.ROM_START
+		romEnd = h8_rom.ROM_END
+		mirrorEnd = h8_rom.MIRROR_END
+		table = FIRST_TABLE
+		values = self.values
+		memory = self.memory
+		dpPage = self.dp << 16
+		brPage = self.br << 8
+		self._memoryAddresses = None
+
+		work = list(seeds)
+		blockStarts.update(work)
+		if functions:
+			calls.update(work)
+		self._blocks = None
+
+		while work:
+			addr = work.pop()
+			while addr not in insns:
+				if romStart <= addr < romEnd:
+					off = addr - romStart
+				elif 0 <= addr < mirrorEnd:
+					off = addr
+				else:
+					break
+				try:
+					b = data[off]
+					insn = table[b](data, off, addr, b)
+				except IndexError:
+					insn = _invalid(data, off, addr, 0)
+				if addr < mirrorEnd and addr + insn.size > mirrorEnd:
+					insn = _invalid(data, off, addr, data[off])
+				insns[addr] = insn
+
+				#Operand index
+				ea = insn.ea
+				if ea == EA_ABS16:
+					memoryAddress = (dpPage | insn.value)
+					if memoryAddress in memory:
+						memory[memoryAddress].append((addr, insn.access))
+					else:
+						memory[memoryAddress] = [(addr, insn.access)]
+				elif ea == EA_ABS8:
+					memoryAddress = (brPage | insn.value)
+					if memoryAddress in memory:
+						memory[memoryAddress].append((addr, insn.access))
+					else:
+						memory[memoryAddress] = [(addr, insn.access)]
+				elif ea == EA_IMM or ea == EA_DISP and insn.value > 0xFF:
+					values.setdefault(insn.value, []).append(addr)
+				if insn.reg is None or insn.mnemonic in IMMEDIATE_MNEMONICS:
+					values.setdefault(insn.imm, []).append(addr)
+
+				flow = insn.flow
+				nextAddr = addr + insn.size
+				if flow == FLOW_NORMAL or flow == FLOW_INDIRECT_CALL:
+					addr = nextAddr
+				elif flow == FLOW_BRANCH:
+					work.append(insn.target)
+					blockStarts.add(insn.target)
+					blockStarts.add(nextAddr)
+					addr = nextAddr
+				elif flow == FLOW_CALL:
+					target = insn.target
+					if target not in calls:
+						calls.add(target)
+						blockStarts.add(target)
+						work.append(target)
+					addr = nextAddr
+				elif flow == FLOW_JUMP:
+					work.append(insn.target)
+					blockStarts.add(insn.target)
+					break
+				else:
+					break
+		return self
+
+	def blocks(self):
+		"""
+		Returns {start: Block} for every basic block
+		"""
+		if self._blocks is not None:
+			return self._blocks
+		insns = self.insns
+		starts = self.blockStarts
+		blocks = {}
+		for start in sorted(a for a in starts if a in insns):
+			addrs = []
+			addr = start
+			successors = ()
+			while True:
+				insn = insns.get(addr)
+				if insn is None:
+					break
+				addrs.append(addr)
+				flow = insn.flow
+				nextAddr = addr + insn.size
+				if flow == FLOW_BRANCH:
+					successors = (insn.target, nextAddr)
+					break
+				if flow == FLOW_JUMP:
+					successors = (insn.target,)
+					break
+				if flow in (FLOW_RETURN, FLOW_INDIRECT_JUMP, FLOW_INVALID):
+					break
+				if nextAddr in starts:
+					successors = (nextAddr,)
+					break
+				addr = nextAddr
+			if addrs:
+				last = insns[addrs[-1]]
+				blocks[start] = Block(start, last.address + last.size, tuple(addrs), successors)
+		self._blocks = blocks
+		self._blockAddresses = sorted(blocks)
+		self._owners = None
+		return blocks
+
+	def functionBlocks(self, entry):
+		"""
+		Returns the start of every block reachable from a function entry without following calls
+		"""
+		blocks = self.blocks()
+		seen = set()
+		work = [entry]
+		while work:
+			start = work.pop()
+			if start in seen or start not in blocks:
+				continue
+			seen.add(start)
+			work.extend(blocks[start].successors)
+		return seen
+
+	def blockContaining(self, addr):
+		blocks = self.blocks()
+		i = bisect.bisect_right(self._blockAddresses, addr) - 1
+		#Blocks may overlap when code branches into the middle of another block so search backwards
+		while i >= 0:
+			block = blocks[self._blockAddresses[i]]
+			if addr in block.insns or block.start <= addr < block.end and addr in self.insns:
+				return block
+			if block.start < addr - 0x1000:
+				break
+			i = i - 1
+		return None
+
+	def functionContaining(self, addr):
+		"""
+		Returns the entry point of the function containing addr or None
+		When a block is shared by several functions the closest entry at or below addr is used
+		"""
+		if self._owners is None:
+			owners = {}
+			for entry in self.functions:
+				for start in self.functionBlocks(entry):
+					owners.setdefault(start, []).append(entry)
+			self._owners = owners
+		block = self.blockContaining(addr)
+		if block is None:
+			return None
+		entries = sorted(self._owners.get(block.start, ()))
+		if not entries:
+			return None
+		below = [e for e in entries if e <= addr]
+		return below[-1] if below else entries[0]
+
+	def usesOf(self, value):
+		"""
+		Returns the instructions that use value as an immediate or 16 bit displacement in address order
+		"""
+		return [self.insns[a] for a in sorted(set(self.values.get(value, ())))]
+
+	def accessesTo(self, address, access=None):
+		"""
+		Returns [(Insn, ACCESS_*)] for every absolute operand addressing address
+		access limits the result to reads (ACCESS_READ) or writes (ACCESS_WRITE), read-modify-write matches both
+		"""
+		found = []
+		for addr, insnAccess in self.memory.get(address, ()):
+			if access is None or insnAccess & access:
+				found.append((self.insns[addr], insnAccess))
+		found.sort(key=lambda f: f[0].address)
+		return found
+
+	def accessesIn(self, start, end, access=None):
+		"""
+		Returns {address: [(Insn, ACCESS_*)]} for every absolute operand addressing start to end (exclusive)
+		"""
+		if self._memoryAddresses is None:
+			self._memoryAddresses = sorted(self.memory)
+		addresses = self._memoryAddresses
+		found = {}
+		for i in range(bisect.bisect_left(addresses, start), bisect.bisect_left(addresses, end)):
+			accesses = self.accessesTo(addresses[i], access)
+			if accesses:
+				found[addresses[i]] = accesses
+		return found
+
+	def pageOf(self, addr):
+		"""
+		Returns (br, dp) in effect at the instruction at addr
+		"""
+		return tuple(self.pages.get(addr, (self.br, self.dp))[:2])
+
+	def setPages(self, pages):
+		"""
+		Resolves absolute operands with per instruction page registers
+		pages is {instruction address: (br, dp, ...)} as h8_pages gives it, instructions without an
+		entry use the defaults. Only br and dp are used here, anything after them is kept for other passes.
+		"""
+		memory = self.memory
+		insns = self.insns
+		changed = [insns[a] for a in set(self.pages) | set(pages)
+			if a in insns and insns[a].ea in (EA_ABS16, EA_ABS8)]
+		for insn in changed:
+			old = self.absoluteAddress(insn)
+			entries = [e for e in memory.get(old, ()) if e[0] != insn.address]
+			if entries:
+				memory[old] = entries
+			elif old in memory:
+				del memory[old]
+		self.pages = dict(pages)
+		for insn in changed:
+			memory.setdefault(self.absoluteAddress(insn), []).append((insn.address, insn.access))
+		self._memoryAddresses = None
+		return self
+
+	def absoluteAddress(self, insn):
+		"""
+		Returns the address an absolute memory operand resolves to or None
+		"""
+		if insn.ea == EA_ABS16:
+			return (self.pageOf(insn.address)[1] << 16) | insn.value
+		if insn.ea == EA_ABS8:
+			return (self.pageOf(insn.address)[0] << 8) | insn.value
+		return None
+
+	def nextInsn(self, insn):
+		"""
+		Returns the decoded instruction following insn or None
+		"""
+		return self.insns.get(insn.address + insn.size)
+
+def disassemble(rom, seeds=None, br=0x0, dp=0x0):
+	"""
+	Runs a recursive descent disassembly of a RomSpace
+	Seeds default to the vector table entries below 0x10140 plus the known functions
+	"""
+	if seeds is None:
+		seeds = vectorSeeds(rom) + [f.address for f in h8_analysis.KNOWN_FUNCTIONS]
+	return Disassembly(rom, br, dp).run(seeds)
@@ -0,0 +1,326 @@
+"""
+Hardware definition store
+
+The register map, vector table and MUT catalogue labelRegisters(), createVTEntries() and
+createMutTable() apply are kept in h8_definitions.json instead of literals in the script:
+
+   chips      per H8/500 variant the registers as [address, name, type, initial, comment]
+              and the vectors as [offset, name, comment], offsets from the mirror at 0
+   families   per ECU family the chip it uses and the MUT catalogue as [id, name, comment],
+              optionally the checksum layout as {start, end, stored, target, correction}
+              (see h8_checksum, stored and correction can be null)
+
+Addresses, offsets, ids and initial values are hex strings. A MUT id can have several
+entries, one per bit field of the byte it reads, and every one of them is kept.
+
+A chip or family can name a base it extends: its entries replace the entries of the base
+with the same address, offset or id (all the MUT entries of an id at once) and add the
+rest. load() reads, validates and compiles the file once per process, the compiled
+Definitions keep their entries sorted by address so lookups are a bisect.
+
+	python h8_definitions.py [--family NAME] [--check] [FILE]
+"""
+
+from __future__ import print_function
+
+import argparse
+import bisect
+import collections
+import io
+import json
+import os
+import sys
+
+import h8_rom
+
+DEFINITIONS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'h8_definitions.json')
+
+#Version of the file layout load() understands
+VERSION = 1
+
+REGISTER_TYPES = {'byte': 1, 'word': 2}
+
+#Offsets of the vectors from the mirrored table at 0
+VECTORS_END = 0x200
+
+Register = collections.namedtuple('Register', 'address name type initial comment')
+Vector = collections.namedtuple('Vector', 'offset name comment')
+MutField = collections.namedtuple('MutField', 'name comment')
+
+#Fields of a family's checksum layout, h8_checksum.ChecksumSpec checks they fit together
+CHECKSUM_FIELDS = ('start', 'end', 'stored', 'target', 'correction')
+
+class DefinitionError(ValueError):
+	pass
+
+def _hex(value, where, limit):
+	#Parses a hex string field below limit
+	try:
+		number = int(value, 16)
+	except (TypeError, ValueError):
+		raise DefinitionError('%s: %r is not a hex string' % (where, value))
+	if not 0 <= number < limit:
+		raise DefinitionError('%s: %X is out of range' % (where, number))
+	return number
+
+def _text(value, where):
+	#JSON strings are unicode in Python 2, IDA wants plain str names
+	try:
+		value.encode('ascii')
+	except (AttributeError, UnicodeError):
+		raise DefinitionError('%s: %r is not an ASCII string' % (where, value))
+	return str(value)
+
+def _rows(section, where, width):
+	if not isinstance(section, list):
+		raise DefinitionError('%s is not a list' % where)
+	for i, row in enumerate(section):
+		if not isinstance(row, list) or len(row) != width:
+			raise DefinitionError('%s[%d] is not a list of %d fields' % (where, i, width))
+	return section
+
+def _registers(section, where):
+	registers = {}
+	names = set()
+	for i, (address, name, kind, initial, comment) in enumerate(_rows(section, where, 5)):
+		at = '%s[%d]' % (where, i)
+		address = _hex(address, at, 0x10000)
+		if kind not in REGISTER_TYPES:
+			raise DefinitionError('%s: unknown register type %r' % (at, kind))
+		size = REGISTER_TYPES[kind]
+		if not h8_rom.REGISTERS_START <= address <= h8_rom.REGISTERS_END - size:
+			raise DefinitionError('%s: %X is not a register address' % (at, address))
+		if size == 2 and address & 1:
+			raise DefinitionError('%s: word register %X is not word aligned' % (at, address))
+		if address in registers:
+			raise DefinitionError('%s: register %X is defined twice' % (at, address))
+		if name and name in names:
+			raise DefinitionError('%s: register name %s is used twice' % (at, name))
+		names.add(name)
+		registers[address] = Register(address, _text(name, at), str(kind),
+			_hex(initial, at, 1 << (size * 8)), _text(comment, at))
+	return registers
+
+def _vectors(section, where):
+	vectors = {}
+	for i, (offset, name, comment) in enumerate(_rows(section, where, 3)):
+		at = '%s[%d]' % (where, i)
+		offset = _hex(offset, at, VECTORS_END)
+		if offset & 3:
+			raise DefinitionError('%s: vector %X is not a long word' % (at, offset))
+		if offset in vectors:
+			raise DefinitionError('%s: vector %X is defined twice' % (at, offset))
+		vectors[offset] = Vector(offset, _text(name, at), _text(comment, at))
+	return vectors
+
+def _mut(section, where):
+	#Entries of the same id are kept in file order
+	mut = collections.OrderedDict()
+	for i, (mutId, name, comment) in enumerate(_rows(section, where, 3)):
+		at = '%s[%d]' % (where, i)
+		mutId = _hex(mutId, at, 0x100)
+		mut.setdefault(mutId, []).append(MutField(_text(name, at), _text(comment, at)))
+	return mut
+
+def _checksum(section, where):
+	#{field: int or None} of a checksum layout, None when the family has none
+	if section is None:
+		return None
+	if not isinstance(section, dict):
+		raise DefinitionError('%s is not an object' % where)
+	unknown = set(section) - set(CHECKSUM_FIELDS)
+	if unknown:
+		raise DefinitionError('%s: unknown fields %s' % (where, ', '.join(sorted(unknown))))
+	layout = {}
+	for field in CHECKSUM_FIELDS:
+		value = section.get(field)
+		if value is None and field in ('start', 'end'):
+			raise DefinitionError('%s: %s is missing' % (where, field))
+		limit = 0x10000 if field == 'target' else h8_rom.ROM_END + 1
+		layout[field] = None if value is None else _hex(value, '%s %s' % (where, field), limit)
+	if layout['target'] is None:
+		layout['target'] = 0
+	return layout
+
+def _resolve(table, name, kind, parsers, seen=()):
+	#Merges a chip or family with its bases, {section: {key: entry}}
+	if name not in table:
+		raise DefinitionError('Unknown %s %r' % (kind, name))
+	if name in seen:
+		raise DefinitionError('%s %r is its own base' % (kind, name))
+	entry = table[name]
+	if not isinstance(entry, dict):
+		raise DefinitionError('%s %r is not an object' % (kind, name))
+	merged = {}
+	if 'base' in entry:
+		merged = _resolve(table, entry['base'], kind, parsers, seen + (name,))
+	for section, parse in parsers.items():
+		if section in entry:
+			values = dict(merged.get(section, {}))
+			values.update(parse(entry[section], '%s %s %s' % (kind, name, section)))
+			merged[section] = values
+	for key in ('chip', 'description', 'checksum'):
+		if key in entry:
+			merged[key] = entry[key]
+	return merged
+
+class Definitions(object):
+	"""
+	Compiled definitions of one ECU family and its chip
+	"""
+
+	def __init__(self, family, chip, registers, vectors, mut, version=VERSION, checksum=None):
+		self.family = family
+		self.chip = chip
+		self.version = version
+		#{start, end, stored, target, correction} or None when the family does not give one
+		self.checksum = checksum
+		self.registers = [registers[a] for a in sorted(registers)]
+		self.registerAddresses = [r.address for r in self.registers]
+		self.vectors = [vectors[o] for o in sorted(vectors)]
+		self.vectorOffsets = [v.offset for v in self.vectors]
+		self.mutIds = sorted(mut)
+		self.mut = [tuple(mut[i]) for i in self.mutIds]
+		#Tables in the planners' format, built on first use and shared by every caller
+		self._tables = {}
+
+	def register(self, addr):
+		"""
+		Returns the Register holding addr (either byte of a word register) or None
+		"""
+		i = bisect.bisect_right(self.registerAddresses, addr) - 1
+		if i < 0:
+			return None
+		register = self.registers[i]
+		if addr >= register.address + REGISTER_TYPES[register.type]:
+			return None
+		return register
+
+	def vector(self, addr):
+		"""
+		Returns the Vector at addr in the table at 0 or its copy at 10000, None when it has no entry
+		"""
+		offset = addr & 0xFFFF
+		i = bisect.bisect_left(self.vectorOffsets, offset)
+		if i < len(self.vectors) and self.vectorOffsets[i] == offset:
+			return self.vectors[i]
+		return None
+
+	def mutFields(self, mutId):
+		"""
+		Returns the MutField of every bit field a MUT id reads, () for ids without an entry
+		"""
+		i = bisect.bisect_left(self.mutIds, mutId)
+		if i < len(self.mutIds) and self.mutIds[i] == mutId:
+			return self.mut[i]
+		return ()
+
+	def registerTable(self):
+		"""
+		Returns {address: {'name', 'type', 'initial', 'comment'}} as planRegisters() takes it
+		The table is built once and shared, it must not be modified
+		"""
+		if 'registers' not in self._tables:
+			self._tables['registers'] = dict((r.address, {'name': r.name, 'type': r.type, 'initial': r.initial,
+				'comment': r.comment}) for r in self.registers)
+		return self._tables['registers']
+
+	def vectorTable(self):
+		"""
+		Returns {offset: {'name', 'comment'}} as planVTEntries() takes it
+		The table is built once and shared, it must not be modified
+		"""
+		if 'vectors' not in self._tables:
+			self._tables['vectors'] = dict((v.offset, {'name': v.name, 'comment': v.comment}) for v in self.vectors)
+		return self._tables['vectors']
+
+	def mutLabels(self):
+		"""
+		Returns {'MUT_xx': [variable name, comment]} as planMutTable() takes it
+
+		The variable is named after the last entry of an id. Ids with several bit fields
+		get a comment listing every field. The table is built once and shared, it must not be modified
+		"""
+		if 'mut' in self._tables:
+			return self._tables['mut']
+		labels = {}
+		for mutId, fields in zip(self.mutIds, self.mut):
+			if len(fields) == 1:
+				comment = fields[0].comment
+			else:
+				comment = '\n'.join('%s: %s' % (f.name, f.comment) if f.name else f.comment for f in fields)
+			labels['MUT_%02X' % mutId] = [fields[-1].name, comment]
+		self._tables['mut'] = labels
+		return labels
+
+def compileFamily(data, family=None):
+	"""
+	Returns the Definitions of a family (the default one when None) from the parsed JSON file
+	"""
+	if not isinstance(data, dict) or data.get('version') != VERSION:
+		raise DefinitionError('Definition file version %r is not %d' % (
+			data.get('version') if isinstance(data, dict) else None, VERSION))
+	if family is None:
+		family = data.get('default')
+	resolved = _resolve(data.get('families', {}), family, 'family', {'mut': _mut})
+	if 'chip' not in resolved:
+		raise DefinitionError('family %r does not name a chip' % family)
+	chip = _resolve(data.get('chips', {}), resolved['chip'], 'chip',
+		{'registers': _registers, 'vectors': _vectors})
+	return Definitions(str(family), str(resolved['chip']), chip.get('registers', {}), chip.get('vectors', {}),
+		resolved.get('mut', {}), data['version'], _checksum(resolved.get('checksum'), 'family %s checksum' % family))
+
+def families(path=DEFINITIONS_PATH):
+	"""
+	Returns the names of the families defined in a file
+	"""
+	return sorted(_read(path).get('families', {}))
+
+def _read(path):
+	with io.open(path, encoding='utf-8') as f:
+		return json.load(f)
+
+_loaded = {}
+
+def load(family=None, path=DEFINITIONS_PATH):
+	"""
+	Returns the Definitions of a family, the file is read and compiled once per process
+	"""
+	key = (os.path.realpath(path), family)
+	if key not in _loaded:
+		_loaded[key] = compileFamily(_read(path), family)
+	return _loaded[key]
+
+def main():
+	parser = argparse.ArgumentParser(description='Validate and list a hardware definition file')
+	parser.add_argument('path', nargs='?', default=DEFINITIONS_PATH)
+	parser.add_argument('--family', default=None, help='family to compile (default: every family)')
+	parser.add_argument('--check', action='store_true', help='only validate')
+	args = parser.parse_args()
+
+	names = [args.family] if args.family is not None else families(args.path)
+	for name in names:
+		try:
+			definitions = load(name, args.path)
+		except DefinitionError as e:
+			print('%s: %s' % (name, e), file=sys.stderr)
+			return 1
+		print('%s (%s): %d registers, %d vectors, %d MUT ids, %d MUT fields' % (name, definitions.chip,
+			len(definitions.registers), len(definitions.vectors), len(definitions.mutIds),
+			sum(len(f) for f in definitions.mut)))
+		if definitions.checksum is not None:
+			print('   checksum %s' % ', '.join('%s %s' % (field, 'none' if definitions.checksum[field] is None
+				else '%X' % definitions.checksum[field]) for field in CHECKSUM_FIELDS))
+		if args.check:
+			continue
+		for register in definitions.registers:
+			print('   %04X %-5s %-16s %s' % (register.address, register.type, register.name, register.comment))
+		for vector in definitions.vectors:
+			print('   %03X       %-16s %s' % (vector.offset, vector.name, vector.comment))
+		for mutId, fields in zip(definitions.mutIds, definitions.mut):
+			for field in fields:
+				print('   MUT_%02X    %-16s %s' % (mutId, field.name, field.comment.replace('\n', ' ')))
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
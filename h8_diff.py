@@ -0,0 +1,157 @@
+"""
+Page diff of ROM dumps in the loadFile() layout
+
+Each 64K page is compared as a whole first and identical pages are skipped. Changed pages
+are compared byte by byte in one NumPy pass, so no difference can be hidden by a hash
+collision. Every changed range is annotated with what it overlaps: vector table entries,
+map structures, MUT table pointers and labeled functions.
+
+Changes are reported in the loadFile() layout (0x10000-0x2FFFF). Page 0 mirrors the first
+0x4000 bytes of the dump, so annotations added at 0x0000-0x3FFF (the vector table, code
+called through the mirror) also cover the same bytes at 0x10000-0x13FFF.
+"""
+
+import bisect
+import collections
+
+import numpy
+
+import h8_analysis
+import h8_maps
+import h8_rom
+
+PAGE_SIZE = 0x10000
+
+Change = collections.namedtuple('Change', 'start end annotations')
+
+def imageArray(rom):
+	"""
+	Returns a zero copy uint8 array over a RomSpace's dump
+	"""
+	return numpy.frombuffer(rom.buffer, numpy.uint8, h8_rom.ROM_SIZE)
+
+class Annotations(object):
+	"""
+	Sorted address intervals labelling what lives where in a ROM
+	Intervals in the page 0 mirror are also added at the ROM address of the same bytes
+	"""
+
+	def __init__(self):
+		self._items = []
+		self._starts = None
+		self._longest = 0
+
+	def add(self, start, end, kind, label):
+		self._items.append((start, end, kind, label))
+		if start < h8_rom.MIRROR_END:
+			self._items.append((start + h8_rom.ROM_START, min(end, h8_rom.MIRROR_END) + h8_rom.ROM_START, kind, label))
+		self._longest = max(self._longest, end - start)
+		self._starts = None
+
+	def overlapping(self, start, end):
+		"""
+		Returns [(kind, label)] for every interval overlapping start to end (exclusive)
+		"""
+		if self._starts is None:
+			self._items.sort()
+			self._starts = [item[0] for item in self._items]
+		found = []
+		i = bisect.bisect_left(self._starts, start - self._longest)
+		while i < len(self._items) and self._items[i][0] < end:
+			itemStart, itemEnd, kind, label = self._items[i]
+			if itemEnd > start:
+				found.append((kind, label))
+			i = i + 1
+		return found
+
+def defaultAnnotations(mutStart=h8_analysis.MUT_TABLE_START, mutEnd=h8_analysis.MUT_TABLE_END,
+		maps=None, functions=None):
+	"""
+	Builds the annotations for the vector table, MUT table and optionally maps and functions
+
+	maps is {address: h8_maps.Map} (or Axis), functions is [(start, end, name)].
+	"""
+	annotations = Annotations()
+	for addr in range(h8_analysis.VECTOR_TABLE_START, h8_analysis.VECTOR_TABLE_END, 4):
+		kind = 'vector' if addr < h8_analysis.DTC_VECTORS_START else 'dtc_vector'
+		annotations.add(addr, addr + 4, kind, '0x%03X' % (addr - h8_analysis.VECTOR_TABLE_START))
+
+	counter = 0
+	for addr in range(mutStart, mutEnd + 1, 2):
+		annotations.add(addr, addr + 2, 'mut', 'MUT_%02X' % counter)
+		counter = counter + 1
+
+	if maps:
+		for address, found in maps.items():
+			kind = getattr(found, 'kind', 'axis_table')
+			end = address + h8_maps.headerSize(kind) + found.data.nbytes
+			annotations.add(address, end, kind, '%X' % address)
+
+	if functions:
+		for start, end, name in functions:
+			annotations.add(start, end, 'function', name)
+	return annotations
+
+def functionRanges(disassembly, names=None):
+	"""
+	Returns [(start, end, name)] covering each function of an h8_decoder.Disassembly
+	names maps entry addresses to labels, other functions are named sub_<address>
+	"""
+	blocks = disassembly.blocks()
+	ranges = []
+	for entry in disassembly.functions:
+		starts = disassembly.functionBlocks(entry)
+		if not starts:
+			continue
+		end = max(blocks[s].end for s in starts)
+		start = min(starts)
+		name = names.get(entry) if names else None
+		ranges.append((start, end, name or 'sub_%X' % entry))
+	return ranges
+
+def _changedRanges(reference, other, mergeGap):
+	#Yields (start offset, end offset) of the differences between two images
+	for page in range(0, h8_rom.ROM_SIZE, PAGE_SIZE):
+		a = reference[page:page + PAGE_SIZE]
+		b = other[page:page + PAGE_SIZE]
+		if numpy.array_equal(a, b):
+			continue
+		offsets = numpy.nonzero(a != b)[0] + page
+
+		#Group byte offsets into ranges, merging gaps smaller than mergeGap
+		breaks = numpy.nonzero(numpy.diff(offsets) > mergeGap)[0]
+		starts = numpy.concatenate(([offsets[0]], offsets[breaks + 1]))
+		ends = numpy.concatenate((offsets[breaks], [offsets[-1]])) + 1
+		for start, end in zip(starts, ends):
+			yield int(start), int(end)
+
+def diffImages(reference, other, annotations=None, mergeGap=4):
+	"""
+	Returns the Changes between two uint8 image arrays
+	Addresses are in the loadFile() layout (0x10000-0x2FFFF)
+	"""
+	changes = []
+	for start, end in _changedRanges(reference, other, mergeGap):
+		start = start + h8_rom.ROM_START
+		end = end + h8_rom.ROM_START
+		found = annotations.overlapping(start, end) if annotations is not None else []
+		changes.append(Change(start, end, found))
+	return changes
+
+def diffMany(referencePath, paths, annotations=None, mergeGap=4):
+	"""
+	Diffs one reference ROM against many ROMs in a single call
+	The reference is mapped once. Returns {path: [Change]}, identical ROMs map to []
+	"""
+	if annotations is None:
+		annotations = defaultAnnotations()
+	results = {}
+	with h8_rom.RomSpace(referencePath) as referenceRom:
+		reference = imageArray(referenceRom)
+		for path in paths:
+			with h8_rom.RomSpace(path) as rom:
+				other = imageArray(rom)
+				results[path] = diffImages(reference, other, annotations, mergeGap)
+				del other
+		del reference
+	return results
@@ -0,0 +1,779 @@
+"""
+Small H8/500 emulator for resolving values the static passes cannot see
+
+Instructions come from h8_decoder and are kept in a cache of decoded basic blocks, each
+instruction paired with the method that executes it, so code that runs in a loop is only
+decoded once. Memory reads are served from the RomSpace with writes kept in an overlay,
+nothing is written back to the ROM. Register indirect operands use the page registers as
+in maximum mode: DP for R0-R3, EP for R4-R5, TP for FP and SP.
+
+Calls are stepped over by default so a caller can be run up to a call site without
+entering every subroutine (and any hardware polling loop) on the way.
+
+flashCopy() uses it to find the range copy_flash_code copies into RAM: the caller is run
+up to the call to read the start (R4) and end (R1), both in the page EP holds as the copy
+reads them through @R4+, and then the copy itself is run to see where the bytes are written.
+
+MOVFPE/MOVTPE (transfers synchronised to the E clock of external peripherals), TRAPA and
+PJMP/PJSR through a register are not emulated. Running into one raises EmulationError naming
+the instruction, and flashCopy() then moves on to the next way of reaching the call.
+"""
+
+import collections
+
+import h8_analysis
+import h8_decoder
+import h8_rom
+
+from h8_decoder import EA_REG, EA_IND, EA_PREDEC, EA_POSTINC, EA_DISP, EA_ABS8, EA_ABS16, EA_IMM
+
+class EmulationError(Exception):
+	pass
+
+#Condition code register bits
+C = 0x01
+V = 0x02
+Z = 0x04
+N = 0x08
+
+#Control register numbers as used in Insn.reg for LDC/STC/ORC/ANDC/XORC
+SR = 0
+CCR = 1
+BR = 3
+EP = 4
+DP = 5
+TP = 7
+
+#Stack pointer at the start of emulation, the top of RAM
+STACK_TOP = h8_rom.RAM_END
+
+#Return address pushed by call() to detect the routine returning
+_RETURN = 0xFFFF
+_RETURN_PAGE = 0xFF
+
+FlashCopy = collections.namedtuple('FlashCopy', 'call start end destination length')
+
+class Emulator(object):
+	"""
+	H8/500 CPU state over a RomSpace
+
+	regs holds R0-R7 (FP is R6, SP R7), ccr the condition codes and br, ep, dp, tp the page registers.
+	Every byte written other than by push() is recorded in writes as address: value in write order.
+	"""
+
+	def __init__(self, rom, maxInsns=100000):
+		self.rom = rom
+		self.maxInsns = maxInsns
+		self._data = bytearray(rom.buffer)
+		self._blocks = {}
+		self.reset()
+
+	def reset(self):
+		"""
+		Clears registers and written memory, the block cache is kept
+		"""
+		self.regs = [0] * 8
+		self.regs[7] = STACK_TOP
+		self.sr = 0x0700
+		self.ccr = 0
+		self.br = 0
+		self.ep = 0
+		self.dp = 0
+		self.tp = 0
+		self.pc = 0
+		self.memory = {}
+		self.writes = collections.OrderedDict()
+		self.executed = 0
+
+	#Memory
+
+	def readByte(self, addr):
+		value = self.memory.get(addr)
+		if value is not None:
+			return value
+		offset = h8_rom.romOffset(addr)
+		if offset < 0:
+			return 0
+		return self._data[offset]
+
+	def readWord(self, addr):
+		return (self.readByte(addr) << 8) | self.readByte(addr + 1)
+
+	def writeByte(self, addr, value):
+		self.memory[addr] = value & 0xFF
+		self.writes[addr] = value & 0xFF
+
+	def writeWord(self, addr, value):
+		self.writeByte(addr, value >> 8)
+		self.writeByte(addr + 1, value)
+
+	def read(self, addr, size):
+		return self.readByte(addr) if size == 1 else self.readWord(addr)
+
+	def write(self, addr, size, value):
+		if size == 1:
+			self.writeByte(addr, value)
+		else:
+			self.writeWord(addr, value)
+
+	def push(self, value):
+		#Stack writes are not recorded in writes
+		self.regs[7] = (self.regs[7] - 2) & 0xFFFF
+		addr = (self.tp << 16) | self.regs[7]
+		self.memory[addr] = (value >> 8) & 0xFF
+		self.memory[addr + 1] = value & 0xFF
+
+	def pop(self):
+		value = self.readWord((self.tp << 16) | self.regs[7])
+		self.regs[7] = (self.regs[7] + 2) & 0xFFFF
+		return value
+
+	#Operands
+
+	def _page(self, reg):
+		if reg < 4:
+			return self.dp << 16
+		if reg < 6:
+			return self.ep << 16
+		return self.tp << 16
+
+	def _address(self, insn):
+		#Resolves the memory address of a non register operand, applying pre-decrement and post-increment
+		ea = insn.ea
+		reg = insn.eareg
+		if ea == EA_IND:
+			return self._page(reg) | self.regs[reg]
+		if ea == EA_DISP:
+			return self._page(reg) | ((self.regs[reg] + insn.value) & 0xFFFF)
+		if ea == EA_ABS16:
+			return (self.dp << 16) | insn.value
+		if ea == EA_ABS8:
+			return (self.br << 8) | insn.value
+		step = 2 if reg == 7 else insn.opsize
+		if ea == EA_PREDEC:
+			self.regs[reg] = (self.regs[reg] - step) & 0xFFFF
+			return self._page(reg) | self.regs[reg]
+		if ea == EA_POSTINC:
+			addr = self._page(reg) | self.regs[reg]
+			self.regs[reg] = (self.regs[reg] + step) & 0xFFFF
+			return addr
+		raise EmulationError('No memory operand at %X' % insn.address)
+
+	def _getReg(self, reg, size):
+		return self.regs[reg] & 0xFF if size == 1 else self.regs[reg]
+
+	def _setReg(self, reg, size, value):
+		if size == 1:
+			self.regs[reg] = (self.regs[reg] & 0xFF00) | (value & 0xFF)
+		else:
+			self.regs[reg] = value & 0xFFFF
+
+	def _load(self, insn):
+		"""
+		Returns (value, address) of an instruction's effective address operand, address is None for registers and immediates
+		"""
+		ea = insn.ea
+		if ea == EA_REG:
+			return self._getReg(insn.eareg, insn.opsize), None
+		if ea == EA_IMM:
+			return insn.value, None
+		addr = self._address(insn)
+		return self.read(addr, insn.opsize), addr
+
+	def _store(self, insn, addr, value):
+		if insn.ea == EA_REG:
+			self._setReg(insn.eareg, insn.opsize, value)
+		elif insn.ea == EA_IMM:
+			raise EmulationError('Write to an immediate at %X' % insn.address)
+		else:
+			if addr is None:
+				addr = self._address(insn)
+			self.write(addr, insn.opsize, value)
+
+	#Flags
+
+	def _nz(self, value, size):
+		sign = 0x80 if size == 1 else 0x8000
+		ccr = self.ccr & ~(N | Z)
+		if value & sign:
+			ccr = ccr | N
+		if value & (0xFF if size == 1 else 0xFFFF) == 0:
+			ccr = ccr | Z
+		self.ccr = ccr
+
+	def _logic(self, value, size):
+		self._nz(value, size)
+		self.ccr = self.ccr & ~V
+
+	def _add(self, a, b, size, carry=0):
+		mask = 0xFF if size == 1 else 0xFFFF
+		sign = 0x80 if size == 1 else 0x8000
+		full = a + b + carry
+		result = full & mask
+		self._nz(result, size)
+		ccr = self.ccr & ~(V | C)
+		if full > mask:
+			ccr = ccr | C
+		if (a ^ result) & (b ^ result) & sign:
+			ccr = ccr | V
+		self.ccr = ccr
+		return result
+
+	def _sub(self, a, b, size, borrow=0):
+		mask = 0xFF if size == 1 else 0xFFFF
+		sign = 0x80 if size == 1 else 0x8000
+		full = a - b - borrow
+		result = full & mask
+		self._nz(result, size)
+		ccr = self.ccr & ~(V | C)
+		if full < 0:
+			ccr = ccr | C
+		if (a ^ b) & (a ^ result) & sign:
+			ccr = ccr | V
+		self.ccr = ccr
+		return result
+
+	def condition(self, index):
+		"""
+		Evaluates condition index (the order of h8_decoder.CONDITIONS) against the condition codes
+		"""
+		ccr = self.ccr
+		n = bool(ccr & N)
+		z = bool(ccr & Z)
+		v = bool(ccr & V)
+		c = bool(ccr & C)
+		test = index >> 1
+		if test == 0:
+			result = True
+		elif test == 1:
+			result = not (c or z)
+		elif test == 2:
+			result = not c
+		elif test == 3:
+			result = not z
+		elif test == 4:
+			result = not v
+		elif test == 5:
+			result = not n
+		elif test == 6:
+			result = n == v
+		else:
+			result = not (z or n != v)
+		return result if index & 1 == 0 else not result
+
+	#Control registers
+
+	def _getControl(self, reg):
+		if reg == SR:
+			return (self.sr & 0xFF00) | self.ccr
+		if reg == CCR:
+			return self.ccr
+		return getattr(self, {BR: 'br', EP: 'ep', DP: 'dp', TP: 'tp'}[reg])
+
+	def _setControl(self, reg, value):
+		if reg == SR:
+			self.sr = value & 0xFF00
+			self.ccr = value & 0xFF
+		elif reg == CCR:
+			self.ccr = value & 0xFF
+		else:
+			setattr(self, {BR: 'br', EP: 'ep', DP: 'dp', TP: 'tp'}[reg], value & 0xFF)
+
+	#Instructions
+	#Each returns the next pc or None to fall through
+
+	def _mov(self, insn):
+		if insn.reg is None:
+			#mov:g #xx, <ea>
+			self._store(insn, None, insn.imm)
+			self._logic(insn.imm, insn.opsize)
+		elif insn.access == h8_decoder.ACCESS_WRITE:
+			value = self._getReg(insn.reg, insn.opsize)
+			self._store(insn, None, value)
+			self._logic(value, insn.opsize)
+		else:
+			value, addr = self._load(insn)
+			self._setReg(insn.reg, insn.opsize, value)
+			self._logic(value, insn.opsize)
+
+	def _cmp(self, insn):
+		value, addr = self._load(insn)
+		if insn.reg is None:
+			self._sub(value, insn.imm, insn.opsize)
+		else:
+			self._sub(self._getReg(insn.reg, insn.opsize), value, insn.opsize)
+
+	def _arithmetic(self, insn):
+		value, addr = self._load(insn)
+		size = insn.opsize
+		mnemonic = insn.mnemonic
+		current = self._getReg(insn.reg, size)
+		if mnemonic == 'add:g':
+			result = self._add(current, value, size)
+		elif mnemonic == 'addx':
+			result = self._add(current, value, size, self.ccr & C)
+		elif mnemonic == 'sub':
+			result = self._sub(current, value, size)
+		elif mnemonic == 'subx':
+			result = self._sub(current, value, size, self.ccr & C)
+		elif mnemonic == 'or':
+			result = current | value
+			self._logic(result, size)
+		elif mnemonic == 'and':
+			result = current & value
+			self._logic(result, size)
+		else:
+			result = current ^ value
+			self._logic(result, size)
+		self._setReg(insn.reg, size, result)
+
+	def _addsSubs(self, insn):
+		#ADDS/SUBS work on the whole register and leave the flags alone
+		value, addr = self._load(insn)
+		if insn.opsize == 1 and value & 0x80:
+			value = value - 0x100
+		if insn.mnemonic == 'subs':
+			value = -value
+		self.regs[insn.reg] = (self.regs[insn.reg] + value) & 0xFFFF
+
+	def _addq(self, insn):
+		value, addr = self._load(insn)
+		if insn.imm >= 0:
+			result = self._add(value, insn.imm, insn.opsize)
+		else:
+			result = self._sub(value, -insn.imm, insn.opsize)
+		self._store(insn, addr, result)
+
+	def _mulxu(self, insn):
+		value, addr = self._load(insn)
+		reg = insn.reg
+		if insn.opsize == 1:
+			result = (self.regs[reg] & 0xFF) * value
+			self.regs[reg] = result & 0xFFFF
+			self._logic(result, 2)
+		else:
+			result = self.regs[reg] * value
+			self.regs[reg] = (result >> 16) & 0xFFFF
+			self.regs[(reg + 1) & 7] = result & 0xFFFF
+			self.ccr = self.ccr & ~(N | Z | V | C)
+			if result & 0x80000000:
+				self.ccr = self.ccr | N
+			if result == 0:
+				self.ccr = self.ccr | Z
+
+	def _divxu(self, insn):
+		value, addr = self._load(insn)
+		if value == 0:
+			raise EmulationError('Division by zero at %X' % insn.address)
+		reg = insn.reg
+		if insn.opsize == 1:
+			dividend = self.regs[reg]
+			quotient, remainder = divmod(dividend, value)
+			self.regs[reg] = ((remainder & 0xFF) << 8) | (quotient & 0xFF)
+		else:
+			dividend = (self.regs[reg] << 16) | self.regs[(reg + 1) & 7]
+			quotient, remainder = divmod(dividend, value)
+			self.regs[reg] = remainder & 0xFFFF
+			self.regs[(reg + 1) & 7] = quotient & 0xFFFF
+		self._logic(quotient, insn.opsize)
+
+	def _single(self, insn):
+		mnemonic = insn.mnemonic
+		size = insn.opsize
+		mask = 0xFF if size == 1 else 0xFFFF
+		top = 0x80 if size == 1 else 0x8000
+
+		if mnemonic in ('swap', 'exts', 'extu'):
+			reg = insn.eareg
+			value = self.regs[reg]
+			if mnemonic == 'swap':
+				value = ((value & 0xFF) << 8) | (value >> 8)
+			elif mnemonic == 'exts':
+				value = (value & 0xFF) | (0xFF00 if value & 0x80 else 0)
+			else:
+				value = value & 0xFF
+			self.regs[reg] = value
+			self._logic(value, 2)
+			return
+
+		value, addr = self._load(insn)
+		carry = self.ccr & C
+		setCarry = None
+		if mnemonic == 'clr':
+			result = 0
+		elif mnemonic == 'neg':
+			self._store(insn, addr, self._sub(0, value, size))
+			return
+		elif mnemonic == 'not':
+			result = ~value & mask
+		elif mnemonic == 'tst':
+			self._logic(value, size)
+			self.ccr = self.ccr & ~C
+			return
+		elif mnemonic == 'tas':
+			self._logic(value, size)
+			result = value | top
+		elif mnemonic in ('shal', 'shll'):
+			result = (value << 1) & mask
+			setCarry = value & top
+		elif mnemonic == 'shar':
+			result = (value >> 1) | (value & top)
+			setCarry = value & 1
+		elif mnemonic == 'shlr':
+			result = value >> 1
+			setCarry = value & 1
+		elif mnemonic == 'rotl':
+			result = ((value << 1) | (1 if value & top else 0)) & mask
+			setCarry = value & top
+		elif mnemonic == 'rotr':
+			result = (value >> 1) | (top if value & 1 else 0)
+			setCarry = value & 1
+		elif mnemonic == 'rotxl':
+			result = ((value << 1) | (1 if carry else 0)) & mask
+			setCarry = value & top
+		else:
+			result = (value >> 1) | (top if carry else 0)
+			setCarry = value & 1
+
+		self._logic(result, size)
+		if mnemonic == 'clr':
+			self.ccr = self.ccr & ~C
+		if setCarry is not None:
+			self.ccr = (self.ccr | C) if setCarry else (self.ccr & ~C)
+		if mnemonic == 'shal' and (value ^ result) & top:
+			self.ccr = self.ccr | V
+		self._store(insn, addr, result)
+
+	def _bit(self, insn):
+		value, addr = self._load(insn)
+		number = self.regs[insn.reg] if insn.imm == h8_decoder.BIT_REGISTER else insn.reg
+		bit = 1 << (number & (7 if insn.opsize == 1 else 15))
+		self.ccr = (self.ccr & ~Z) if value & bit else (self.ccr | Z)
+		mnemonic = insn.mnemonic
+		if mnemonic == 'btst':
+			return
+		if mnemonic == 'bset':
+			value = value | bit
+		elif mnemonic == 'bclr':
+			value = value & ~bit
+		else:
+			value = value ^ bit
+		self._store(insn, addr, value)
+
+	def _control(self, insn):
+		mnemonic = insn.mnemonic
+		if mnemonic == 'stc':
+			self._store(insn, None, self._getControl(insn.reg))
+			return
+		value, addr = self._load(insn)
+		if mnemonic == 'ldc':
+			self._setControl(insn.reg, value)
+		elif mnemonic == 'orc':
+			self._setControl(insn.reg, self._getControl(insn.reg) | value)
+		elif mnemonic == 'andc':
+			self._setControl(insn.reg, self._getControl(insn.reg) & value)
+		else:
+			self._setControl(insn.reg, self._getControl(insn.reg) ^ value)
+
+	def _short(self, insn):
+		mnemonic = insn.mnemonic
+		reg = insn.reg
+		size = insn.opsize
+		if mnemonic in ('mov:e', 'mov:i'):
+			self._setReg(reg, size, insn.imm)
+			self._logic(insn.imm, size)
+		elif mnemonic in ('cmp:e', 'cmp:i'):
+			self._sub(self._getReg(reg, size), insn.imm, size)
+		elif insn.access == h8_decoder.ACCESS_WRITE:
+			value = self._getReg(reg, size)
+			self.write(self._address(insn), size, value)
+			self._logic(value, size)
+		else:
+			value = self.read(self._address(insn), size)
+			self._setReg(reg, size, value)
+			self._logic(value, size)
+
+	def _nop(self, insn):
+		return None
+
+	def _branch(self, insn):
+		if insn.mnemonic == 'brn':
+			return None
+		index = h8_decoder.CONDITIONS.index(insn.mnemonic)
+		if self.condition(index):
+			return insn.target
+		return None
+
+	def _jump(self, insn):
+		if insn.target is not None:
+			return insn.target
+		#jmp @Rn, jmp @(d,Rn)
+		page = insn.address & 0xFF0000
+		if insn.mnemonic == 'pjmp':
+			self._unsupported(insn)
+		offset = self.regs[insn.eareg] + (insn.value if insn.ea == EA_DISP else 0)
+		return page | (offset & 0xFFFF)
+
+	def _call(self, insn):
+		nextPc = (insn.address & 0xFF0000) | ((insn.address + insn.size) & 0xFFFF)
+		if insn.target is None:
+			if insn.mnemonic == 'pjsr':
+				self._unsupported(insn)
+			target = self._jump(insn)
+		else:
+			target = insn.target
+		if self.stepOver and target not in self.follow:
+			return None
+		if insn.mnemonic == 'pjsr':
+			self.push(nextPc & 0xFFFF)
+			self.push(nextPc >> 16)
+		else:
+			self.push(nextPc & 0xFFFF)
+		return target
+
+	def _return(self, insn):
+		mnemonic = insn.mnemonic
+		page = insn.address & 0xFF0000
+		if mnemonic == 'rte':
+			self._setControl(SR, self.pop())
+			page = (self.pop() & 0xFF) << 16
+			return page | self.pop()
+		if mnemonic in ('prts', 'prtd'):
+			page = (self.pop() & 0xFF) << 16
+		target = page | self.pop()
+		if mnemonic in ('rtd', 'prtd'):
+			self.regs[7] = (self.regs[7] + insn.imm) & 0xFFFF
+		return target
+
+	def _scb(self, insn):
+		if insn.mnemonic == 'scb/ne' and not self.ccr & Z:
+			return None
+		if insn.mnemonic == 'scb/eq' and self.ccr & Z:
+			return None
+		value = (self.regs[insn.reg] - 1) & 0xFFFF
+		self.regs[insn.reg] = value
+		if value != 0xFFFF:
+			return insn.target
+		return None
+
+	def _stm(self, insn):
+		for reg in range(7, -1, -1):
+			if insn.imm & (1 << reg):
+				self.push(self.regs[reg])
+
+	def _ldm(self, insn):
+		for reg in range(8):
+			if insn.imm & (1 << reg):
+				self.regs[reg] = self.pop()
+
+	def _link(self, insn):
+		self.push(self.regs[6])
+		self.regs[6] = self.regs[7]
+		imm = insn.imm
+		if insn.opsize == 1 and imm & 0x80:
+			imm = imm - 0x100
+		elif insn.opsize == 2 and imm & 0x8000:
+			imm = imm - 0x10000
+		self.regs[7] = (self.regs[7] + imm) & 0xFFFF
+
+	def _unlk(self, insn):
+		self.regs[7] = self.regs[6]
+		self.regs[6] = self.pop()
+
+	def _unsupported(self, insn):
+		raise EmulationError('%s at %X is not emulated' % (h8_decoder.formatInsn(insn), insn.address))
+
+	def _handler(self, insn):
+		#Picks the method executing an instruction, done once per instruction when its block is cached
+		mnemonic = insn.mnemonic
+		flow = insn.flow
+		if flow == h8_decoder.FLOW_INVALID:
+			return self._unsupported
+		if flow == h8_decoder.FLOW_BRANCH:
+			return self._scb if mnemonic.startswith('scb') else self._branch
+		if flow in (h8_decoder.FLOW_JUMP, h8_decoder.FLOW_INDIRECT_JUMP):
+			return self._jump
+		if flow == h8_decoder.FLOW_CALL or flow == h8_decoder.FLOW_INDIRECT_CALL and mnemonic != 'trapa':
+			return self._call
+		if flow == h8_decoder.FLOW_RETURN:
+			return self._return
+		if mnemonic == 'brn':
+			return self._nop
+		return _HANDLERS.get(mnemonic, Emulator._unsupported).__get__(self)
+
+	def _block(self, pc):
+		#Decodes the instructions from pc up to the first one that changes the flow
+		block = []
+		addr = pc
+		while True:
+			offset = h8_rom.romOffset(addr)
+			if offset < 0:
+				raise EmulationError('Execution left the ROM at %X' % addr)
+			insn = h8_decoder.decode(self._data, offset, addr)
+			block.append((insn, self._handler(insn)))
+			if insn.flow != h8_decoder.FLOW_NORMAL or len(block) >= 64:
+				break
+			addr = (addr & 0xFF0000) | ((addr + insn.size) & 0xFFFF)
+		block = tuple(block)
+		self._blocks[pc] = block
+		return block
+
+	def run(self, pc, stopAt=(), stepOver=True, follow=()):
+		"""
+		Runs from pc until an address in stopAt is reached and returns that address
+
+		Calls are stepped over when stepOver is set unless their target is in follow.
+		Raises EmulationError when an instruction cannot be emulated or maxInsns is exceeded.
+		"""
+		self.stepOver = stepOver
+		self.follow = frozenset(follow)
+		stopAt = frozenset(stopAt)
+		blocks = self._blocks
+		self.pc = pc
+		while True:
+			block = blocks.get(pc)
+			if block is None:
+				block = self._block(pc)
+			for insn, handler in block:
+				if insn.address in stopAt:
+					self.pc = insn.address
+					return insn.address
+				self.executed = self.executed + 1
+				if self.executed > self.maxInsns:
+					raise EmulationError('Gave up after %d instructions at %X' % (self.maxInsns, insn.address))
+				target = handler(insn)
+				if target is not None:
+					pc = target
+					break
+			else:
+				last = block[-1][0]
+				pc = (last.address & 0xFF0000) | ((last.address + last.size) & 0xFFFF)
+			if pc in stopAt:
+				self.pc = pc
+				return pc
+
+	def call(self, entry, far=False):
+		"""
+		Calls the routine at entry with the current registers and runs it, including its subroutines, until it returns
+		far pushes the return address as pjsr does for routines returning with prts
+		"""
+		self.push(_RETURN)
+		if far:
+			self.push(_RETURN_PAGE)
+			stop = (_RETURN_PAGE << 16) | _RETURN
+		else:
+			stop = (entry & 0xFF0000) | _RETURN
+		return self.run(entry, (stop,), False)
+
+_HANDLERS = {
+	'mov:g': Emulator._mov,
+	'cmp:g': Emulator._cmp,
+	'add:g': Emulator._arithmetic,
+	'addx': Emulator._arithmetic,
+	'sub': Emulator._arithmetic,
+	'subx': Emulator._arithmetic,
+	'or': Emulator._arithmetic,
+	'and': Emulator._arithmetic,
+	'xor': Emulator._arithmetic,
+	'adds': Emulator._addsSubs,
+	'subs': Emulator._addsSubs,
+	'add:q': Emulator._addq,
+	'mulxu': Emulator._mulxu,
+	'divxu': Emulator._divxu,
+	'ldc': Emulator._control,
+	'stc': Emulator._control,
+	'orc': Emulator._control,
+	'andc': Emulator._control,
+	'xorc': Emulator._control,
+	'bset': Emulator._bit,
+	'bclr': Emulator._bit,
+	'bnot': Emulator._bit,
+	'btst': Emulator._bit,
+	'mov:e': Emulator._short,
+	'mov:i': Emulator._short,
+	'cmp:e': Emulator._short,
+	'cmp:i': Emulator._short,
+	'mov:l': Emulator._short,
+	'mov:s': Emulator._short,
+	'mov:f': Emulator._short,
+	'nop': Emulator._nop,
+	'stm': Emulator._stm,
+	'ldm': Emulator._ldm,
+	'link': Emulator._link,
+	'unlk': Emulator._unlk,
+}
+for _mnemonic in h8_decoder.OP_SINGLE:
+	_HANDLERS[_mnemonic] = Emulator._single
+#Not emulated, see the module docstring
+for _mnemonic in ('movfpe', 'movtpe', 'trapa'):
+	_HANDLERS[_mnemonic] = Emulator._unsupported
+
+def _knownAddress(name):
+	for function in h8_analysis.KNOWN_FUNCTIONS:
+		if function.name == name:
+			return function.address
+	raise KeyError(name)
+
+COPY_FLASH_CODE = _knownAddress('copy_flash_code')
+
+def callSites(disassembly, target):
+	"""
+	Returns the instructions calling target in address order
+	"""
+	return sorted((insn for insn in disassembly.insns.values()
+		if insn.flow == h8_decoder.FLOW_CALL and insn.target == target), key=lambda insn: insn.address)
+
+def flashCopy(rom, disassembly=None, routine=COPY_FLASH_CODE, maxInsns=100000):
+	"""
+	Resolves what copy_flash_code copies into RAM
+
+	Every caller of the routine is emulated from the start of its function, or failing
+	that from the start of the call's basic block, up to the call. R4 and R1 at the call
+	give the start and end of the source in the page EP is set to, which the routine reads
+	the source through. The routine is then run to
+	find the destination and length from the bytes it writes to RAM. When the routine
+	cannot be emulated the destination is None and length is end - start.
+
+	A result whose start is not backed by the ROM or whose length is not positive is
+	dropped and the next entry or call is tried. Returns a FlashCopy or None when no call
+	could be resolved.
+	"""
+	if disassembly is None:
+		disassembly = h8_decoder.disassemble(rom)
+	emulator = Emulator(rom, maxInsns)
+
+	for site in callSites(disassembly, routine):
+		entries = []
+		entry = disassembly.functionContaining(site.address)
+		if entry is not None:
+			entries.append(entry)
+		block = disassembly.blockContaining(site.address)
+		if block is not None and block.start not in entries:
+			entries.append(block.start)
+
+		for entry in entries:
+			emulator.reset()
+			try:
+				emulator.run(entry, (site.address,))
+			except EmulationError:
+				continue
+			page = emulator.ep << 16
+			start = page | emulator.regs[4]
+			end = page | emulator.regs[1]
+
+			destination = None
+			length = end - start
+			emulator.writes.clear()
+			try:
+				emulator.call(routine, site.mnemonic == 'pjsr')
+				ram = [addr for addr in emulator.writes if h8_rom.RAM_START <= addr < h8_rom.RAM_END]
+				if ram:
+					destination = min(ram)
+					length = max(ram) - destination + 1
+			except EmulationError:
+				pass
+			if length <= 0 or h8_rom.romOffset(start) < 0:
+				#Not a range of the ROM, EP or the registers were not set up from this entry
+				continue
+			return FlashCopy(site.address, start, end, destination, length)
+	return None
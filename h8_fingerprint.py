@@ -0,0 +1,287 @@
+"""
+Masked function fingerprints
+
+Known functions move and change slightly between ROM revisions so they are recognised by
+what their code does rather than where it is. Every instruction of a decoded function is
+reduced to a token with its absolute addresses, branch targets, immediates and large
+displacements masked out, e.g. both of
+   15 FE 97 D0    bclr.b  #0, @0xFE97
+   15 FE 99 D0    bclr.b  #0, @0xFE99
+become bclr.b #0, @abs16. Overlapping runs of SHINGLE tokens are hashed into a MinHash
+signature whose matching rows estimate the Jaccard similarity of two functions.
+
+FingerprintLibrary holds the signatures of named functions and a locality sensitive hashing
+index, BANDS bands of ROWS rows each kept as a sorted array of band hashes, so all the
+functions of a ROM are matched against the library with a few searchsorted calls.
+
+	python h8_fingerprint.py build LIBRARY.npz ROM [ROM ...]
+	python h8_fingerprint.py match LIBRARY.npz ROM
+
+build names the fixed address and signature matched functions of each ROM, see
+h8_analysis.knownFunctions().
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import zlib
+
+import numpy
+
+import h8_analysis
+import h8_decoder
+import h8_rom
+
+SHINGLE = 3
+#Functions shorter than this are too common to identify (rts, rte, ...)
+MIN_INSNS = 3
+
+BANDS = 16
+ROWS = 4
+HASHES = BANDS * ROWS
+#Mersenne prime of the MinHash permutations
+PRIME = (1 << 31) - 1
+#Fixed seed so signatures built anywhere can be compared
+SEED = 0x8500
+
+#Match of a library function in a ROM, score is the estimated Jaccard similarity
+FunctionMatch = collections.namedtuple('FunctionMatch', 'name address score comment')
+
+def _permutations():
+	state = numpy.random.RandomState(SEED)
+	a = state.randint(1, PRIME, HASHES).astype(numpy.uint64)
+	b = state.randint(0, PRIME, HASHES).astype(numpy.uint64)
+	#Multipliers combining the rows of a band into one band hash
+	rows = state.randint(1, PRIME, ROWS).astype(numpy.uint64) | numpy.uint64(1)
+	return a, b, rows
+
+_A, _B, _ROW_MULTIPLIERS = _permutations()
+
+def token(insn):
+	"""
+	Returns the 32 bit hash of an instruction with its addresses and immediates masked
+	"""
+	ea = insn.ea
+	value = insn.value
+	if ea in (h8_decoder.EA_ABS8, h8_decoder.EA_ABS16, h8_decoder.EA_IMM) or insn.flow == h8_decoder.FLOW_INVALID:
+		value = None
+	elif ea == h8_decoder.EA_DISP and not -0x80 <= value <= 0xFF:
+		value = None
+	imm = insn.imm
+	if insn.mnemonic in h8_decoder.IMMEDIATE_MNEMONICS or imm is not None and imm > 0xFF:
+		imm = None
+	text = '%s %s %s %s %s %s %s %s' % (insn.mnemonic, insn.opsize, ea, insn.eareg, value, insn.reg, imm, insn.flow)
+	return zlib.crc32(text.encode('ascii')) & 0xFFFFFFFF
+
+def functionTokens(disassembly, entry):
+	"""
+	Returns the tokens of every instruction of a function in address order
+	"""
+	blocks = disassembly.blocks()
+	addrs = set()
+	for start in disassembly.functionBlocks(entry):
+		addrs.update(blocks[start].insns)
+	insns = disassembly.insns
+	return [token(insns[addr]) for addr in sorted(addrs)]
+
+def shingles(tokens):
+	"""
+	Returns the hashes of every run of SHINGLE tokens, the whole function when it is shorter
+	"""
+	if len(tokens) <= SHINGLE:
+		runs = [tokens]
+	else:
+		runs = [tokens[i:i + SHINGLE] for i in range(len(tokens) - SHINGLE + 1)]
+	return sorted(set(zlib.crc32(' '.join('%08X' % t for t in run).encode('ascii')) & 0xFFFFFFFF for run in runs))
+
+def minhash(shingleLists):
+	"""
+	Returns a (len(shingleLists), HASHES) uint64 MinHash matrix, all lists are hashed in one NumPy operation
+	"""
+	count = len(shingleLists)
+	if count == 0:
+		return numpy.zeros((0, HASHES), numpy.uint64)
+	lengths = numpy.array([len(s) for s in shingleLists])
+	values = numpy.concatenate([numpy.asarray(s, numpy.uint64) for s in shingleLists])
+	hashed = (_A[:, None] * values[None, :] + _B[:, None]) % numpy.uint64(PRIME)
+	starts = numpy.concatenate(([0], numpy.cumsum(lengths)[:-1]))
+	return numpy.minimum.reduceat(hashed, starts, axis=1).T.copy()
+
+def bandHashes(signatures):
+	"""
+	Returns the (N, BANDS) uint64 band hashes of a MinHash matrix
+	"""
+	rows = signatures.reshape(len(signatures), BANDS, ROWS)
+	return (rows * _ROW_MULTIPLIERS).sum(axis=2, dtype=numpy.uint64)
+
+Fingerprints = collections.namedtuple('Fingerprints', 'addresses signatures exact sizes')
+
+def fingerprintFunctions(disassembly, entries=None, minInsns=MIN_INSNS):
+	"""
+	Returns the Fingerprints of the functions of a Disassembly (all of them by default)
+	exact is a hash of the whole token sequence, sizes the instruction counts
+	"""
+	if entries is None:
+		entries = sorted(disassembly.functions)
+	addresses = []
+	lists = []
+	exact = []
+	sizes = []
+	for entry in entries:
+		if entry not in disassembly.insns:
+			continue
+		tokens = functionTokens(disassembly, entry)
+		if len(tokens) < minInsns:
+			continue
+		addresses.append(entry)
+		lists.append(shingles(tokens))
+		exact.append(zlib.crc32(' '.join('%08X' % t for t in tokens).encode('ascii')) & 0xFFFFFFFF)
+		sizes.append(len(tokens))
+	return Fingerprints(numpy.array(addresses, numpy.int64), minhash(lists),
+		numpy.array(exact, numpy.uint32), numpy.array(sizes, numpy.int32))
+
+class FingerprintLibrary(object):
+	"""
+	Named function fingerprints with an LSH index
+	"""
+
+	def __init__(self):
+		self.names = []
+		self.comments = []
+		self.signatures = numpy.zeros((0, HASHES), numpy.uint64)
+		self.exact = numpy.zeros(0, numpy.uint32)
+		self.sizes = numpy.zeros(0, numpy.int32)
+		self._index = None
+
+	def __len__(self):
+		return len(self.names)
+
+	def add(self, names, comments, fingerprints):
+		"""
+		Adds fingerprints, names and comments are lists in the same order as fingerprints.addresses
+		"""
+		self.names.extend(names)
+		self.comments.extend(comments)
+		self.signatures = numpy.concatenate((self.signatures, fingerprints.signatures))
+		self.exact = numpy.concatenate((self.exact, fingerprints.exact))
+		self.sizes = numpy.concatenate((self.sizes, fingerprints.sizes))
+		self._index = None
+
+	def addRom(self, disassembly, functions):
+		"""
+		Adds the functions of a disassembled ROM, functions is a list of {'address', 'name', 'comment'}
+		like h8_analysis.knownFunctions() returns. Functions too short to fingerprint are skipped
+		"""
+		named = dict((f['address'], f) for f in functions)
+		fingerprints = fingerprintFunctions(disassembly, sorted(named))
+		found = [named[int(a)] for a in fingerprints.addresses]
+		self.add([f['name'] for f in found], [f.get('comment', '') for f in found], fingerprints)
+		return len(found)
+
+	def _bands(self):
+		#Per band the sorted band hashes and the library row each one came from
+		if self._index is None:
+			hashes = bandHashes(self.signatures)
+			order = numpy.argsort(hashes, axis=0, kind='mergesort')
+			self._index = (numpy.take_along_axis(hashes, order, axis=0), order)
+		return self._index
+
+	def candidates(self, signatures):
+		"""
+		Returns (query rows, library rows) of the pairs sharing at least one band
+		"""
+		sortedHashes, order = self._bands()
+		queries = bandHashes(signatures)
+		pairs = []
+		for band in range(BANDS):
+			column = sortedHashes[:, band]
+			lo = numpy.searchsorted(column, queries[:, band], 'left')
+			hi = numpy.searchsorted(column, queries[:, band], 'right')
+			counts = hi - lo
+			if not counts.any():
+				continue
+			rows = numpy.repeat(numpy.arange(len(queries)), counts)
+			offsets = numpy.repeat(lo - numpy.cumsum(counts) + counts, counts) + numpy.arange(counts.sum())
+			pairs.append(rows * len(self) + order[offsets, band])
+		if not pairs:
+			empty = numpy.zeros(0, numpy.int64)
+			return empty, empty
+		pairs = numpy.unique(numpy.concatenate(pairs))
+		return pairs // len(self), pairs % len(self)
+
+	def match(self, fingerprints, threshold=0.5):
+		"""
+		Returns the best FunctionMatch of every library name found in fingerprints, best score first
+		Each function is given at most one name, exact token matches score 1.0
+		"""
+		if len(self) == 0 or len(fingerprints.addresses) == 0:
+			return []
+		queries, rows = self.candidates(fingerprints.signatures)
+		scores = (fingerprints.signatures[queries] == self.signatures[rows]).mean(axis=1)
+		scores[fingerprints.exact[queries] == self.exact[rows]] = 1.0
+		keep = scores >= threshold
+		queries, rows, scores = queries[keep], rows[keep], scores[keep]
+
+		matches = []
+		usedNames = set()
+		usedAddresses = set()
+		for i in numpy.argsort(-scores, kind='mergesort'):
+			name = self.names[rows[i]]
+			address = int(fingerprints.addresses[queries[i]])
+			if name in usedNames or address in usedAddresses:
+				continue
+			usedNames.add(name)
+			usedAddresses.add(address)
+			matches.append(FunctionMatch(name, address, float(scores[i]), self.comments[rows[i]]))
+		return matches
+
+	def matchRom(self, disassembly, threshold=0.5):
+		"""
+		Fingerprints every function of a Disassembly and returns its matches
+		"""
+		return self.match(fingerprintFunctions(disassembly), threshold)
+
+	def save(self, path):
+		numpy.savez(path, names=numpy.array(self.names, dtype=object), comments=numpy.array(self.comments, dtype=object),
+			signatures=self.signatures, exact=self.exact, sizes=self.sizes)
+
+	@classmethod
+	def load(cls, path):
+		data = numpy.load(path, allow_pickle=True)
+		library = cls()
+		library.names = [str(n) for n in data['names']]
+		library.comments = [str(c) for c in data['comments']]
+		library.signatures = data['signatures']
+		library.exact = data['exact']
+		library.sizes = data['sizes']
+		return library
+
+def main():
+	parser = argparse.ArgumentParser(description='Build or match a library of function fingerprints')
+	parser.add_argument('command', choices=('build', 'match'))
+	parser.add_argument('library')
+	parser.add_argument('roms', nargs='+')
+	parser.add_argument('--threshold', type=float, default=0.5)
+	args = parser.parse_args()
+
+	if args.command == 'build':
+		library = FingerprintLibrary()
+		for path in args.roms:
+			with h8_rom.RomSpace(path) as rom:
+				count = library.addRom(h8_decoder.disassemble(rom), h8_analysis.knownFunctions(rom))
+			print('%s: %d functions' % (path, count))
+		library.save(args.library)
+		print('Wrote %d fingerprints to %s' % (len(library), args.library))
+		return
+
+	library = FingerprintLibrary.load(args.library)
+	for path in args.roms:
+		with h8_rom.RomSpace(path) as rom:
+			matches = library.matchRom(h8_decoder.disassemble(rom), args.threshold)
+		print(path)
+		for match in matches:
+			print('   %-24s %X %.2f' % (match.name, match.address, match.score))
+
+if __name__ == '__main__':
+	main()
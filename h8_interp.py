@@ -0,0 +1,232 @@
+"""
+Vectorized versions of the ROM's axis_lookup, table_lookup_byte and table_lookup_word routines
+
+axis_lookup turns an input value (RPM, load, temperature, ...) into an 8.8 fixed point index
+into its axis: the high byte is the breakpoint below the value and the low byte how far the
+value is towards the next breakpoint in 1/256ths. Values outside the axis clamp to its ends.
+
+table_lookup_byte/word interpolate between the map cells either side of that index using
+integer arithmetic: a + (b - a) * fraction / 256 computed on the magnitude of the difference
+as the unsigned multiply in the ROM does, then add the map's adder. 3D maps interpolate
+along x in both rows first and then along y. The result is truncated to the cell size like
+the register the routine returns it in, so byte maps wrap past 0xFF once the adder is added.
+
+Every function takes NumPy arrays of inputs so millions of operating points are evaluated
+per call. lookupScalar() steps through the same arithmetic one value at a time.
+emulatedLookup() runs a table_lookup_byte or table_lookup_word routine in h8_emulator
+instead, and validateMap() compares the vectorized lookup with it over a sweep of the axes.
+The only routines it has been run against are the stand-ins h8_synth assembles from this
+same arithmetic, which take the map address in R0. The ROM routines read the table from
+the stack (see h8_analysis.KNOWN_FUNCTIONS) and that convention is not modelled, so this is
+a consistency check of the model and the emulator, not a confirmation against real ROMs.
+
+TODO: Confirm rounding and adder handling against the ROM routines on more ECU families
+"""
+
+import numpy
+
+import h8_analysis
+
+def axisLookup(axis, values):
+	"""
+	Returns the 8.8 fixed point index of every value in an axis
+	axis is the axis_table data (ascending breakpoints), values any integer array
+	"""
+	points = numpy.asarray(axis, dtype=numpy.int64)
+	values = numpy.asarray(values, dtype=numpy.int64)
+	last = len(points) - 1
+	if last < 1:
+		return numpy.zeros(values.shape, dtype=numpy.int64)
+
+	below = numpy.searchsorted(points, values, side='right') - 1
+	below = numpy.clip(below, 0, last - 1)
+	low = points[below]
+	span = points[below + 1] - low
+	span = numpy.where(span == 0, 1, span)
+	fraction = ((values - low) << 8) // span
+	index = (below << 8) + numpy.clip(fraction, 0, 0xFF)
+
+	#Clamp to the ends of the axis
+	index = numpy.where(values <= points[0], 0, index)
+	index = numpy.where(values >= points[last], last << 8, index)
+	return index
+
+def _interpolate(a, b, fraction):
+	#a + (b - a) * fraction / 256 on the magnitude of the difference
+	difference = b - a
+	step = (numpy.abs(difference) * fraction) >> 8
+	return numpy.where(difference >= 0, a + step, a - step)
+
+def _mask(data, size):
+	#Result mask for cells of size bytes, size defaults to the item size of an unsigned array
+	if size is None:
+		dtype = getattr(data, 'dtype', None)
+		if dtype is None or dtype.kind != 'u' or dtype.itemsize > 2:
+			return None
+		size = dtype.itemsize
+	return (1 << (size * 8)) - 1
+
+def lookup2d(data, xIndex, adder=0, size=None):
+	"""
+	Interpolates a 2D map (1D data array) at 8.8 fixed point indices
+	size is the cell size in bytes the result is truncated to, taken from an unsigned data array by default
+	"""
+	mask = _mask(data, size)
+	data = numpy.asarray(data, dtype=numpy.int64)
+	xIndex = numpy.asarray(xIndex, dtype=numpy.int64)
+	last = len(data) - 1
+	x0 = numpy.clip(xIndex >> 8, 0, last)
+	x1 = numpy.minimum(x0 + 1, last)
+	result = _interpolate(data[x0], data[x1], xIndex & 0xFF) + adder
+	return result if mask is None else result & mask
+
+def lookup3d(data, xIndex, yIndex, adder=0, size=None):
+	"""
+	Interpolates a 3D map (2D data array shaped rows x columns) at 8.8 fixed point indices
+	size is the cell size in bytes as for lookup2d()
+	"""
+	mask = _mask(data, size)
+	data = numpy.asarray(data, dtype=numpy.int64)
+	xIndex = numpy.asarray(xIndex, dtype=numpy.int64)
+	yIndex = numpy.asarray(yIndex, dtype=numpy.int64)
+	rows, columns = data.shape
+	x0 = numpy.clip(xIndex >> 8, 0, columns - 1)
+	x1 = numpy.minimum(x0 + 1, columns - 1)
+	y0 = numpy.clip(yIndex >> 8, 0, rows - 1)
+	y1 = numpy.minimum(y0 + 1, rows - 1)
+	xFraction = xIndex & 0xFF
+
+	top = _interpolate(data[y0, x0], data[y0, x1], xFraction)
+	bottom = _interpolate(data[y1, x0], data[y1, x1], xFraction)
+	result = _interpolate(top, bottom, yIndex & 0xFF) + adder
+	return result if mask is None else result & mask
+
+def _size(table):
+	return 2 if table.kind.endswith('word') else 1
+
+def evaluate(table, xAxis, x, yAxis=None, y=None):
+	"""
+	Evaluates an h8_maps.Map for arrays of raw axis inputs
+	xAxis and yAxis are the h8_maps.Axis objects whose outputs are the map's index_x/index_y
+	"""
+	xIndex = axisLookup(xAxis.data, x)
+	if table.indexY is None:
+		return lookup2d(table.data, xIndex, table.adder, _size(table))
+	return lookup3d(table.data, xIndex, axisLookup(yAxis.data, y), table.adder, _size(table))
+
+def sweep(table, xAxis, xs, yAxis=None, ys=None):
+	"""
+	Evaluates a map over every combination of xs and ys and returns a (len(ys), len(xs)) surface
+	2D maps return a 1D array over xs
+	"""
+	xs = numpy.asarray(xs)
+	if table.indexY is None:
+		return evaluate(table, xAxis, xs)
+	gridY, gridX = numpy.meshgrid(numpy.asarray(ys), xs, indexing='ij')
+	return evaluate(table, xAxis, gridX, yAxis, gridY)
+
+def lookupScalar(data, xIndex, yIndex=None, adder=0, size=None):
+	"""
+	Reference implementation of the table lookup for a single point
+	"""
+	mask = _mask(data, size)
+	if mask is None:
+		mask = -1
+
+	def interpolate(a, b, fraction):
+		if b >= a:
+			return a + (((b - a) * fraction) >> 8)
+		return a - (((a - b) * fraction) >> 8)
+
+	if yIndex is None:
+		last = len(data) - 1
+		x0 = min(max(xIndex >> 8, 0), last)
+		x1 = min(x0 + 1, last)
+		return (interpolate(int(data[x0]), int(data[x1]), xIndex & 0xFF) + adder) & mask
+
+	rows, columns = len(data), len(data[0])
+	x0 = min(max(xIndex >> 8, 0), columns - 1)
+	x1 = min(x0 + 1, columns - 1)
+	y0 = min(max(yIndex >> 8, 0), rows - 1)
+	y1 = min(y0 + 1, rows - 1)
+	top = interpolate(int(data[y0][x0]), int(data[y0][x1]), xIndex & 0xFF)
+	bottom = interpolate(int(data[y1][x0]), int(data[y1][x1]), xIndex & 0xFF)
+	return (interpolate(top, bottom, yIndex & 0xFF) + adder) & mask
+
+def _knownAddress(name):
+	for function in h8_analysis.KNOWN_FUNCTIONS:
+		if function.name == name:
+			return function.address
+	raise KeyError(name)
+
+def emulatedLookup(rom, table, routine=None):
+	"""
+	Returns a reference for validate() that runs a lookup routine on an h8_maps.Map in h8_emulator
+
+	routine defaults to table_lookup_byte or table_lookup_word by the map's kind. It is
+	called as h8_synth.lookupRoutine() expects, with the map address in R0 and the
+	indices in the map's RAM variables, and its result is read from R0. The ROM routines
+	take the table on the stack instead, so they cannot be run this way yet. The map is
+	read from the ROM so the data and adder validate() passes are ignored.
+	"""
+	#Imported here so the vectorized lookups do not need the decoder
+	import h8_emulator
+
+	if routine is None:
+		routine = _knownAddress('table_lookup_word' if _size(table) == 2 else 'table_lookup_byte')
+	mask = _mask(None, _size(table))
+	emulator = h8_emulator.Emulator(rom)
+
+	def reference(data, xIndex, yIndex, adder):
+		emulator.reset()
+		emulator.writeWord(table.indexX, xIndex)
+		if yIndex is not None:
+			emulator.writeWord(table.indexY, yIndex)
+		emulator.regs[0] = table.address & 0xFFFF
+		emulator.call(routine, far=True)
+		return emulator.regs[0] & mask
+	return reference
+
+def validateMap(rom, table, xAxis, yAxis=None, count=64):
+	"""
+	Compares evaluate() with an emulated lookup routine (see emulatedLookup()) at count
+	inputs across each axis, and every combination of them for 3D maps unless both axes
+	write the same index variable
+	Returns the list of (x, y, vectorized, reference) indices and results that differ
+	"""
+	def indices(axis):
+		points = numpy.asarray(axis.data, dtype=numpy.int64)
+		values = numpy.linspace(int(points.min()) - 1, int(points.max()) + 1, count).astype(numpy.int64)
+		return numpy.unique(axisLookup(points, values))
+
+	xIndex = indices(xAxis)
+	yIndex = None
+	if table.indexY == table.indexX:
+		#Both indices come from the same variable
+		yIndex = xIndex
+	elif table.indexY is not None:
+		yIndex, xIndex = [grid.ravel() for grid in numpy.meshgrid(indices(yAxis), xIndex, indexing='ij')]
+	return validate(table.data, xIndex, yIndex, table.adder, emulatedLookup(rom, table), _size(table))
+
+def validate(data, xIndex, yIndex=None, adder=0, reference=None, size=None):
+	"""
+	Compares the vectorized lookup with reference(data, x, y, adder) at every sample index
+	reference defaults to lookupScalar() with the same size
+	Returns the list of (x, y, vectorized, reference) that differ
+	"""
+	if reference is None:
+		reference = lambda data, x, y, adder: lookupScalar(data, x, y, adder, size)
+	xIndex = numpy.asarray(xIndex)
+	if yIndex is None:
+		results = lookup2d(data, xIndex, adder, size)
+		ys = [None] * len(xIndex)
+	else:
+		yIndex = numpy.asarray(yIndex)
+		results = lookup3d(data, xIndex, yIndex, adder, size)
+		ys = [int(y) for y in yIndex]
+	mismatches = []
+	for x, y, result in zip(xIndex, ys, results):
+		expected = reference(data, int(x), y, adder)
+		if expected != int(result):
+			mismatches.append((int(x), y, int(result), expected))
+	return mismatches
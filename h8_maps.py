@@ -0,0 +1,164 @@
+"""
+Extracts calibration maps described by the structures createStructs() defines
+
+   map_3d_byte  dimensions.b adder.b index_x.w index_y.w nrows.b data[]
+   map_3d_word  dimensions.w adder.w index_x.w index_y.w nrows.w data[]
+   map_2d_byte  dimensions.b adder.b index_x.w data[]
+   map_2d_word  dimensions.w adder.w index_x.w data[]
+   axis_table   output.w input.w length.w data[length]
+
+index_x and index_y are the RAM variables axis_lookup stores an axis index in, so the
+length of a map along an axis is the length of the axis_table whose output is that
+variable. nrows is the number of values in each row of a 3D map (its row stride).
+
+Map and axis data are returned as NumPy arrays viewed straight over the ROM buffer with
+big endian dtypes, nothing is copied. Keep the RomSpace open while the arrays are in use.
+"""
+
+import collections
+
+import numpy
+
+import h8_rom
+
+Axis = collections.namedtuple('Axis', 'address output input length data')
+Map = collections.namedtuple('Map', 'address kind dimensions adder indexX indexY nrows data')
+
+#Header layout per structure: (header fields, data dtype)
+#Each header field is (name, offset, size)
+STRUCTS = {
+	'map_3d_byte': ((('dimensions', 0, 1), ('adder', 1, 1), ('index_x', 2, 2), ('index_y', 4, 2), ('nrows', 6, 1)), numpy.dtype('u1')),
+	'map_3d_word': ((('dimensions', 0, 2), ('adder', 2, 2), ('index_x', 4, 2), ('index_y', 6, 2), ('nrows', 8, 2)), numpy.dtype('>u2')),
+	'map_2d_byte': ((('dimensions', 0, 1), ('adder', 1, 1), ('index_x', 2, 2)), numpy.dtype('u1')),
+	'map_2d_word': ((('dimensions', 0, 2), ('adder', 2, 2), ('index_x', 4, 2)), numpy.dtype('>u2')),
+	'axis_table': ((('output', 0, 2), ('input', 2, 2), ('length', 4, 2)), numpy.dtype('>u2')),
+}
+
+def headerSize(kind):
+	fields = STRUCTS[kind][0]
+	name, offset, size = fields[-1]
+	return offset + size
+
+def readHeader(rom, address, kind):
+	"""
+	Returns {field: value} for the header of a structure
+	"""
+	header = {}
+	for name, offset, size in STRUCTS[kind][0]:
+		header[name] = rom.Byte(address + offset) if size == 1 else rom.Word(address + offset)
+	return header
+
+def _array(rom, address, dtype, count):
+	#Zero copy view of count values at address
+	end = address + count * dtype.itemsize
+	offset = h8_rom.romOffset(address)
+	if count < 0 or offset < 0 or h8_rom.romOffset(end - 1) != offset + count * dtype.itemsize - 1:
+		raise ValueError('Data at %X-%X is not backed by the ROM' % (address, end))
+	return numpy.frombuffer(rom.buffer, dtype, count, offset)
+
+def readAxis(rom, address):
+	"""
+	Reads the axis_table at address
+	"""
+	header = readHeader(rom, address, 'axis_table')
+	data = _array(rom, address + headerSize('axis_table'), STRUCTS['axis_table'][1], header['length'])
+	return Axis(address, header['output'], header['input'], header['length'], data)
+
+def axisIndex(axes):
+	"""
+	Returns {output RAM variable: Axis} so maps can find the length of their axes
+	"""
+	return dict((axis.output, axis) for axis in axes)
+
+def readMap(rom, address, kind, axes=None, rows=None, columns=None):
+	"""
+	Reads the map of the given kind at address
+
+	The data is shaped (rows, columns) for 3D maps and (columns,) for 2D maps.
+	columns defaults to nrows for 3D maps and to the length of the index_x axis for 2D maps.
+	rows defaults to the length of the index_y axis. axes is a dict from axisIndex().
+	"""
+	if kind not in STRUCTS or kind == 'axis_table':
+		raise ValueError('Unknown map kind %s' % kind)
+	fields, dtype = STRUCTS[kind]
+	header = readHeader(rom, address, kind)
+	dataAddress = address + headerSize(kind)
+	indexY = header.get('index_y')
+	nrows = header.get('nrows')
+
+	if columns is None:
+		if nrows is not None:
+			columns = nrows
+		elif axes is not None and header['index_x'] in axes:
+			columns = axes[header['index_x']].length
+		else:
+			raise ValueError('Map %X has no axis for index_x %04X' % (address, header['index_x']))
+
+	if indexY is None:
+		data = _array(rom, dataAddress, dtype, columns)
+	else:
+		if rows is None:
+			if axes is None or indexY not in axes:
+				raise ValueError('Map %X has no axis for index_y %04X' % (address, indexY))
+			rows = axes[indexY].length
+		data = _array(rom, dataAddress, dtype, rows * columns).reshape(rows, columns)
+
+	return Map(address, kind, header['dimensions'], header['adder'], header['index_x'], indexY, nrows, data)
+
+def extractMaps(rom, catalogue, axisAddresses=()):
+	"""
+	Reads every axis and map of a ROM at once
+
+	catalogue is an iterable of (address, kind). Returns ({address: Axis}, {address: Map}).
+	Maps whose axes cannot be found or whose data runs outside the ROM are skipped.
+	"""
+	axes = {}
+	for address in axisAddresses:
+		try:
+			axes[address] = readAxis(rom, address)
+		except ValueError:
+			continue
+	index = axisIndex(axes.values())
+
+	maps = {}
+	for address, kind in catalogue:
+		try:
+			maps[address] = readMap(rom, address, kind, index)
+		except ValueError:
+			continue
+	return axes, maps
+
+def extractFleet(paths, catalogue, axisAddresses=()):
+	"""
+	Generator yielding (path, {address: Axis}, {address: Map}) for every ROM in paths
+
+	The arrays are views over each ROM's mmap which is released once they are no longer referenced.
+	"""
+	for path in paths:
+		rom = h8_rom.RomSpace(path)
+		axes, maps = extractMaps(rom, catalogue, axisAddresses)
+		yield path, axes, maps
+		del axes, maps
+		rom.close()
+
+def stackMaps(results, address):
+	"""
+	Stacks the data of the map at address from several extractMaps() results into one array
+	so calibrations can be compared with a single NumPy expression. Only maps with the same
+	shape as the first one are stacked, returns (indices of the results used, array).
+	"""
+	arrays = []
+	used = []
+	shape = None
+	for i, maps in enumerate(results):
+		found = maps.get(address)
+		if found is None:
+			continue
+		if shape is None:
+			shape = found.data.shape
+		if found.data.shape == shape:
+			arrays.append(found.data)
+			used.append(i)
+	if not arrays:
+		return used, None
+	return used, numpy.stack(arrays)
@@ -0,0 +1,224 @@
+"""
+Calibration map discovery
+
+Finds every axis_table and map_* structure (see h8_maps.STRUCTS) in pages 1 and 2 in one
+pass. The H8/500 reads words from even addresses only so every structure starts on a word
+boundary, and the dump is viewed as 0x10000 big endian words with NumPy. Each test below is
+evaluated for every word offset at once:
+
+   axis_table   output in RAM, input in RAM or the registers, 2 to MAX_LENGTH breakpoints
+                that are strictly ascending or descending and end inside the ROM
+   map_*        1 to MAX_DIMENSIONS dimensions, index_x (and index_y) the output of an axis
+                found above, nrows of 3D maps equal to the index_x axis length and data
+                that ends inside the ROM
+
+Candidates are then confirmed against the code: a structure is confirmed when its address
+is loaded as an immediate in the instructions before a call to table_lookup_byte,
+table_lookup_word or axis_lookup.
+
+	python h8_mapscan.py ROM [ROM ...] [--all] [--json OUT_DIR]
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import json
+import os
+
+import numpy
+
+import h8_analysis
+import h8_decoder
+import h8_rom
+
+MAX_LENGTH = 0x20
+MAX_DIMENSIONS = 3
+
+#Instructions before a lookup call searched for the structure address
+CONFIRM_WINDOW = 8
+
+#Routine names, the address they are found at is taken from KNOWN_FUNCTIONS unless given
+LOOKUP_ROUTINES = {
+	'axis_lookup': ('axis_table',),
+	'table_lookup_byte': ('map_3d_byte', 'map_2d_byte'),
+	'table_lookup_word': ('map_3d_word', 'map_2d_word'),
+}
+
+#Kinds in the order they are preferred when several match at one address
+MAP_KINDS = ('map_3d_word', 'map_3d_byte', 'map_2d_word', 'map_2d_byte')
+
+#columns is the x axis length, rows the y axis length (1 for 2D maps, the breakpoints for axes)
+Structure = collections.namedtuple('Structure', 'address kind columns rows confirmed')
+
+def _shifted(array, offset, fill=0):
+	#array[i + offset] for every i, fill past the end
+	shifted = numpy.full(len(array), fill, array.dtype)
+	shifted[:len(array) - offset] = array[offset:]
+	return shifted
+
+def _runs(flags):
+	#Number of consecutive True values starting at every index
+	size = len(flags)
+	nextFalse = numpy.where(flags, size, numpy.arange(size))
+	nextFalse = numpy.minimum.accumulate(nextFalse[::-1])[::-1]
+	return nextFalse - numpy.arange(size)
+
+def _inRam(values):
+	return (values >= h8_rom.RAM_START) & (values < h8_rom.RAM_END)
+
+def findAxes(words):
+	"""
+	Returns (word indices, lengths) of every plausible axis_table in a big endian word array
+	"""
+	size = len(words)
+	output = words
+	inputs = _shifted(words, 1)
+	length = _shifted(words, 2).astype(numpy.int64)
+	index = numpy.arange(size)
+	ok = _inRam(output) & (inputs >= h8_rom.RAM_START) & (inputs < h8_rom.REGISTERS_END - 1)
+	ok &= (length >= 2) & (length <= MAX_LENGTH) & (index + 3 + length <= size)
+
+	#Breakpoints from index + 3 on, strictly monotonic over length - 1 steps
+	ascending = _runs(numpy.append(words[1:] > words[:-1], False))
+	descending = _runs(numpy.append(words[1:] < words[:-1], False))
+	steps = numpy.maximum(_shifted(ascending, 3), _shifted(descending, 3))
+	ok &= steps >= length - 1
+	found = numpy.nonzero(ok)[0]
+	return found, length[found]
+
+def findMaps(data, words, outputs, lengths):
+	"""
+	Returns {kind: (word indices, columns, rows)} for every plausible map header
+	outputs and lengths are the axis output variables and their lengths from findAxes()
+	"""
+	size = len(words)
+	byteSize = len(data)
+	axisLength = numpy.zeros(0x10000, numpy.int64)
+	axisLength[outputs] = lengths
+	index = numpy.arange(size)
+	bytes0 = data[0::2].astype(numpy.int64)
+	bytes1 = data[1::2].astype(numpy.int64)
+	byteAt6 = _shifted(bytes0, 3)
+
+	found = {}
+	for kind in MAP_KINDS:
+		word = kind.endswith('word')
+		#Header fields as (dimensions, index_x, index_y or None, nrows or None, header bytes)
+		if kind == 'map_3d_word':
+			fields = (words, _shifted(words, 2), _shifted(words, 3), _shifted(words, 4), 10)
+		elif kind == 'map_3d_byte':
+			fields = (bytes0, _shifted(words, 1), _shifted(words, 2), byteAt6, 7)
+		elif kind == 'map_2d_word':
+			fields = (words, _shifted(words, 2), None, None, 6)
+		else:
+			fields = (bytes0, _shifted(words, 1), None, None, 4)
+		dimensions, indexX, indexY, nrows, headerSize = fields
+
+		columns = axisLength[indexX]
+		ok = (dimensions >= 1) & (dimensions <= MAX_DIMENSIONS) & (columns > 0)
+		if indexY is None:
+			rows = numpy.ones(size, numpy.int64)
+		else:
+			rows = axisLength[indexY]
+			ok &= (rows > 0) & (nrows.astype(numpy.int64) == columns)
+		ok &= index * 2 + headerSize + columns * rows * (2 if word else 1) <= byteSize
+		hits = numpy.nonzero(ok)[0]
+		found[kind] = (hits, columns[hits], rows[hits])
+	return found
+
+def lookupReferences(disassembly, lookups=None):
+	"""
+	Returns {kind: set of 16 bit values} loaded as immediates within CONFIRM_WINDOW instructions
+	before a call to a lookup routine, lookups maps routine names to addresses
+	"""
+	if lookups is None:
+		lookups = dict((f.name, f.address) for f in h8_analysis.KNOWN_FUNCTIONS if f.name in LOOKUP_ROUTINES)
+	kinds = dict((address, LOOKUP_ROUTINES[name]) for name, address in lookups.items())
+	references = collections.defaultdict(set)
+	insns = disassembly.insns
+	for block in disassembly.blocks().values():
+		recent = collections.deque(maxlen=CONFIRM_WINDOW)
+		for addr in block.insns:
+			insn = insns[addr]
+			if insn.flow == h8_decoder.FLOW_CALL and insn.target in kinds:
+				for kind in kinds[insn.target]:
+					references[kind].update(recent)
+				recent.clear()
+			elif insn.mnemonic in h8_decoder.IMMEDIATE_MNEMONICS:
+				recent.append(insn.imm & 0xFFFF)
+			elif insn.ea == h8_decoder.EA_IMM:
+				recent.append(insn.value & 0xFFFF)
+	return references
+
+def scanMaps(rom, disassembly=None, lookups=None, confirmedOnly=True):
+	"""
+	Returns (axes, maps), lists of Structure in address order
+	disassembly defaults to a h8_decoder disassembly of the ROM, with confirmedOnly False
+	candidates no code was found looking up are returned too
+	"""
+	data = numpy.frombuffer(rom.buffer, numpy.uint8, h8_rom.ROM_SIZE)
+	words = data.view('>u2').astype(numpy.int64)
+	if disassembly is None:
+		disassembly = h8_decoder.disassemble(rom)
+	references = lookupReferences(disassembly, lookups)
+
+	def structures(kind, hits, columns, rows):
+		found = []
+		confirmed = references.get(kind, ())
+		for i, x, y in zip(hits, columns, rows):
+			address = h8_rom.ROM_START + int(i) * 2
+			isConfirmed = (address & 0xFFFF) in confirmed
+			if isConfirmed or not confirmedOnly:
+				found.append(Structure(address, kind, int(x), int(y), isConfirmed))
+		return found
+
+	axisHits, axisLengths = findAxes(words)
+	axes = structures('axis_table', axisHits, axisLengths, numpy.ones(len(axisHits), numpy.int64))
+	#Maps are only matched against axes the code uses unless every candidate is wanted
+	used = numpy.array([(a.address - h8_rom.ROM_START) // 2 for a in axes], numpy.int64)
+	outputs = words[used]
+	lengths = numpy.array([a.columns for a in axes], numpy.int64)
+
+	byAddress = {}
+	for kind, (hits, columns, rows) in findMaps(data, words, outputs, lengths).items():
+		for structure in structures(kind, hits, columns, rows):
+			current = byAddress.get(structure.address)
+			if current is None or (structure.confirmed, -MAP_KINDS.index(structure.kind)) > (current.confirmed, -MAP_KINDS.index(current.kind)):
+				byAddress[structure.address] = structure
+	return axes, [byAddress[a] for a in sorted(byAddress)]
+
+def catalogue(rom, disassembly=None, lookups=None, confirmedOnly=True):
+	"""
+	Returns the map catalogue of a ROM as a JSON serialisable dict
+	'maps' holds (address, kind) pairs and 'axes' addresses as h8_maps.extractMaps() takes them
+	"""
+	axes, maps = scanMaps(rom, disassembly, lookups, confirmedOnly)
+	return {
+		'axes': [a.address for a in axes],
+		'maps': [(m.address, m.kind) for m in maps],
+		'structures': [m._asdict() for m in axes + maps],
+	}
+
+def main():
+	parser = argparse.ArgumentParser(description='Find the calibration maps of ROM dumps')
+	parser.add_argument('roms', nargs='+')
+	parser.add_argument('--all', action='store_true', help='include candidates not confirmed by a lookup call')
+	parser.add_argument('--json', default=None, help='directory to write <rom>.maps.json to')
+	args = parser.parse_args()
+
+	for path in args.roms:
+		with h8_rom.RomSpace(path) as rom:
+			found = catalogue(rom, confirmedOnly=not args.all)
+		if args.json is not None:
+			if not os.path.isdir(args.json):
+				os.makedirs(args.json)
+			with open(os.path.join(args.json, os.path.basename(path) + '.maps.json'), 'w') as f:
+				json.dump(found, f, indent=1, sort_keys=True)
+		print('%s: %d axes, %d maps' % (path, len(found['axes']), len(found['maps'])))
+		for structure in found['structures']:
+			print('   %X %-12s %2d x %-2d %s' % (structure['address'], structure['kind'], structure['columns'],
+				structure['rows'], '' if structure['confirmed'] else '(unconfirmed)'))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,457 @@
+"""
+Stand-in for the IDA API used by h8_ida_disam.py
+
+MockIda implements the idc functions the script calls, serves bytes from an in memory
+address space loaded from a ROM dump and records every call so the script can be timed
+and regression tested outside IDA. Nothing is analysed: function chunks are looked up in
+an h8_decoder disassembly of the ROM and MakeCode/AutoMark only record the address.
+
+	ida = MockIda()
+	namespace = ida.loadScript('h8_ida_disam.py')
+	ida.reset('rom.bin')
+	namespace['labelRegisters']()
+	print(ida.calls.most_common())
+"""
+
+import collections
+import os
+import struct
+import sys
+import types
+
+import h8_decoder
+import h8_rom
+
+#Constants as defined by idc.py
+BADADDR = 0xFFFFFFFF
+SN_CHECK = 0x01
+SN_NOCHECK = 0x00
+SN_NOLIST = 0x80
+AU_PROC = 30
+fl_F = 21
+dr_R = 3
+SEG_CODE = 2
+SR_user = 2
+SEGMOD_KILL = 0x0001
+FF_BYTE = 0x00000000
+FF_WORD = 0x10000000
+FF_DWRD = 0x20000000
+FF_STRU = 0x60000000
+FF_0NUMD = 0x00200000
+FF_0OFF = 0x00500000
+FF_1OFF = 0x05000000
+FF_CODE = 0x00000600
+FF_DATA = 0x00000400
+MS_CLS = 0x00000600
+DT_TYPE = 0xF0000000
+MS_0TYPE = 0x00F00000
+MS_1TYPE = 0x0F000000
+FUNCATTR_START = 0
+SEARCH_DOWN = 1
+
+CONSTANTS = ('BADADDR', 'SN_CHECK', 'SN_NOCHECK', 'SN_NOLIST', 'AU_PROC', 'fl_F', 'dr_R', 'SEG_CODE',
+	'SR_user', 'SEGMOD_KILL', 'FF_BYTE', 'FF_WORD', 'FF_DWRD', 'FF_STRU', 'FF_0NUMD', 'FF_0OFF', 'FF_1OFF', 'FF_CODE',
+	'FF_DATA', 'FUNCATTR_START', 'SEARCH_DOWN')
+
+#Flag tests as defined by idc.py
+def isCode(flags):
+	return flags & MS_CLS == FF_CODE
+
+def isData(flags):
+	return flags & MS_CLS == FF_DATA
+
+def isByte(flags):
+	return isData(flags) and flags & DT_TYPE == FF_BYTE
+
+def isWord(flags):
+	return isData(flags) and flags & DT_TYPE == FF_WORD
+
+def isDwrd(flags):
+	return isData(flags) and flags & DT_TYPE == FF_DWRD
+
+def isStruct(flags):
+	return isData(flags) and flags & DT_TYPE == FF_STRU
+
+def isOff0(flags):
+	return flags & MS_0TYPE == FF_0OFF
+
+def isOff1(flags):
+	return flags & MS_1TYPE == FF_1OFF
+
+FLAG_TESTS = ('isCode', 'isData', 'isByte', 'isWord', 'isDwrd', 'isStruct', 'isOff0', 'isOff1')
+
+#Functions of the IDA API the mock provides
+API = ('AddSegEx', 'DelSeg', 'RenameSeg', 'SetSegClass', 'SetSegDefReg', 'SetSegmentType',
+	'GetInputFilePath', 'loadfile', 'AddStrucEx', 'AddStrucMember', 'LowVoids', 'HighVoids',
+	'Byte', 'Word', 'Dword', 'PatchByte', 'PatchWord', 'PatchDword', 'MakeByte', 'MakeWord',
+	'MakeDword', 'MakeStructEx', 'MakeNameEx', 'Name', 'MakeComm', 'OpOff', 'MakeCode', 'AutoMark',
+	'AddCodeXref', 'add_dref', 'GetFchunkAttr', 'FindBinary', 'Wait', 'GetFlags', 'ItemSize', 'GetCommentEx',
+	'GetStrucIdByName', 'GetStrucSize', 'Rfirst0', 'Rnext0', 'Dfirst', 'Dnext', 'SetRegEx', 'GetReg')
+
+#Size of the address space the script uses
+SPACE_SIZE = 0x30000
+
+_WORD = struct.Struct('>H')
+_DWORD = struct.Struct('>I')
+
+class MockIda(object):
+	"""
+	Records IDA API calls against an in memory IDB
+
+	calls counts calls per function name and failures the calls that would fail in IDA
+	(for example a name already used at another address).
+	"""
+
+	def __init__(self, path=None):
+		self.calls = collections.Counter()
+		self.failures = collections.Counter()
+		self.reset(path)
+
+	def reset(self, path=None):
+		"""
+		Starts a new IDB for a ROM dump loaded at 0x0 as IDA does before loadFile() runs
+		Call counters are kept, use clearCounters() to reset them
+		"""
+		self.path = path
+		self.memory = bytearray(SPACE_SIZE)
+		self.segments = []
+		self.structs = []
+		self.names = {}
+		self.addresses = {}
+		self.comments = {}
+		self.items = {}
+		self.itemStructs = {}
+		self.offsets = {}
+		self.code = set()
+		self.functions = set()
+		self.xrefs = []
+		self.segmentRegisters = {}
+		self.registerValues = {}
+		self._disassembly = None
+		if path is not None:
+			with open(path, 'rb') as f:
+				data = f.read(h8_rom.ROM_SIZE)
+			self.memory[0:len(data)] = data
+
+	def clearCounters(self):
+		self.calls.clear()
+		self.failures.clear()
+
+	def namespace(self):
+		"""
+		Returns {name: function or constant} for the API, every function call is counted
+		"""
+		namespace = {}
+		for name in CONSTANTS + FLAG_TESTS:
+			namespace[name] = globals()[name]
+		for name in API:
+			namespace[name] = self._counted(name, getattr(self, name))
+		return namespace
+
+	def _counted(self, name, function):
+		calls = self.calls
+		def counted(*args):
+			calls[name] += 1
+			return function(*args)
+		counted.__name__ = name
+		return counted
+
+	def install(self):
+		"""
+		Registers the API as the idc module so 'import idc' picks it up
+		"""
+		module = types.ModuleType('idc')
+		module.__dict__.update(self.namespace())
+		sys.modules['idc'] = module
+		return module
+
+	def loadScript(self, path, main=False):
+		"""
+		Executes an IDA script against the mock and returns its globals
+		Everything from the '#main' line on is left out unless main is set so the steps can be called one at a time
+		"""
+		with open(path) as f:
+			source = f.read()
+		if not main and '\n#main\n' in source:
+			source = source[:source.index('\n#main\n') + 1]
+		self.install()
+		namespace = self.namespace()
+		namespace['__file__'] = os.path.realpath(path)
+		namespace['__name__'] = '__main__'
+		exec(compile(source, path, 'exec'), namespace)
+		return namespace
+
+	#Segments and loading
+
+	def AddSegEx(self, start, end, base, use32, align, comb, flags):
+		self.segments.append({'start': start, 'end': end, 'name': '', 'class': '', 'type': None})
+		return 1
+
+	def _segment(self, ea):
+		found = None
+		for segment in self.segments:
+			if segment['start'] <= ea < segment['end']:
+				if found is None or segment['end'] - segment['start'] <= found['end'] - found['start']:
+					found = segment
+		return found
+
+	def DelSeg(self, ea, flags):
+		segment = self._segment(ea)
+		if segment is None:
+			self.failures['DelSeg'] += 1
+			return 0
+		self.segments.remove(segment)
+		if flags & SEGMOD_KILL:
+			start = segment['start']
+			end = min(segment['end'], SPACE_SIZE)
+			self.memory[start:end] = bytearray(end - start)
+		return 1
+
+	def RenameSeg(self, ea, name):
+		segment = self._segment(ea)
+		if segment is None:
+			self.failures['RenameSeg'] += 1
+			return 0
+		segment['name'] = name
+		return 1
+
+	def SetSegClass(self, ea, sclass):
+		segment = self._segment(ea)
+		if segment is None:
+			self.failures['SetSegClass'] += 1
+			return 0
+		segment['class'] = sclass
+		return 1
+
+	def SetSegDefReg(self, ea, reg, value):
+		self.segmentRegisters[(ea, reg)] = value
+		return 1
+
+	def SetRegEx(self, ea, reg, value, tag):
+		self.registerValues[(ea, reg)] = value
+		return 1
+
+	def GetReg(self, ea, reg):
+		#Value set at the closest address at or below ea in its segment, else the segment default
+		segment = self._segment(ea)
+		start = segment['start'] if segment is not None else 0
+		found = [a for a, r in self.registerValues if r == reg and start <= a <= ea]
+		if found:
+			return self.registerValues[(max(found), reg)]
+		return self.segmentRegisters.get((start, reg), 0)
+
+	def SetSegmentType(self, ea, segType):
+		segment = self._segment(ea)
+		if segment is None:
+			self.failures['SetSegmentType'] += 1
+			return 0
+		segment['type'] = segType
+		return 1
+
+	def GetInputFilePath(self):
+		return self.path
+
+	def loadfile(self, path, pos, ea, size):
+		with open(path, 'rb') as f:
+			f.seek(pos)
+			data = f.read(size)
+		self.memory[ea:ea + len(data)] = data
+		return 1
+
+	def AddStrucEx(self, index, name, isUnion):
+		self.structs.append((name, []))
+		return len(self.structs) - 1
+
+	def AddStrucMember(self, sid, name, offset, flag, typeid, nbytes):
+		self.structs[sid][1].append((name, flag, nbytes))
+		return 0
+
+	def LowVoids(self, ea):
+		return 1
+
+	def HighVoids(self, ea):
+		return 1
+
+	#Bytes and items
+
+	def Byte(self, ea):
+		return self.memory[ea]
+
+	def Word(self, ea):
+		return _WORD.unpack_from(self.memory, ea)[0]
+
+	def Dword(self, ea):
+		return _DWORD.unpack_from(self.memory, ea)[0]
+
+	def PatchByte(self, ea, value):
+		self.memory[ea] = value & 0xFF
+		return 1
+
+	def PatchWord(self, ea, value):
+		_WORD.pack_into(self.memory, ea, value & 0xFFFF)
+		return 1
+
+	def PatchDword(self, ea, value):
+		_DWORD.pack_into(self.memory, ea, value & 0xFFFFFFFF)
+		return 1
+
+	def _makeItem(self, ea, size):
+		self.items[ea] = size
+		self.itemStructs.pop(ea, None)
+		return 1
+
+	def MakeByte(self, ea):
+		return self._makeItem(ea, 1)
+
+	def MakeWord(self, ea):
+		return self._makeItem(ea, 2)
+
+	def MakeDword(self, ea):
+		return self._makeItem(ea, 4)
+
+	def MakeStructEx(self, ea, size, name):
+		sid = self.GetStrucIdByName(name)
+		if sid == BADADDR:
+			self.failures['MakeStructEx'] += 1
+			return 0
+		self._makeItem(ea, self.GetStrucSize(sid) if size == -1 else size)
+		self.itemStructs[ea] = sid
+		return 1
+
+	def GetFlags(self, ea):
+		flags = 0
+		if ea in self.code:
+			flags = FF_CODE
+		elif ea in self.items:
+			if ea in self.itemStructs:
+				flags = FF_DATA | FF_STRU
+			else:
+				flags = FF_DATA | {1: FF_BYTE, 2: FF_WORD, 4: FF_DWRD}.get(self.items[ea], FF_BYTE)
+		if (ea, 0) in self.offsets:
+			flags |= FF_0OFF
+		if (ea, 1) in self.offsets:
+			flags |= FF_1OFF
+		return flags
+
+	def ItemSize(self, ea):
+		return self.items.get(ea, 1)
+
+	def GetStrucIdByName(self, name):
+		for sid, (structName, members) in enumerate(self.structs):
+			if structName == name:
+				return sid
+		return BADADDR
+
+	def GetStrucSize(self, sid):
+		return sum(m[2] for m in self.structs[sid][1])
+
+	#Names, comments and references
+
+	def MakeNameEx(self, ea, name, flags):
+		if name == '':
+			old = self.names.pop(ea, None)
+			if old is not None:
+				del self.addresses[old]
+			return 1
+		owner = self.addresses.get(name)
+		if owner is not None and owner != ea:
+			#IDA refuses to reuse a name
+			self.failures['MakeNameEx'] += 1
+			return 0
+		old = self.names.get(ea)
+		if old is not None:
+			del self.addresses[old]
+		self.names[ea] = name
+		self.addresses[name] = ea
+		return 1
+
+	def Name(self, ea):
+		return self.names.get(ea, '')
+
+	def MakeComm(self, ea, comment):
+		self.comments[ea] = comment
+		return 1
+
+	def GetCommentEx(self, ea, repeatable):
+		return self.comments.get(ea)
+
+	def OpOff(self, ea, operand, base):
+		self.offsets[(ea, operand)] = base
+		return 1
+
+	def MakeCode(self, ea):
+		self.code.add(ea)
+		return 1
+
+	def AutoMark(self, ea, queue):
+		if queue == AU_PROC:
+			self.functions.add(ea)
+		return None
+
+	def AddCodeXref(self, frm, to, flowType):
+		self.xrefs.append((frm, to, 'code'))
+		return None
+
+	def add_dref(self, frm, to, refType):
+		self.xrefs.append((frm, to, 'data'))
+		return None
+
+	def _refsFrom(self, frm, kind):
+		return [to for source, to, refKind in self.xrefs if source == frm and refKind == kind]
+
+	def _next(self, refs, current):
+		#Refs after current in the order they were added, BADADDR at the end
+		if current in refs and refs.index(current) + 1 < len(refs):
+			return refs[refs.index(current) + 1]
+		return BADADDR
+
+	def Rfirst0(self, frm):
+		refs = self._refsFrom(frm, 'code')
+		return refs[0] if refs else BADADDR
+
+	def Rnext0(self, frm, current):
+		return self._next(self._refsFrom(frm, 'code'), current)
+
+	def Dfirst(self, frm):
+		refs = self._refsFrom(frm, 'data')
+		return refs[0] if refs else BADADDR
+
+	def Dnext(self, frm, current):
+		return self._next(self._refsFrom(frm, 'data'), current)
+
+	def Wait(self):
+		return 1
+
+	#Analysis lookups
+
+	def disassembly(self):
+		"""
+		Returns the h8_decoder disassembly used in place of IDA's function analysis
+		"""
+		if self._disassembly is None:
+			rom = h8_rom.RomSpace.fromBytes(bytes(self.memory[h8_rom.ROM_START:h8_rom.ROM_END]))
+			self._disassembly = h8_decoder.disassemble(rom)
+		return self._disassembly
+
+	def GetFchunkAttr(self, ea, attr):
+		if attr != FUNCATTR_START:
+			raise ValueError('Unsupported function chunk attribute %d' % attr)
+		start = self.disassembly().functionContaining(ea)
+		return BADADDR if start is None else start
+
+	def FindBinary(self, ea, flags, pattern):
+		"""
+		Searches down from ea for a space separated hex pattern, ?? matches any byte
+		"""
+		if not flags & SEARCH_DOWN:
+			raise ValueError('Only SEARCH_DOWN is supported')
+		values = [None if token.strip('?') == '' else int(token, 16) for token in pattern.split()]
+		fixed = [(i, v) for i, v in enumerate(values) if v is not None]
+		memory = self.memory
+		for addr in range(max(ea, 0), SPACE_SIZE - len(values) + 1):
+			for i, v in fixed:
+				if memory[addr + i] != v:
+					break
+			else:
+				return addr
+		return BADADDR
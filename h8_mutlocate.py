@@ -0,0 +1,147 @@
+"""
+Locates the MUT request table
+
+The MUT table is a long array of 16 bit pointers to the RAM variables (EE80-FE7F) and
+registers (FE80-FFFE) each MUT request returns. The dump is viewed as big endian words
+with NumPy, runs of words pointing into RAM or the register block are found with one
+diff and runs separated by a few other words are merged. Candidates are scored by their
+number of RAM pointers times their density, with a bonus for the share of the variable
+requests in the h8_definitions catalogue whose entry points into RAM, and the best one is
+returned. Command requests (h8_analysis.MUT_COMMANDS_START onwards) are left out of the
+bonus as their entries are not variable pointers.
+
+Words next to the table that happen to look like RAM pointers make the edges of a run
+fuzzy. When the 16 bit values used by the code are given (the keys of an h8_decoder
+Disassembly's values index) the start is moved to the nearby word the MUT handler
+addresses the table with.
+
+Several ROMs are stacked and searched in a single pass by locateMany().
+"""
+
+import numpy
+
+import h8_analysis
+import h8_definitions
+import h8_rom
+
+#Words that are not RAM pointers allowed inside a table
+MAX_GAP = 2
+#Shortest run considered a table
+MIN_ENTRIES = 0x40
+#Score added when every known request points into RAM
+KNOWN_BONUS = 48.0
+
+#Words either side of a run's start searched for the address the code uses
+EDGE = 4
+
+POINTER_START = h8_rom.RAM_START
+#FFFF is left out, it is erased flash far more often than a pointer to the last register
+POINTER_END = h8_rom.REGISTERS_END - 1
+
+def _words(images):
+	#Big endian word view of one (size,) or several (N, size) uint8 images
+	return numpy.ascontiguousarray(images).view('>u2')
+
+def pointerMask(words):
+	"""
+	Returns a bool array marking the words that point into RAM or the register block
+	"""
+	return (words >= POINTER_START) & (words < POINTER_END)
+
+def candidates(mask, maxGap=MAX_GAP, minEntries=MIN_ENTRIES):
+	"""
+	Returns [(first word, last word, pointers)] of the runs of pointers in a 1D mask
+	Runs separated by at most maxGap other words are merged
+	"""
+	padded = numpy.concatenate(([0], mask.view(numpy.int8), [0]))
+	edges = numpy.diff(padded)
+	starts = numpy.nonzero(edges == 1)[0]
+	ends = numpy.nonzero(edges == -1)[0]
+	if len(starts) == 0:
+		return []
+
+	#Merge runs whose gap is small enough
+	breaks = numpy.nonzero(starts[1:] - ends[:-1] > maxGap)[0]
+	groupStarts = numpy.concatenate(([0], breaks + 1))
+	groupEnds = numpy.concatenate((breaks, [len(starts) - 1]))
+	counts = numpy.add.reduceat(ends - starts, groupStarts)
+
+	found = []
+	for first, last, count in zip(starts[groupStarts], ends[groupEnds] - 1, counts):
+		if last - first + 1 >= minEntries:
+			found.append((int(first), int(last), int(count)))
+	return found
+
+def knownMutIds(family=None):
+	"""
+	Returns the ids of a family's catalogue in h8_definitions.json whose entries point at a RAM or register variable
+	Command requests (MUT_COMMANDS_START onwards) are left out
+	"""
+	return tuple(mutId for mutId in h8_definitions.load(family).mutIds if mutId < h8_analysis.MUT_COMMANDS_START)
+
+def score(mask, first, last, pointers, known):
+	"""
+	Scores a candidate table spanning words first to last
+	"""
+	density = pointers / float(last - first + 1)
+	hits = 0
+	for mutId in known:
+		index = first + mutId
+		if index <= last and mask[index]:
+			hits = hits + 1
+	return pointers * density + KNOWN_BONUS * hits / max(len(known), 1)
+
+def _snap(first, last, references):
+	#Moves the start of a table to the nearest word whose address the code uses
+	for delta in sorted(range(-EDGE, EDGE + 1), key=abs):
+		start = first + delta
+		if 0 <= start < last and ((h8_rom.ROM_START + start * 2) & 0xFFFF) in references:
+			return start
+	return first
+
+def _locate(words, mask, known, maxGap, minEntries, references=None):
+	if known is None:
+		known = knownMutIds()
+	best = None
+	for first, last, pointers in candidates(mask, maxGap, minEntries):
+		value = score(mask, first, last, pointers, known)
+		if best is None or value > best[0]:
+			best = (value, first, last)
+	if best is None:
+		return None
+	value, first, last = best
+	if references:
+		first = _snap(first, last, references)
+	return h8_rom.ROM_START + first * 2, h8_rom.ROM_START + last * 2
+
+def locateMutTable(rom, known=None, maxGap=MAX_GAP, minEntries=MIN_ENTRIES, references=None):
+	"""
+	Returns (start, end) of the MUT table in a RomSpace as createMutTable() takes them (end is the last entry)
+	or None when no run of RAM pointers is long enough
+	known is the MUT request ids to score with, by default those of knownMutIds()
+	references is an optional set of 16 bit values used by the code to pin down the start
+	"""
+	words = _words(numpy.frombuffer(rom.buffer, numpy.uint8, h8_rom.ROM_SIZE))
+	return _locate(words, pointerMask(words), known, maxGap, minEntries, references)
+
+def locateMany(paths, known=None, maxGap=MAX_GAP, minEntries=MIN_ENTRIES):
+	"""
+	Returns {path: (start, end) or None} for a list of ROM dumps
+	The pointer masks of all ROMs are computed in one NumPy operation
+	"""
+	images = numpy.empty((len(paths), h8_rom.ROM_SIZE), numpy.uint8)
+	for i, path in enumerate(paths):
+		with h8_rom.RomSpace(path) as rom:
+			images[i] = numpy.frombuffer(rom.buffer, numpy.uint8, h8_rom.ROM_SIZE)
+	words = _words(images)
+	masks = pointerMask(words)
+	return dict((path, _locate(words[i], masks[i], known, maxGap, minEntries)) for i, path in enumerate(paths))
+
+def mutRange(rom, references=None, known=None):
+	"""
+	Returns the located MUT table range or the default MUT_TABLE_START to MUT_TABLE_END if none is found
+	"""
+	found = locateMutTable(rom, known, references=references)
+	if found is None:
+		return h8_analysis.MUT_TABLE_START, h8_analysis.MUT_TABLE_END
+	return found
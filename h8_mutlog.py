@@ -0,0 +1,311 @@
+"""
+Streaming MUT log decoder
+
+A MUT log is a capture of request/response exchanges with the ECU: the tester sends a
+one byte request (the MUT id, the index into the MUT table) and the ECU answers with the
+byte at the address the table entry points to. Captures are read as fixed size records:
+
+   pair         request, response
+   echo         request, echo of the request on the K line, response
+   timestamped  little endian 32 bit time, request, response
+
+Logs are read CHUNK_RECORDS records at a time straight into NumPy structured arrays, so
+memory use does not depend on the size of the log. Each chunk is split into one column
+per request with a stable argsort, the column holding the record numbers (or times) and
+the response bytes. Columns are named after the MUT catalogue in h8_definitions.json, and
+addresses are resolved against the MUT table of a ROM when one is given.
+
+	python h8_mutlog.py LOG [--rom ROM] [--format pair|echo|timestamped]
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import sys
+
+import numpy
+
+import h8_analysis
+import h8_definitions
+import h8_rom
+
+PAIR = numpy.dtype([('request', 'u1'), ('response', 'u1')])
+ECHO = numpy.dtype([('request', 'u1'), ('echo', 'u1'), ('response', 'u1')])
+TIMESTAMPED = numpy.dtype([('time', '<u4'), ('request', 'u1'), ('response', 'u1')])
+
+RECORD_FORMATS = {'pair': PAIR, 'echo': ECHO, 'timestamped': TIMESTAMPED}
+
+CHUNK_RECORDS = 1 << 20
+
+#address is the variable the MUT table entry points to, None without a ROM
+Channel = collections.namedtuple('Channel', 'id name comment address')
+
+#index holds the record numbers, or the times of timestamped logs
+Column = collections.namedtuple('Column', 'index values')
+
+#start is the number of the first record, dropped counts records lost to echo mismatches and
+#trailing the bytes of an incomplete record at the end of the log
+LogChunk = collections.namedtuple('LogChunk', 'start records dropped columns trailing')
+
+def channels(rom=None, labels=None, mutRange=None):
+	"""
+	Returns the Channel of every MUT id (0-FF) in order
+
+	Names come from labels (the mutLabels() of the default h8_definitions family when None),
+	ids without a name keep their MUT_xx entry name and names used by several ids get the
+	id appended. With a RomSpace the MUT table is located
+	(or taken from mutRange) and every channel gets the address its entry points to.
+	"""
+	if labels is None:
+		labels = h8_definitions.load().mutLabels()
+	addresses = {}
+	if rom is not None:
+		if mutRange is None:
+			#NumPy is already needed here, the locator only adds the decoder
+			import h8_decoder
+			import h8_mutlocate
+			mutRange = h8_mutlocate.mutRange(rom, h8_decoder.disassemble(rom).values)
+		for i, entry in enumerate(h8_analysis.mutTable(rom, mutRange[0], mutRange[1])):
+			addresses[i] = entry['address']
+
+	names = []
+	for mutId in range(0x100):
+		key = 'MUT_%02X' % mutId
+		label = labels.get(key, ('', ''))
+		names.append((key, label[0] or key, label[1]))
+	counts = collections.Counter(name for key, name, comment in names)
+
+	found = []
+	for mutId, (key, name, comment) in enumerate(names):
+		if counts[name] > 1:
+			name = '%s_%02X' % (name, mutId)
+		found.append(Channel(mutId, name, comment, addresses.get(mutId)))
+	return found
+
+class RecordReader(object):
+	"""
+	Iterates over structured arrays of at most chunkRecords records read from a binary stream
+
+	A record split across two reads is carried over to the next chunk. Echo captures are
+	read a byte at a time: a record whose echo does not match its request (a byte lost or
+	added on the K line) is skipped along with every byte up to the next offset where the
+	echo matches again, so one bad byte costs one record instead of every record after it.
+
+	After each chunk start and numbers hold the number of its first record and of every
+	record (exchange number, the byte offset over the record size for echo captures) and
+	dropped the records skipped while re-syncing. Once the stream is exhausted trailing
+	holds the number of bytes of an incomplete record at its end, 0 when it ends on a record.
+	"""
+
+	def __init__(self, stream, dtype=PAIR, chunkRecords=CHUNK_RECORDS):
+		self.stream = stream
+		self.dtype = dtype
+		self.chunkRecords = chunkRecords
+		self.start = 0
+		self.numbers = None
+		self.dropped = 0
+		self.trailing = 0
+
+	def __iter__(self):
+		if 'echo' in self.dtype.names:
+			return self._echoRecords()
+		return self._records()
+
+	def _records(self):
+		size = self.dtype.itemsize
+		leftover = b''
+		start = 0
+		while True:
+			data = self.stream.read(self.chunkRecords * size - len(leftover))
+			if not data:
+				break
+			data = leftover + data
+			count = len(data) // size
+			leftover = data[count * size:]
+			if count:
+				self.start = start
+				self.numbers = numpy.arange(start, start + count, dtype=numpy.int64)
+				start = start + count
+				yield numpy.frombuffer(data, self.dtype, count)
+		self.trailing = len(leftover)
+
+	def _echoRecords(self):
+		size = self.dtype.itemsize
+		echo = self.dtype.names.index('echo')
+		buffer = numpy.zeros(0, numpy.uint8)
+		#Stream offset of buffer[0], bytes skipped since the last mismatch
+		base = 0
+		skipped = 0
+		syncing = False
+		while True:
+			data = self.stream.read(self.chunkRecords * size)
+			if not data:
+				break
+			buffer = numpy.concatenate((buffer, numpy.frombuffer(data, numpy.uint8)))
+			last = len(buffer) - size
+			#match[i] when a record at i has its echo equal to its request
+			match = buffer[:len(buffer) - echo] == buffer[echo:]
+			offsets = []
+			dropped = 0
+			position = 0
+			while True:
+				if syncing:
+					found = numpy.nonzero(match[position:])[0]
+					if not len(found):
+						#The last bytes may start a record completed by the next read
+						keep = max(len(match), position)
+						skipped = skipped + keep - position
+						position = keep
+						break
+					skipped = skipped + int(found[0])
+					position = position + int(found[0])
+					dropped = dropped + -(-skipped // size)
+					skipped = 0
+					syncing = False
+				if position > last:
+					break
+				starts = numpy.arange(position, last + 1, size)
+				bad = numpy.nonzero(~match[starts])[0]
+				if not len(bad):
+					offsets.append(starts)
+					position = int(starts[-1]) + size
+					break
+				offsets.append(starts[:bad[0]])
+				position = int(starts[bad[0]]) + 1
+				skipped = 1
+				syncing = True
+
+			offsets = numpy.concatenate(offsets) if offsets else numpy.zeros(0, numpy.int64)
+			if len(offsets) or dropped:
+				records = numpy.empty(len(offsets), self.dtype)
+				for i, name in enumerate(self.dtype.names):
+					records[name] = buffer[offsets + i]
+				self.numbers = (base + offsets) // size
+				self.start = int(self.numbers[0]) if len(offsets) else (base + position) // size
+				self.dropped = dropped
+				yield records
+			buffer = buffer[position:]
+			base = base + position
+		#Bytes still being skipped when the stream ends never made a record either
+		self.trailing = len(buffer) + (skipped if syncing else 0)
+
+def readRecords(stream, dtype=PAIR, chunkRecords=CHUNK_RECORDS):
+	"""
+	Returns a RecordReader over a binary stream, iterating over it yields the structured arrays
+	"""
+	return RecordReader(stream, dtype, chunkRecords)
+
+def recordIndex(records, start=0):
+	"""
+	Returns the times of timestamped records or their record numbers counting from start
+	"""
+	if 'time' in records.dtype.names:
+		return records['time']
+	return numpy.arange(start, start + len(records), dtype=numpy.int64)
+
+def splitColumns(records, index, channelList=None):
+	"""
+	Returns {channel name: Column} for a structured array of records and their recordIndex()
+	"""
+	if channelList is None:
+		channelList = _defaultChannels()
+	requests = records['request']
+	order = numpy.argsort(requests, kind='mergesort')
+	ids, first = numpy.unique(requests[order], return_index=True)
+	last = numpy.append(first[1:], len(order))
+	responses = records['response']
+
+	columns = collections.OrderedDict()
+	for mutId, lo, hi in zip(ids, first, last):
+		rows = order[lo:hi]
+		columns[channelList[mutId].name] = Column(index[rows], responses[rows])
+	return columns
+
+def decode(stream, channelList=None, dtype=PAIR, chunkRecords=CHUNK_RECORDS):
+	"""
+	Generator yielding a LogChunk per chunkRecords records of a binary stream
+	Echo captures are re-synced after a record whose echo does not match its request, the
+	records lost are counted in dropped. An incomplete record at the end of the stream is
+	reported by a last LogChunk without records whose trailing is its length in bytes.
+	"""
+	if channelList is None:
+		channelList = _defaultChannels()
+	reader = readRecords(stream, dtype, chunkRecords)
+	timestamped = 'time' in dtype.names
+	for records in reader:
+		index = records['time'] if timestamped else reader.numbers
+		yield LogChunk(reader.start, len(records), reader.dropped, splitColumns(records, index, channelList), 0)
+	if reader.trailing:
+		yield LogChunk(reader.start, 0, 0, collections.OrderedDict(), reader.trailing)
+
+def decodeFile(path, channelList=None, dtype=PAIR, chunkRecords=CHUNK_RECORDS):
+	"""
+	decode() over a log file, the file is closed once the generator is exhausted
+	"""
+	with open(path, 'rb') as f:
+		for chunk in decode(f, channelList, dtype, chunkRecords):
+			yield chunk
+
+def summarize(chunks):
+	"""
+	Returns {channel name: {'count', 'min', 'max', 'mean'}} over a sequence of LogChunk
+	Only running totals are kept so any number of chunks can be summarized
+	"""
+	totals = {}
+	for chunk in chunks:
+		for name, column in chunk.columns.items():
+			values = column.values
+			total = totals.get(name)
+			if total is None:
+				total = totals[name] = {'count': 0, 'min': 0xFF, 'max': 0, 'sum': 0}
+			total['count'] += len(values)
+			total['min'] = min(total['min'], int(values.min()))
+			total['max'] = max(total['max'], int(values.max()))
+			total['sum'] += int(values.sum(dtype=numpy.int64))
+	for total in totals.values():
+		total['mean'] = total.pop('sum') / float(total['count'])
+	return totals
+
+_default = []
+
+def _defaultChannels():
+	if not _default:
+		_default.append(channels())
+	return _default[0]
+
+def main():
+	parser = argparse.ArgumentParser(description='Decode a MUT request/response capture')
+	parser.add_argument('log')
+	parser.add_argument('--rom', default=None, help='ROM dump to resolve the MUT table addresses against')
+	parser.add_argument('--format', choices=sorted(RECORD_FORMATS), default='pair')
+	parser.add_argument('--chunk', type=int, default=CHUNK_RECORDS, help='records decoded at a time')
+	args = parser.parse_args()
+
+	if args.rom is not None:
+		with h8_rom.RomSpace(args.rom) as rom:
+			channelList = channels(rom)
+	else:
+		channelList = channels()
+	byName = dict((c.name, c) for c in channelList)
+
+	lost = {'dropped': 0, 'trailing': 0}
+	def counted(chunks):
+		for chunk in chunks:
+			lost['dropped'] += chunk.dropped
+			lost['trailing'] += chunk.trailing
+			yield chunk
+
+	chunks = decodeFile(args.log, channelList, RECORD_FORMATS[args.format], args.chunk)
+	print('%-24s %10s %5s %5s %8s %6s' % ('channel', 'count', 'min', 'max', 'mean', 'addr'))
+	for name, total in sorted(summarize(counted(chunks)).items(), key=lambda t: byName[t[0]].id):
+		address = byName[name].address
+		print('%-24s %10d %5d %5d %8.2f %6s' % (name, total['count'], total['min'], total['max'], total['mean'],
+			'' if address is None else '%04X' % address))
+	if lost['dropped']:
+		print('%d records dropped on echo mismatches' % lost['dropped'], file=sys.stderr)
+	if lost['trailing']:
+		print('%d bytes of an incomplete record at the end of the log' % lost['trailing'], file=sys.stderr)
+
+if __name__ == '__main__':
+	main()
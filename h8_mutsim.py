@@ -0,0 +1,248 @@
+"""
+MUT protocol ECU simulator
+
+Each SimulatedEcu answers MUT requests the way the ECU does: the request byte indexes the
+MUT table createMutTable() labels and the response is the byte at the RAM or register
+address the entry points to. The page 0 address space is a 64K NumPy array with the ROM
+mirror at 0-3FFF, and RAM and registers start zeroed or from a snapshot. They can then be
+driven by a trace, a timestamped h8_mutlog capture whose responses are written back to the
+addresses of their requests as time passes.
+
+Every ECU is served from one asyncio event loop on its own TCP port, Unix socket or
+pseudo terminal. A read hands all pending request bytes to the ECU at once and the
+responses are looked up with one NumPy gather, so hundreds of ECUs share a process.
+
+	python h8_mutsim.py ROM [ROM ...] [--count N] [--tcp PORT | --unix DIR | --pty]
+		[--snapshot RAM.bin] [--trace LOG] [--echo]
+
+Requires Python 3 (asyncio).
+"""
+
+from __future__ import print_function
+
+import argparse
+import asyncio
+import os
+import socket
+import time
+
+import numpy
+
+import h8_analysis
+import h8_mutlog
+import h8_rom
+
+#Snapshots cover RAM and the registers
+SNAPSHOT_START = h8_rom.RAM_START
+SNAPSHOT_END = h8_rom.REGISTERS_END
+
+#Response to requests past the end of the MUT table
+NO_ENTRY = 0x00
+
+class SimulatedEcu(object):
+	"""
+	Answers MUT requests from a ROM image, a RAM snapshot and an optional trace
+
+	table is the MUT table as (start, end) like createMutTable() takes, located when None.
+	trace is a timestamped h8_mutlog capture replayed in real time (times in milliseconds)
+	and looped when it runs out, its requests past the end of the table are ignored. echo repeats every request before its response like the
+	K line does.
+	"""
+
+	def __init__(self, rom, table=None, snapshot=None, trace=None, echo=False, clock=time.monotonic):
+		self.memory = numpy.zeros(0x10000, numpy.uint8)
+		mirror = numpy.frombuffer(rom.buffer, numpy.uint8, h8_rom.MIRROR_END)
+		self.memory[:h8_rom.MIRROR_END] = mirror
+		if snapshot is not None:
+			data = numpy.frombuffer(snapshot, numpy.uint8)
+			self.memory[SNAPSHOT_START:SNAPSHOT_START + len(data)] = data[:SNAPSHOT_END - SNAPSHOT_START]
+
+		if table is None:
+			#The locator needs the decoder only for its operand index
+			import h8_decoder
+			import h8_mutlocate
+			table = h8_mutlocate.mutRange(rom, h8_decoder.disassemble(rom).values)
+		#Address per request, requests past the table read NO_ENTRY from the scratch cell at index 0x10000
+		self.addresses = numpy.full(0x100, 0x10000, numpy.int64)
+		for i, entry in enumerate(h8_analysis.mutTable(rom, table[0], table[1])[:0x100]):
+			self.addresses[i] = entry['pointer']
+		self.memory = numpy.append(self.memory, numpy.uint8(NO_ENTRY))
+
+		self.echo = echo
+		self.clock = clock
+		self.started = clock()
+		self.requests = 0
+		self._trace = None
+		if trace is not None and len(trace):
+			#Responses become writes to the addresses their requests point at, requests past the
+			#table would overwrite the NO_ENTRY cell so they are left out
+			addresses = self.addresses[trace['request']]
+			kept = addresses != 0x10000
+			times = trace['time'].astype(numpy.int64) - int(trace['time'][0])
+			if kept.any():
+				self._trace = (times[kept], addresses[kept], trace['response'][kept])
+				self._cursor = 0
+				self._loops = 0
+
+	def _replay(self):
+		#Applies every trace write up to the current time
+		times, addresses, values = self._trace
+		period = int(times[-1]) + 1
+		now = int((self.clock() - self.started) * 1000)
+		loops = now // period
+		if loops > self._loops:
+			#A whole pass leaves every address it writes at its last value whatever came before,
+			#so any number of skipped passes is the rest of this one or a single full pass
+			start = self._cursor if loops == self._loops + 1 else 0
+			self.memory[addresses[start:]] = values[start:]
+			self._cursor = 0
+			self._loops = loops
+		end = int(numpy.searchsorted(times, now - loops * period, 'right'))
+		if end > self._cursor:
+			self.memory[addresses[self._cursor:end]] = values[self._cursor:end]
+			self._cursor = end
+
+	def respond(self, data):
+		"""
+		Returns the bytes the ECU sends back for a run of request bytes
+		"""
+		if self._trace is not None:
+			self._replay()
+		requests = numpy.frombuffer(data, numpy.uint8)
+		self.requests = self.requests + len(requests)
+		responses = self.memory[self.addresses[requests]]
+		if not self.echo:
+			return responses.tobytes()
+		return numpy.stack((requests, responses), axis=1).tobytes()
+
+class MutProtocol(asyncio.Protocol):
+	"""
+	Serves one SimulatedEcu over a stream transport
+	"""
+
+	def __init__(self, ecu):
+		self.ecu = ecu
+		self.transport = None
+
+	def connection_made(self, transport):
+		self.transport = transport
+		sock = transport.get_extra_info('socket')
+		if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+			sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+	def data_received(self, data):
+		self.transport.write(self.ecu.respond(data))
+
+async def serveTcp(ecus, host='127.0.0.1', port=0):
+	"""
+	Starts one TCP server per ECU on consecutive ports from port (any free ports when 0)
+	Returns [(server, (host, port))]
+	"""
+	loop = asyncio.get_event_loop()
+	servers = []
+	for i, ecu in enumerate(ecus):
+		server = await loop.create_server(lambda ecu=ecu: MutProtocol(ecu), host, port + i if port else 0)
+		servers.append((server, server.sockets[0].getsockname()[:2]))
+	return servers
+
+async def serveUnix(ecus, directory):
+	"""
+	Starts one Unix socket server per ECU named ecu_<n>.sock in directory
+	Returns [(server, path)]
+	"""
+	loop = asyncio.get_event_loop()
+	servers = []
+	for i, ecu in enumerate(ecus):
+		path = os.path.join(directory, 'ecu_%04d.sock' % i)
+		if os.path.exists(path):
+			os.unlink(path)
+		server = await loop.create_unix_server(lambda ecu=ecu: MutProtocol(ecu), path)
+		servers.append((server, path))
+	return servers
+
+def servePty(ecus):
+	"""
+	Opens one pseudo terminal per ECU and answers requests written to its slave side
+	Returns [(master fd, slave path)], the readers run on the current event loop
+	"""
+	import tty
+	loop = asyncio.get_event_loop()
+	terminals = []
+	for ecu in ecus:
+		master, slave = os.openpty()
+		tty.setraw(master)
+		tty.setraw(slave)
+		os.set_blocking(master, False)
+
+		def reader(master=master, ecu=ecu):
+			try:
+				data = os.read(master, 4096)
+			except OSError:
+				return
+			if data:
+				os.write(master, ecu.respond(data))
+		loop.add_reader(master, reader)
+		terminals.append((master, os.ttyname(slave)))
+	return terminals
+
+def loadEcus(paths, count, snapshot=None, trace=None, echo=False):
+	"""
+	Returns count SimulatedEcu cycling through the ROMs in paths
+	The MUT table of each ROM is located once
+	"""
+	import h8_decoder
+	import h8_mutlocate
+
+	images = []
+	for path in paths:
+		with open(path, 'rb') as f:
+			rom = h8_rom.RomSpace.fromBytes(f.read())
+		images.append((rom, h8_mutlocate.mutRange(rom, h8_decoder.disassemble(rom).values)))
+	return [SimulatedEcu(images[i % len(images)][0], images[i % len(images)][1], snapshot, trace, echo)
+		for i in range(count)]
+
+def main():
+	parser = argparse.ArgumentParser(description='Simulate ECUs answering MUT requests')
+	parser.add_argument('roms', nargs='+')
+	parser.add_argument('--count', type=int, default=1, help='number of simulated ECUs')
+	parser.add_argument('--tcp', type=int, default=None, help='first TCP port')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--unix', default=None, help='directory to create the Unix sockets in')
+	parser.add_argument('--pty', action='store_true', help='serve every ECU on a pseudo terminal')
+	parser.add_argument('--snapshot', default=None, help='RAM and register image from 0xEE80 on')
+	parser.add_argument('--trace', default=None, help='timestamped MUT log to replay')
+	parser.add_argument('--echo', action='store_true', help='echo requests like the K line')
+	args = parser.parse_args()
+
+	snapshot = None
+	if args.snapshot is not None:
+		with open(args.snapshot, 'rb') as f:
+			snapshot = f.read()
+	trace = None
+	if args.trace is not None:
+		with open(args.trace, 'rb') as f:
+			reader = h8_mutlog.readRecords(f, h8_mutlog.TIMESTAMPED)
+			trace = numpy.concatenate(list(reader) or [numpy.zeros(0, h8_mutlog.TIMESTAMPED)])
+		if reader.trailing:
+			print('Ignoring %d bytes of an incomplete record at the end of %s' % (reader.trailing, args.trace))
+	ecus = loadEcus(args.roms, args.count, snapshot, trace, args.echo)
+
+	loop = asyncio.new_event_loop()
+	asyncio.set_event_loop(loop)
+	if args.pty:
+		for master, path in servePty(ecus):
+			print(path)
+	elif args.unix is not None:
+		for server, path in loop.run_until_complete(serveUnix(ecus, args.unix)):
+			print(path)
+	else:
+		for server, address in loop.run_until_complete(serveTcp(ecus, args.host, args.tcp or 0)):
+			print('%s:%d' % address)
+	print('Serving %d ECUs' % len(ecus))
+	try:
+		loop.run_forever()
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == '__main__':
+	main()
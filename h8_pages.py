@@ -0,0 +1,311 @@
+"""
+Page register propagation
+
+Absolute operands are page relative: @aa:8 addresses (br << 8) | aa and @aa:16 addresses
+(dp << 16) | aa. Register indirect operands page through dp for R0-R3, ep for R4 and R5 and
+tp for R6 and R7. createSegments() only sets a br default for the code pages and leaves dp
+alone, so code that switches pages resolves its operands wrongly.
+
+propagate() tracks the constant value of br, dp, ep and tp through the control flow graph of
+an h8_decoder.Disassembly with a worklist. A register is unreached, a constant or VARYING
+(different constants meet, or it was loaded from a register or memory). ep and tp have no
+default and are VARYING until the code loads them:
+
+   ldc #xx, br/dp            sets the constant
+   andc/orc/xorc #xx         applies the operation to the constant
+   ldc from anything else    VARYING, so is a word sized ldc
+   bsr/jsr/pjsr to a known function
+                             the state flows into the function and on return the registers
+                             it (or anything it calls) writes take the function's exit state
+
+Vector entries and known functions nobody calls start from the br and dp given. Every
+block state only moves down the lattice so each block is revisited a bounded number of
+times and the pass is linear in the number of blocks.
+
+	python h8_pages.py ROM [--br N] [--dp N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+
+import h8_decoder
+import h8_rom
+
+#Value of a register that is not the same constant on every path
+VARYING = -1
+
+BR = 3
+EP = 4
+DP = 5
+TP = 7
+#Control registers tracked, their index in a state
+PAGE_REGISTERS = (BR, DP, EP, TP)
+PAGE_REGISTER_NAMES = {BR: 'br', DP: 'dp', EP: 'ep', TP: 'tp'}
+#Registers absolute operands resolve through, the ones ranges() reports
+SEGMENT_REGISTERS = (BR, DP)
+
+#br, dp, ep and tp before an instruction
+PageState = collections.namedtuple('PageState', 'br dp ep tp')
+
+_OPERATIONS = {
+	'ldc': lambda current, imm: imm,
+	'andc': lambda current, imm: current & imm,
+	'orc': lambda current, imm: current | imm,
+	'xorc': lambda current, imm: current ^ imm,
+}
+
+def _meet(a, b):
+	if a is None:
+		return b
+	return PageState(*[x if x == y else VARYING for x, y in zip(a, b)])
+
+def _transfer(insn, state):
+	#State after an instruction that is not a call
+	if insn.reg not in PAGE_REGISTERS or insn.mnemonic not in _OPERATIONS:
+		return state
+	index = PAGE_REGISTERS.index(insn.reg)
+	current = state[index]
+	if insn.ea != h8_decoder.EA_IMM or insn.opsize != 1 or (current == VARYING and insn.mnemonic != 'ldc'):
+		value = VARYING
+	else:
+		value = _OPERATIONS[insn.mnemonic](current, insn.value) & 0xFF
+	return state._replace(**{PAGE_REGISTER_NAMES[insn.reg]: value})
+
+def _writes(disassembly, blocks, functions):
+	#{function: set of page register indices it or its callees write}, call graph closed by iteration
+	insns = disassembly.insns
+	direct = {}
+	calls = {}
+	for entry in functions:
+		written = set()
+		callees = set()
+		for start in disassembly.functionBlocks(entry):
+			for addr in blocks[start].insns:
+				insn = insns[addr]
+				if insn.reg in PAGE_REGISTERS and insn.mnemonic in _OPERATIONS:
+					written.add(PAGE_REGISTERS.index(insn.reg))
+				elif insn.flow == h8_decoder.FLOW_CALL and insn.target in functions:
+					callees.add(insn.target)
+		direct[entry] = written
+		calls[entry] = callees
+	changed = True
+	while changed:
+		changed = False
+		for entry, callees in calls.items():
+			for callee in callees:
+				if not direct[callee] <= direct[entry]:
+					direct[entry] |= direct[callee]
+					changed = True
+	return direct
+
+class PageRegisters(object):
+	"""
+	br, dp, ep and tp at every block and instruction of a Disassembly as found by propagate()
+	"""
+
+	def __init__(self, disassembly, default, blockStates, exits, writes):
+		self.disassembly = disassembly
+		self.default = default
+		self.blockStates = blockStates
+		self.exits = exits
+		self.writes = writes
+		self._insnStates = None
+
+	def step(self, insn, state):
+		"""
+		Returns the state after an instruction, None after a call to a function not yet known to return
+		"""
+		if insn.flow != h8_decoder.FLOW_CALL or insn.target not in self.writes:
+			return _transfer(insn, state)
+		written = self.writes[insn.target]
+		if not written:
+			return state
+		if insn.target not in self.exits:
+			return None
+		exit = self.exits[insn.target]
+		return PageState(*[exit[i] if i in written else v for i, v in enumerate(state)])
+
+	def insnStates(self):
+		"""
+		Returns {instruction address: PageState} for every instruction of a reached block
+		"""
+		if self._insnStates is None:
+			insns = self.disassembly.insns
+			blocks = self.disassembly.blocks()
+			states = {}
+			for start, state in self.blockStates.items():
+				for addr in blocks[start].insns:
+					#Blocks can overlap, a shared instruction meets the states of every block
+					states[addr] = _meet(states.get(addr), state)
+					state = self.step(insns[addr], state)
+					if state is None:
+						break
+			self._insnStates = states
+		return self._insnStates
+
+	def at(self, addr):
+		"""
+		Returns the PageState before the instruction at addr, registers that are VARYING or
+		unreached read as the defaults (VARYING for ep and tp)
+		"""
+		state = self.insnStates().get(addr)
+		if state is None:
+			return self.default
+		return PageState(*[d if v == VARYING else v for v, d in zip(state, self.default)])
+
+	def pages(self):
+		"""
+		Returns {instruction address: (br, dp, ep, tp)} for the instructions where a register is
+		known to differ from its default, as Disassembly.setPages() takes it
+
+		Only the constant registers count. br and dp that are VARYING are given as their
+		defaults, because the decoder needs a value. ep and tp that are VARYING stay VARYING.
+		"""
+		found = {}
+		for addr, state in self.insnStates().items():
+			if any(v != VARYING and v != d for v, d in zip(state, self.default)):
+				found[addr] = tuple(self.at(addr))
+		return found
+
+	def ranges(self):
+		"""
+		Returns [(address, register name, value)] where the value of br or dp changes in address order
+
+		The value in effect is reset to the default at the start of every 64K page like
+		segment register ranges in IDA. A register that becomes VARYING has no value to set, so
+		a range resets it to its default, the value Disassembly.setPages() resolves it with
+		there, instead of leaving the last constant in effect.
+		"""
+		states = self.insnStates()
+		changes = []
+		current = None
+		page = None
+		for addr in sorted(states):
+			if addr >> 16 != page:
+				page = addr >> 16
+				current = list(self.default)
+			state = states[addr]
+			for register in SEGMENT_REGISTERS:
+				index = PAGE_REGISTERS.index(register)
+				value = state[index]
+				if value == VARYING:
+					value = self.default[index]
+				if value != current[index]:
+					changes.append((addr, PAGE_REGISTER_NAMES[register], value))
+					current[index] = value
+		return changes
+
+def propagate(disassembly, br=None, dp=None, entries=None):
+	"""
+	Returns the PageRegisters of a Disassembly
+	br and dp default to the values the disassembly resolved its operands with, entries to
+	the functions no other function calls (vector entries and uncalled known functions)
+	"""
+	default = PageState(disassembly.br if br is None else br, disassembly.dp if dp is None else dp, VARYING, VARYING)
+	blocks = disassembly.blocks()
+	insns = disassembly.insns
+	functions = set(entry for entry in disassembly.functions if entry in blocks)
+	writes = _writes(disassembly, blocks, functions)
+
+	#Functions owning each block, a return ends every one of them
+	owners = collections.defaultdict(list)
+	for entry in functions:
+		for start in disassembly.functionBlocks(entry):
+			owners[start].append(entry)
+
+	called = set()
+	for block in blocks.values():
+		for addr in block.insns:
+			insn = insns[addr]
+			if insn.flow == h8_decoder.FLOW_CALL and insn.target in functions:
+				called.add(insn.target)
+	if entries is None:
+		entries = functions - called
+
+	states = {}
+	exits = {}
+	pages = PageRegisters(disassembly, default, states, exits, writes)
+	callSites = collections.defaultdict(set)
+	work = collections.deque()
+	queued = set()
+
+	def merge(start, state):
+		if start not in blocks:
+			return
+		merged = _meet(states.get(start), state)
+		if merged != states.get(start):
+			states[start] = merged
+			if start not in queued:
+				queued.add(start)
+				work.append(start)
+
+	for entry in entries:
+		merge(entry, default)
+
+	while work:
+		start = work.popleft()
+		queued.discard(start)
+		state = states[start]
+		block = blocks[start]
+		for addr in block.insns:
+			insn = insns[addr]
+			if insn.flow == h8_decoder.FLOW_CALL and insn.target in functions:
+				callSites[insn.target].add(start)
+				merge(insn.target, state)
+			state = pages.step(insn, state)
+			if state is None:
+				#Continued once the callee is found to return
+				break
+		if state is None:
+			continue
+		if insns[block.insns[-1]].flow == h8_decoder.FLOW_RETURN:
+			for entry in owners.get(start, ()):
+				merged = _meet(exits.get(entry), state)
+				if merged != exits.get(entry):
+					exits[entry] = merged
+					for site in callSites[entry]:
+						if site not in queued:
+							queued.add(site)
+							work.append(site)
+		for successor in block.successors:
+			merge(successor, state)
+	return pages
+
+def resolvePages(disassembly, br=None, dp=None):
+	"""
+	Propagates the page registers through a Disassembly and resolves its absolute operands with them
+	Returns the PageRegisters
+	"""
+	pages = propagate(disassembly, br, dp)
+	disassembly.setPages(pages.pages())
+	return pages
+
+def disassemble(rom, seeds=None, br=0x0, dp=0x0):
+	"""
+	h8_decoder.disassemble() with the absolute operands resolved through resolvePages()
+	"""
+	disassembly = h8_decoder.disassemble(rom, seeds, br, dp)
+	resolvePages(disassembly)
+	return disassembly
+
+def main():
+	parser = argparse.ArgumentParser(description='Find the br and dp values of the code of a ROM dump')
+	parser.add_argument('rom')
+	parser.add_argument('--br', type=lambda x: int(x, 0), default=0x0, help='br at the entry points (default: 0)')
+	parser.add_argument('--dp', type=lambda x: int(x, 0), default=0x0, help='dp at the entry points (default: 0)')
+	args = parser.parse_args()
+
+	with h8_rom.RomSpace(args.rom) as rom:
+		disassembly = h8_decoder.disassemble(rom, br=args.br, dp=args.dp)
+		pages = propagate(disassembly)
+		states = pages.insnStates()
+		varying = [sum(1 for s in states.values() if s[i] == VARYING) for i in range(len(PAGE_REGISTERS))]
+		print('%d blocks reached, %d instructions, VARYING br at %d, dp at %d' % (len(pages.blockStates),
+			len(states), varying[0], varying[1]))
+		for addr, register, value in pages.ranges():
+			print('   %X %s = %X' % (addr, register, value))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,397 @@
+"""
+Resumable headless annotation pipeline
+
+Runs the steps of h8_ida_disam.py as a graph of stages over a directory of ROM dumps.
+Every Stage declares the values it reads and the values it writes:
+
+   load         rom                     the RomSpace and the SHA-1 of the dump
+   disassembly  disassembly             h8_decoder recursive descent with the br and dp of
+                pageRegisters           every instruction found by h8_pages
+   segments     segments                createSegments()
+   pages        pages                   setPageRegisters()
+   structs      structs                 createStructs(), the header of every map struct
+   registers    registers               labelRegisters()
+   vectors      vectors                 createVTEntries(), vectors and DTC blocks
+   mut          mutRange mut_table      findMutTable() and createMutTable()
+   functions    functions               labelKnownFunctions()
+   maps         maps                    labelMaps()
+   vars         vars                    labelKnownVars()
+   export       annotations             the plans written to OUT_DIR/<rom>/annotations.db
+
+The results of every stage but load and disassembly are checkpointed to
+OUT_DIR/<rom>/<stage>.json under a key made of the SHA-1 of the dump, the stage options
+and the keys of the stages it reads from. A rerun loads the stages whose checkpoint key
+still matches and runs the rest, so a batch that failed on a stage resumes at that stage.
+A failed stage only stops the stages that read from it. Stages whose inputs are ready run
+concurrently on a pool of threads and ROMs are spread over a pool of processes.
+
+The annotations.db of a ROM can be set as ANNOTATION_DB of h8_ida_disam.py to apply the
+plans to an IDB without running discovery again.
+
+	python h8_pipeline.py ROM_DIR OUT_DIR [--jobs N] [--threads N] [--stages NAME,...] [--restart]
+		[--family NAME] [--fingerprints LIBRARY.npz]
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import hashlib
+import json
+import multiprocessing
+import multiprocessing.pool
+import os
+import sys
+import tempfile
+import time
+import traceback
+
+try:
+	import queue
+except ImportError:
+	import Queue as queue
+
+import h8_analysis
+import h8_annotations
+import h8_annotdb
+import h8_decoder
+import h8_definitions
+import h8_pages
+import h8_rom
+
+#Bump when the output of a stage changes so old checkpoints are rerun
+PIPELINE_VERSION = 2
+
+#checkpoint is False for stages whose outputs only live in memory, they run when a stage reading them does
+#options are the names of the Options fields the stage result depends on
+Stage = collections.namedtuple('Stage', 'name inputs outputs function checkpoint options')
+
+Options = collections.namedtuple('Options', 'family fingerprints')
+
+DEFAULT_OPTIONS = Options(None, None)
+
+#Outcome of a stage, error holds the traceback of failed stages
+StageResult = collections.namedtuple('StageResult', 'name status seconds error')
+
+def _load(values, options):
+	return {'rom': h8_rom.RomSpace(values['path'])}
+
+def _disassembly(values, options):
+	disassembly = h8_decoder.disassemble(values['rom'])
+	return {'disassembly': disassembly, 'pageRegisters': h8_pages.resolvePages(disassembly)}
+
+def _segments(values, options):
+	return {'segments': h8_analysis.segments()}
+
+def _pages(values, options):
+	return {'pages': h8_annotations.planPageRegisters(values['pageRegisters'].ranges())}
+
+def _structs(values, options):
+	#h8_maps needs NumPy for its data types only
+	import h8_maps
+	return {'structs': dict((kind, [list(field) for field in fields]) for kind, (fields, dtype) in h8_maps.STRUCTS.items())}
+
+def _registers(values, options):
+	return {'registers': h8_annotations.planRegisters(h8_definitions.load(options.family).registerTable())}
+
+def _vectors(values, options):
+	return {'vectors': h8_annotations.planVTEntries(values['rom'], h8_definitions.load(options.family).vectorTable())}
+
+def _mut(values, options):
+	import h8_mutlocate
+	rom = values['rom']
+	found = h8_mutlocate.locateMutTable(rom, h8_mutlocate.knownMutIds(options.family), references=values['disassembly'].values)
+	if found is None:
+		found = (h8_analysis.MUT_TABLE_START, h8_analysis.MUT_TABLE_END)
+	labels = h8_definitions.load(options.family).mutLabels()
+	return {'mutRange': list(found), 'mut_table': h8_annotations.planMutTable(rom, labels, found[0], found[1])}
+
+def _functions(values, options):
+	disassembly = values['disassembly']
+	matches = ()
+	if options.fingerprints is not None:
+		import h8_fingerprint
+		matches = h8_fingerprint.FingerprintLibrary.load(options.fingerprints).matchRom(disassembly)
+
+	def functionStart(ea):
+		start = disassembly.functionContaining(ea)
+		return ea if start is None else start
+	return {'functions': h8_annotations.planKnownFunctions(values['rom'], functionStart, matches=matches)}
+
+def _maps(values, options):
+	import h8_mapscan
+	axes, maps = h8_mapscan.scanMaps(values['rom'], values['disassembly'])
+	return {'maps': h8_annotations.planMaps(axes + maps)}
+
+def _vars(values, options):
+	return {'vars': h8_annotations.planKnownVars(h8_analysis.knownVars(values['disassembly']))}
+
+#Plans stored by the export stage, the register plan does not depend on the ROM
+EXPORTED_PLANS = ('pages', 'registers', 'vectors', 'mut_table', 'functions', 'maps', 'vars')
+
+def _export(values, options):
+	path = os.path.join(values['romDir'], 'annotations.db')
+	digest = h8_annotdb.romHash(values['rom'])
+	family = h8_annotdb.familyKey(h8_definitions.load(options.family))
+	with h8_annotdb.AnnotationDatabase(path) as db:
+		for name in EXPORTED_PLANS:
+			db.write(name, values[name], family if name in h8_annotdb.FAMILY_STEPS else digest)
+	return {'annotations': path}
+
+STAGES = (
+	Stage('load', ('path',), ('rom',), _load, False, ()),
+	Stage('disassembly', ('rom',), ('disassembly', 'pageRegisters'), _disassembly, False, ()),
+	Stage('segments', (), ('segments',), _segments, True, ()),
+	Stage('pages', ('pageRegisters',), ('pages',), _pages, True, ()),
+	Stage('structs', (), ('structs',), _structs, True, ()),
+	Stage('registers', (), ('registers',), _registers, True, ('family',)),
+	Stage('vectors', ('rom',), ('vectors',), _vectors, True, ('family',)),
+	Stage('mut', ('rom', 'disassembly'), ('mutRange', 'mut_table'), _mut, True, ('family',)),
+	Stage('functions', ('rom', 'disassembly'), ('functions',), _functions, True, ('fingerprints',)),
+	Stage('maps', ('rom', 'disassembly'), ('maps',), _maps, True, ()),
+	Stage('vars', ('disassembly',), ('vars',), _vars, True, ()),
+	Stage('export', ('rom', 'romDir') + EXPORTED_PLANS, ('annotations',), _export, True, ('family',)),
+)
+
+def _encode(value):
+	#Plans are stored as their toList() form
+	if isinstance(value, h8_annotations.AnnotationPlan):
+		return {'plan': value.toList()}
+	return {'value': value}
+
+def _decode(value):
+	if 'plan' in value:
+		return h8_annotations.AnnotationPlan.fromList(value['plan'])
+	return value['value']
+
+def _optionKey(stage, options):
+	#Fingerprint libraries are identified by their modification time too so a rebuilt library reruns the stage
+	parts = []
+	for name in stage.options:
+		value = getattr(options, name)
+		if name == 'fingerprints' and value is not None and os.path.exists(value):
+			value = '%s@%d' % (value, os.path.getmtime(value))
+		parts.append('%s=%r' % (name, value))
+	return ','.join(parts)
+
+class Pipeline(object):
+	"""
+	Runs the stages of one ROM with checkpoints in outDir/<rom file name>
+	"""
+
+	def __init__(self, path, outDir, options=DEFAULT_OPTIONS, stages=STAGES):
+		self.path = path
+		self.directory = os.path.join(outDir, os.path.basename(path))
+		self.options = options
+		self.stages = collections.OrderedDict((stage.name, stage) for stage in stages)
+		self.producers = {}
+		for stage in stages:
+			for output in stage.outputs:
+				self.producers[output] = stage.name
+		with open(path, 'rb') as f:
+			self.digest = hashlib.sha1(f.read()).hexdigest()
+		self._keys = {}
+
+	def upstream(self, name):
+		"""
+		Returns the names of the stages a stage reads from
+		"""
+		return [self.producers[i] for i in self.stages[name].inputs if i in self.producers]
+
+	def key(self, name):
+		"""
+		Returns the checkpoint key of a stage
+		"""
+		if name not in self._keys:
+			stage = self.stages[name]
+			key = hashlib.sha1(('%s:%d:%s:%s' % (name, PIPELINE_VERSION, self.digest,
+				_optionKey(stage, self.options))).encode('ascii'))
+			for upstream in self.upstream(name):
+				key.update(self.key(upstream).encode('ascii'))
+			self._keys[name] = key.hexdigest()
+		return self._keys[name]
+
+	def checkpointPath(self, name):
+		return os.path.join(self.directory, name + '.json')
+
+	def checkpoint(self, name):
+		"""
+		Returns the outputs of a stage's checkpoint or None when there is no valid one
+		"""
+		try:
+			with open(self.checkpointPath(name)) as f:
+				stored = json.load(f)
+		except (IOError, OSError, ValueError):
+			return None
+		if stored.get('key') != self.key(name):
+			return None
+		return dict((output, _decode(value)) for output, value in stored['outputs'].items())
+
+	def _write(self, name, outputs):
+		#Written to a temporary file first so an interrupted run never leaves a partial checkpoint
+		stored = {'stage': name, 'key': self.key(name),
+			'outputs': dict((output, _encode(value)) for output, value in outputs.items())}
+		handle, tempPath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+		with os.fdopen(handle, 'w') as f:
+			json.dump(stored, f, sort_keys=True)
+		if os.name == 'nt' and os.path.exists(self.checkpointPath(name)):
+			os.remove(self.checkpointPath(name))
+		os.rename(tempPath, self.checkpointPath(name))
+
+	def _plan(self, targets, restart):
+		#Returns (stages to run, {output: value} loaded from checkpoints, names of the stages loaded)
+		values = {'path': self.path, 'romDir': self.directory}
+		run = set()
+		loaded = set()
+		wanted = list(targets)
+		seen = set()
+		while wanted:
+			name = wanted.pop()
+			if name in seen:
+				continue
+			seen.add(name)
+			stage = self.stages[name]
+			if stage.checkpoint and not restart:
+				outputs = self.checkpoint(name)
+				if outputs is not None:
+					values.update(outputs)
+					loaded.add(name)
+					continue
+			run.add(name)
+			wanted.extend(self.upstream(name))
+		return run, values, loaded
+
+	def run(self, targets=None, threads=4, restart=False):
+		"""
+		Runs the stages needed for targets (every checkpointed stage by default) and returns a StageResult per stage
+		status is 'loaded' for checkpointed stages, 'done', 'failed', or 'skipped' when an input failed
+		"""
+		if targets is None:
+			targets = [stage.name for stage in self.stages.values() if stage.checkpoint]
+		if not os.path.isdir(self.directory):
+			os.makedirs(self.directory)
+		pending, values, loaded = self._plan(targets, restart)
+		results = collections.OrderedDict((name, StageResult(name, 'loaded', 0.0, None)) for name in sorted(loaded))
+		finished = queue.Queue()
+		running = set()
+		blocked = set()
+
+		def call(stage):
+			start = time.time()
+			try:
+				outputs = stage.function(values, self.options)
+				if stage.checkpoint:
+					self._write(stage.name, outputs)
+			except Exception:
+				return stage, None, time.time() - start, traceback.format_exc()
+			return stage, outputs, time.time() - start, None
+
+		pool = multiprocessing.pool.ThreadPool(max(1, threads))
+		try:
+			while pending or running:
+				for name in [n for n in self.stages if n in pending]:
+					stage = self.stages[name]
+					if any(self.producers.get(i) in blocked for i in stage.inputs):
+						pending.discard(name)
+						blocked.add(name)
+						results[name] = StageResult(name, 'skipped', 0.0, None)
+					elif all(i in values for i in stage.inputs):
+						pending.discard(name)
+						running.add(name)
+						pool.apply_async(call, (stage,), callback=finished.put)
+				if not running:
+					break
+				stage, outputs, seconds, error = finished.get()
+				running.discard(stage.name)
+				if error is None:
+					values.update(outputs)
+					results[stage.name] = StageResult(stage.name, 'done', seconds, None)
+				else:
+					blocked.add(stage.name)
+					results[stage.name] = StageResult(stage.name, 'failed', seconds, error)
+		finally:
+			pool.close()
+			pool.join()
+			if 'rom' in values:
+				values['rom'].close()
+		#Stages behind a skipped stage are only found once nothing else is running
+		for name in [n for n in self.stages if n in pending]:
+			results[name] = StageResult(name, 'skipped', 0.0, None)
+		return list(results.values())
+
+def _worker(job):
+	#Runs in the pool, a ROM that cannot be read fails as a whole instead of stopping the run
+	path, outDir, options, targets, threads, restart = job
+	try:
+		return path, Pipeline(path, outDir, options).run(targets, threads, restart)
+	except Exception:
+		return path, [StageResult('load', 'failed', 0.0, traceback.format_exc())]
+
+def runPipeline(paths, outDir, jobs=None, threads=4, options=DEFAULT_OPTIONS, targets=None, restart=False):
+	"""
+	Runs the pipeline over every ROM in paths on a pool of jobs processes (one per core by default)
+	Returns ({path: [StageResult]}, elapsed seconds)
+	"""
+	if not os.path.isdir(outDir):
+		os.makedirs(outDir)
+	if jobs is None:
+		jobs = multiprocessing.cpu_count()
+	work = [(path, outDir, options, targets, threads, restart) for path in paths]
+	results = {}
+	start = time.time()
+	if jobs == 1:
+		for path, stages in map(_worker, work):
+			results[path] = stages
+	else:
+		pool = multiprocessing.Pool(jobs)
+		try:
+			for path, stages in pool.imap_unordered(_worker, work, max(1, len(work) // (jobs * 8))):
+				results[path] = stages
+		finally:
+			pool.close()
+			pool.join()
+	return results, time.time() - start
+
+def main(argv=None):
+	#Imported here, h8_batch is only needed to list the dumps
+	import h8_batch
+
+	parser = argparse.ArgumentParser(description='Run the annotation stages over a directory of ROM dumps with checkpoints')
+	parser.add_argument('romDir', help='directory containing 0x20000 byte ROM dumps')
+	parser.add_argument('outDir', help='directory to write the checkpoints of every ROM to')
+	parser.add_argument('--jobs', type=int, default=None, help='worker processes (default: one per core)')
+	parser.add_argument('--threads', type=int, default=4, help='stages run at once per ROM (default: 4)')
+	parser.add_argument('--stages', default=None, help='comma separated stages to bring up to date (default: all)')
+	parser.add_argument('--restart', action='store_true', help='ignore the checkpoints and rerun every stage')
+	parser.add_argument('--family', default=None, help='h8_definitions family (default: the default family)')
+	parser.add_argument('--fingerprints', default=None, help='h8_fingerprint library to match functions against')
+	args = parser.parse_args(argv)
+
+	names = [stage.name for stage in STAGES]
+	targets = None
+	if args.stages is not None:
+		targets = [name.strip() for name in args.stages.split(',')]
+		unknown = [name for name in targets if name not in names]
+		if unknown:
+			parser.error('unknown stages %s, choose from %s' % (', '.join(unknown), ', '.join(names)))
+
+	paths = h8_batch.findRoms(args.romDir)
+	results, elapsed = runPipeline(paths, args.outDir, args.jobs, args.threads,
+		Options(args.family, args.fingerprints), targets, args.restart)
+
+	totals = collections.Counter()
+	failed = 0
+	for path in sorted(results):
+		stages = results[path]
+		totals.update(result.status for result in stages)
+		errors = [result for result in stages if result.status == 'failed']
+		if errors:
+			failed = failed + 1
+		for result in errors:
+			print('%s: %s failed\n%s' % (path, result.name, result.error), file=sys.stderr)
+	print('%d of %d ROMs complete in %.2fs, stages: %s' % (len(results) - failed, len(paths), elapsed,
+		', '.join('%d %s' % (totals[s], s) for s in ('done', 'loaded', 'failed', 'skipped') if totals[s])))
+	return 1 if failed else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Per step profiling of the annotation sequence
+
+Profiler wraps the IDA API functions in the namespaces the script calls them through
+(its own globals and the idc module used by h8_annotations) with call counting proxies.
+Every phase records its wall time, the API calls it made by function, the names and
+comments it created and the time spent in Wait() afterwards, which is the analysis queue
+work (MakeCode, AutoMark, ...) the phase left behind. The report is JSON so runs over a
+fleet can be collected and compared:
+
+	python h8_profile.py report1.json report2.json ...
+"""
+
+from __future__ import print_function
+
+import collections
+import contextlib
+import json
+import sys
+import time
+
+#IDA API functions counted by the profiler
+API = ('AddSegEx', 'DelSeg', 'RenameSeg', 'SetSegClass', 'SetSegDefReg', 'SetSegmentType',
+	'loadfile', 'AddStrucEx', 'AddStrucMember', 'LowVoids', 'HighVoids', 'Byte', 'Word', 'Dword',
+	'PatchByte', 'PatchWord', 'PatchDword', 'MakeByte', 'MakeWord', 'MakeDword', 'MakeStructEx', 'MakeNameEx',
+	'Name', 'MakeComm', 'OpOff', 'MakeCode', 'AutoMark', 'AddCodeXref', 'add_dref',
+	'GetFchunkAttr', 'FindBinary', 'GetFlags', 'ItemSize', 'GetCommentEx', 'GetStrucIdByName', 'GetStrucSize',
+	'Rfirst0', 'Rnext0', 'Dfirst', 'Dnext', 'SetRegEx', 'GetReg')
+
+REPORT_VERSION = 1
+
+class Profiler(object):
+	"""
+	Collects one record per phase
+
+	namespaces are the dicts or modules whose API functions are wrapped while a phase runs.
+	wait is called and timed at the end of every phase, normally idc.Wait.
+	When enabled is False phase() does nothing so the script can always use it.
+	"""
+
+	def __init__(self, namespaces=(), wait=None, enabled=True):
+		self.namespaces = [getattr(n, '__dict__', n) for n in namespaces]
+		self.wait = wait
+		self.enabled = enabled
+		self.phases = []
+		self.started = time.time()
+		self._current = None
+
+	def _proxy(self, name, function):
+		def proxy(*args):
+			current = self._current
+			result = function(*args)
+			if current is not None:
+				current['calls'][name] += 1
+				if name == 'MakeNameEx' and result:
+					current['names'] += 1
+				elif name == 'MakeComm' and result:
+					current['comments'] += 1
+			return result
+		proxy.__name__ = name
+		proxy._profiled = function
+		return proxy
+
+	def _wrap(self):
+		wrapped = []
+		for namespace in self.namespaces:
+			for name in API:
+				function = namespace.get(name)
+				if function is None or hasattr(function, '_profiled'):
+					continue
+				namespace[name] = self._proxy(name, function)
+				wrapped.append((namespace, name, function))
+		return wrapped
+
+	@contextlib.contextmanager
+	def phase(self, name):
+		"""
+		Context manager profiling the code run inside it as one phase
+		"""
+		if not self.enabled:
+			yield None
+			return
+
+		record = {'name': name, 'seconds': 0.0, 'wait': 0.0, 'calls': collections.Counter(),
+			'names': 0, 'comments': 0}
+		wrapped = self._wrap()
+		self._current = record
+		started = time.time()
+		try:
+			yield record
+		finally:
+			record['seconds'] = time.time() - started
+			self._current = None
+			for namespace, functionName, function in wrapped:
+				namespace[functionName] = function
+			if self.wait is not None:
+				started = time.time()
+				self.wait()
+				record['wait'] = time.time() - started
+			record['calls'] = dict(record['calls'])
+			self.phases.append(record)
+
+	def report(self, **info):
+		"""
+		Returns the report as a dict, info is stored alongside the phases (input file, ROM hash, ...)
+		"""
+		report = {
+			'version': REPORT_VERSION,
+			'started': self.started,
+			'total': time.time() - self.started,
+			'phases': self.phases,
+		}
+		report.update(info)
+		return report
+
+	def write(self, path, **info):
+		with open(path, 'w') as f:
+			json.dump(self.report(**info), f, indent=1, sort_keys=True)
+
+def summarize(reports):
+	"""
+	Returns {phase: {'runs', 'seconds', 'maxSeconds', 'wait', 'calls'}} averaged over reports
+	"""
+	totals = collections.OrderedDict()
+	for report in reports:
+		for phase in report['phases']:
+			total = totals.setdefault(phase['name'], {'runs': 0, 'seconds': 0.0, 'maxSeconds': 0.0, 'wait': 0.0, 'calls': 0})
+			total['runs'] += 1
+			total['seconds'] += phase['seconds']
+			total['maxSeconds'] = max(total['maxSeconds'], phase['seconds'])
+			total['wait'] += phase['wait']
+			total['calls'] += sum(phase['calls'].values())
+	for total in totals.values():
+		for key in ('seconds', 'wait', 'calls'):
+			total[key] = total[key] / float(total['runs'])
+	return totals
+
+def main():
+	if len(sys.argv) < 2:
+		print('Usage: python h8_profile.py REPORT.json [REPORT.json ...]')
+		sys.exit(1)
+
+	reports = []
+	for path in sys.argv[1:]:
+		with open(path) as f:
+			reports.append(json.load(f))
+
+	print('%-22s %6s %10s %10s %10s %10s' % ('phase', 'runs', 'mean s', 'max s', 'wait s', 'API calls'))
+	for name, total in summarize(reports).items():
+		print('%-22s %6d %10.3f %10.3f %10.3f %10d' % (name, total['runs'], total['seconds'],
+			total['maxSeconds'], total['wait'], total['calls']))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,167 @@
+"""
+Headless model of the H8/500 Mode 4 Extended Max address space
+
+The ROM dump is memory mapped and laid out exactly as loadFile() lays it out in IDA:
+   0 - 3FFF      Mirror of ROM 10000 - 13FFF
+   10000 - 2FFFF ROM dump 0x0 - 0x1FFFF
+Everything else (unused area, RAM and registers) is not backed by the dump.
+
+All reads are served straight off the mmap. view() and slices return memoryviews
+so no data is copied.
+"""
+
+import collections
+import mmap
+import struct
+
+#Size of a full ROM dump
+ROM_SIZE = 0x20000
+#Address the dump is loaded at
+ROM_START = 0x10000
+ROM_END = ROM_START + ROM_SIZE
+#0x10000-0x13FFF is mirrored down to 0x0-0x3FFF
+MIRROR_END = 0x4000
+
+#Named regions as created by createSegments()
+Segment = collections.namedtuple('Segment', 'name start end sclass')
+
+SEGMENTS = (
+	Segment('Vectors', 0x0, 0x200, 'DATA'),
+	Segment('Page00', 0x0, 0x10000, 'CODE'),
+	Segment('RAM', 0xEE80, 0xFE80, 'DATA'),
+	Segment('Registers', 0xFE80, 0x10000, 'DATA'),
+	Segment('Page01', 0x10000, 0x20000, 'CODE'),
+	Segment('Page02', 0x20000, 0x30000, 'CODE'),
+)
+
+RAM_START = 0xEE80
+RAM_END = 0xFE80
+REGISTERS_START = 0xFE80
+REGISTERS_END = 0x10000
+
+_BYTE = struct.Struct('>B')
+_WORD = struct.Struct('>H')
+_DWORD = struct.Struct('>I')
+
+def romOffset(addr):
+	"""
+	Returns the offset into the ROM dump backing the address or -1 if the address is not backed by the dump
+	"""
+	if ROM_START <= addr < ROM_END:
+		return addr - ROM_START
+	if 0 <= addr < MIRROR_END:
+		return addr
+	return -1
+
+class RomSpace(object):
+	"""
+	Read only view of a ROM dump in the layout loadFile() creates in IDA
+
+	Byte(), Word() and Dword() mirror the IDA functions of the same names. H8/500 is big endian.
+	"""
+
+	def __init__(self, path=None, data=None):
+		self.path = path
+		self._file = None
+		self._map = None
+
+		if path is not None:
+			self._file = open(path, 'rb')
+			try:
+				self._map = mmap.mmap(self._file.fileno(), ROM_SIZE, access=mmap.ACCESS_READ)
+			except (ValueError, mmap.error):
+				self._file.close()
+				raise ValueError('%s is not a 0x%X byte ROM dump' % (path, ROM_SIZE))
+			data = self._map
+		elif data is None or len(data) < ROM_SIZE:
+			raise ValueError('ROM data must be at least 0x%X bytes' % ROM_SIZE)
+
+		self._data = data
+		try:
+			self.buffer = memoryview(data)[:ROM_SIZE]
+			self._oldBuffer = False
+		except TypeError:
+			#Python 2 mmap objects only expose the old buffer interface
+			self.buffer = buffer(data, 0, ROM_SIZE)
+			self._oldBuffer = True
+
+	@classmethod
+	def fromBytes(cls, data):
+		"""
+		Wraps an in memory ROM image (bytes, bytearray or anything exposing the buffer interface)
+		"""
+		return cls(data=data)
+
+	def close(self):
+		self.buffer = None
+		if self._map is not None:
+			try:
+				self._map.close()
+			except BufferError:
+				#Views handed out (e.g. NumPy arrays) are still alive
+				#The mapping is released once they are garbage collected
+				pass
+			self._map = None
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def _offset(self, addr, size):
+		offset = romOffset(addr)
+		if offset < 0 or romOffset(addr + size - 1) != offset + size - 1:
+			raise ValueError('Address range %X-%X is not backed by the ROM' % (addr, addr + size))
+		return offset
+
+	def isMapped(self, addr):
+		return romOffset(addr) >= 0
+
+	def Byte(self, addr):
+		return _BYTE.unpack_from(self._data, self._offset(addr, 1))[0]
+
+	def Word(self, addr):
+		return _WORD.unpack_from(self._data, self._offset(addr, 2))[0]
+
+	def Dword(self, addr):
+		return _DWORD.unpack_from(self._data, self._offset(addr, 4))[0]
+
+	def view(self, start, end):
+		"""
+		Returns a zero copy view of start to end (exclusive)
+		The range must not cross from the mirror into unbacked address space
+		"""
+		if end <= start:
+			return self.buffer[0:0]
+		offset = self._offset(start, end - start)
+		if self._oldBuffer:
+			return buffer(self._data, offset, end - start)
+		return self.buffer[offset:offset + end - start]
+
+	def __getitem__(self, key):
+		if isinstance(key, slice):
+			if key.step not in (None, 1):
+				raise ValueError('Stepped slices are not supported')
+			return self.view(key.start, key.stop)
+		return self.Byte(key)
+
+	def segmentAt(self, addr):
+		"""
+		Returns the innermost segment containing the address or None
+		"""
+		found = None
+		for segment in SEGMENTS:
+			if segment.start <= addr < segment.end:
+				if found is None or segment.end - segment.start < found.end - found.start:
+					found = segment
+		return found
+
+	def ranges(self):
+		"""
+		Returns the (start, end) address ranges backed by the ROM
+		"""
+		return [(0x0, MIRROR_END), (ROM_START, ROM_END)]
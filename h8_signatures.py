@@ -0,0 +1,196 @@
+"""
+Single pass byte signature scanner
+
+Every signature is compiled into one Aho-Corasick automaton so the ROM is scanned once
+no matter how many signatures there are. Signatures use the same text format as FindBinary
+with ?? marking a wildcard byte. The longest run of fixed bytes in each signature is used as
+its anchor in the automaton and the remaining bytes are checked when the anchor matches.
+"""
+
+import collections
+
+Signature = collections.namedtuple('Signature', 'name pattern comment')
+Match = collections.namedtuple('Match', 'signature address')
+
+#Signatures for functions that move between ROMs
+KNOWN_SIGNATURES = (
+	#Output pin read function
+	#BF 90 			mov:g.w r0, @-sp
+	#BF 98 			stc.w   sr, @-sp
+	#0C 07 00 48 	orc.w   #0x700:16, sr
+	#15 FE 97 D0 	bclr.b  #0:16, @PortC_PCDR:16
+	#15 FE 97 D1 	bclr.b  #1:16, @PortC_PCDR:16
+	#00 			nop
+	#00 			nop
+	#00 			nop
+	#00 			nop
+	Signature('read_output_pins', 'BF 90 BF 98 0C 07 00 48 15 FE 97 D0 15 FE 97 D1 00 00 00 00',
+		'Read ECU output pins using bit 0 and 1 PortC_PCDR switch'),
+
+	#ADC read function
+	#F8 FE A0 80 	mov:g.w @(0xFEA0:16,r0), r0
+	#15 FE B8 D7	bclr.b  #7:16, @AD_ADCSR:16
+	Signature('read_adc_sensor', 'F8 FE A0 80 15 FE B8 D7',
+		'Look up the current value in the ADC data register FEA0 + R0'),
+)
+
+def parsePattern(pattern):
+	"""
+	Converts a FindBinary style pattern into a list of byte values with None for wildcards
+	"""
+	values = []
+	for token in pattern.split():
+		if token.strip('?') == '':
+			values.append(None)
+		else:
+			values.append(int(token, 16))
+	if not values:
+		raise ValueError('Empty signature pattern')
+	return values
+
+def _anchor(values):
+	"""
+	Returns (start, end) of the longest run of fixed bytes in a parsed pattern
+	"""
+	best = (0, 0)
+	start = None
+	for i, value in enumerate(values + [None]):
+		if value is None:
+			if start is not None and i - start > best[1] - best[0]:
+				best = (start, i)
+			start = None
+		elif start is None:
+			start = i
+	return best
+
+class SignatureSet(object):
+	"""
+	Compiled set of signatures scanned in a single pass
+	"""
+
+	def __init__(self, signatures=KNOWN_SIGNATURES):
+		self.signatures = list(signatures)
+		self._compile()
+
+	def _compile(self):
+		goto = [{}]
+		outputs = [[]]
+		#Per signature (length, anchor end, [(position, value)] of bytes outside the anchor)
+		self._checks = []
+
+		for index, signature in enumerate(self.signatures):
+			values = parsePattern(signature.pattern)
+			start, end = _anchor(values)
+			if start == end:
+				raise ValueError('Signature %s has no fixed bytes' % signature.name)
+
+			state = 0
+			for value in values[start:end]:
+				nextState = goto[state].get(value)
+				if nextState is None:
+					nextState = len(goto)
+					goto[state][value] = nextState
+					goto.append({})
+					outputs.append([])
+				state = nextState
+			outputs[state].append(index)
+
+			extra = [(i, v) for i, v in enumerate(values) if v is not None and not start <= i < end]
+			self._checks.append((len(values), end, extra))
+
+		#Build the full transition table breadth first so the scan never follows failure links
+		delta = [None] * len(goto)
+		fail = [0] * len(goto)
+		delta[0] = [goto[0].get(b, 0) for b in range(256)]
+		queue = collections.deque(goto[0].values())
+		while queue:
+			state = queue.popleft()
+			row = list(delta[fail[state]])
+			for value, nextState in goto[state].items():
+				row[value] = nextState
+				fail[nextState] = delta[fail[state]][value]
+				outputs[nextState] = outputs[nextState] + outputs[fail[nextState]]
+				queue.append(nextState)
+			delta[state] = row
+
+		self._delta = delta
+		self._outputs = [tuple(o) if o else None for o in outputs]
+
+	def scan(self, data, base=0):
+		"""
+		Scans a buffer once and returns every Match in address order
+		base is the address of the first byte of data
+		"""
+		data = bytearray(data)
+		size = len(data)
+		delta = self._delta
+		outputs = self._outputs
+		checks = self._checks
+		signatures = self.signatures
+		matches = []
+
+		state = 0
+		for i, value in enumerate(data):
+			state = delta[state][value]
+			found = outputs[state]
+			if found is None:
+				continue
+			for index in found:
+				length, anchorEnd, extra = checks[index]
+				start = i + 1 - anchorEnd
+				if start < 0 or start + length > size:
+					continue
+				for position, expected in extra:
+					if data[start + position] != expected:
+						break
+				else:
+					matches.append(Match(signatures[index], base + start))
+
+		matches.sort(key=lambda m: m.address)
+		return matches
+
+	def scanRom(self, rom, start=0x0):
+		"""
+		Scans every ROM backed range of a RomSpace from start upwards
+		"""
+		matches = []
+		for rangeStart, rangeEnd in rom.ranges():
+			rangeStart = max(rangeStart, start)
+			if rangeStart < rangeEnd:
+				matches.extend(self.scan(rom.view(rangeStart, rangeEnd), rangeStart))
+		return matches
+
+	def findFirst(self, rom, start=0x0):
+		"""
+		Returns {name: address} of the first match of each signature like FindBinary(start, SEARCH_DOWN)
+		"""
+		found = {}
+		for match in self.scanRom(rom, start):
+			found.setdefault(match.signature.name, match.address)
+		return found
+
+def findFunctions(rom, functionStart, signatures=None, start=0x1400):
+	"""
+	Scans a ROM for every signature and maps each first hit to its containing function
+
+	functionStart is called with a match address and returns the start of the function
+	containing it or None. Returns a list of (Signature, function address, match address).
+	"""
+	if signatures is None:
+		signatures = _knownSet()
+	found = signatures.findFirst(rom, start)
+	results = []
+	for signature in signatures.signatures:
+		address = found.get(signature.name)
+		if address is None:
+			continue
+		results.append((signature, functionStart(address), address))
+	return results
+
+_known = []
+
+def _knownSet():
+	#Compile the built in signatures once per process
+	if not _known:
+		_known.append(SignatureSet(KNOWN_SIGNATURES))
+	return _known[0]
@@ -0,0 +1,309 @@
+"""
+Synthetic H8/500 ROM generator
+
+Builds 0x20000 byte dumps in the layout the ECUs use with a valid vector table, DTC vectors
+pointing at register information blocks, a MUT pointer table into RAM, the known fixed
+address functions and the KNOWN_SIGNATURES functions called from the reset handler, which
+also looks up a few axis tables and calibration maps in page 1. table_lookup_byte and
+table_lookup_word are working stand-ins (see lookupRoutine()) so h8_interp and h8_emulator
+can be checked against each other.
+Everything else is filled with pseudo random calibration data. ROMs are reproducible from
+their seed (per Python version, random differs between 2 and 3) so a fleet can be
+regenerated anywhere for benchmarks.
+
+	python h8_synth.py OUT_DIR [--count N] [--seed S]
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import hashlib
+import os
+import random
+import struct
+
+import h8_analysis
+import h8_rom
+import h8_signatures
+
+#Layout of the generated ROMs, addresses as loaded in IDA
+RESET_HANDLER = 0x1000
+DEFAULT_HANDLER = 0x0FF0
+DTC_BLOCKS = 0x0300
+SIGNATURE_START = 0x1400
+SIGNATURE_END = 0x3F00
+RAM_START = h8_rom.RAM_START
+RAM_END = h8_rom.RAM_END
+
+#copy_flash_code as generated: copies @r4+ (EP page) to 0xF290 onwards until r4 reaches r1
+#   mov:i #0xF290, r2 / mov:g.b @r4+, r0 / mov:g.b r0, @r2 / add:q.w #1, r2 / cmp:g.w r4, r1 / bne / prts
+COPY_FLASH_CODE = (0x5A, 0xF2, 0x90, 0xC4, 0x80, 0xD2, 0x90, 0xAA, 0x08, 0xAC, 0x71, 0x26, 0xF6, 0x11, 0x19)
+FLASH_DESTINATION = 0xF290
+FLASH_SOURCE = 0x20040
+#Axis tables and maps, see h8_maps.STRUCTS
+MAP_AREA = 0x18000
+MAP_KINDS = ('map_3d_byte', 'map_3d_word', 'map_2d_byte', 'map_2d_word')
+AXES = 4
+MAPS = 8
+
+#Opcodes used to build the handlers
+LDC_IMM8 = 0x04
+LDC_EP = 0x8C
+MOV_I = 0x58
+PJSR = 0x03
+MOV_DISP16 = 0xF8
+JSR = 0x18
+RTS = 0x19
+RTE = 0x0A
+BRA = 0x20
+BCS = 0x25
+BEQ = 0x27
+BRA16 = 0x30
+BSR = 0x0E
+BSR16 = 0x1E
+PRTS = (0x11, 0x19)
+
+Synthetic = collections.namedtuple('Synthetic', 'data seed functions dtcBlocks mutPointers flashCode axes maps')
+
+def _filler(seed, size):
+	#Pseudo random bytes from SHA-256 in counter mode, much faster than random.getrandbits per byte
+	blocks = []
+	prefix = ('h8_synth:%d:' % seed).encode('ascii')
+	for counter in range((size + 31) // 32):
+		blocks.append(hashlib.sha256(prefix + str(counter).encode('ascii')).digest())
+	return bytearray(b''.join(blocks)[:size])
+
+def _put(data, addr, values):
+	offset = h8_rom.romOffset(addr)
+	if offset < 0:
+		raise ValueError('Address %X is not backed by the ROM' % addr)
+	data[offset:offset + len(values)] = bytearray(values)
+
+def _assemble(address, items):
+	#Resolves ('label', name), (branch opcode, name) and (16 bit branch opcode, name, 16) items to bytes
+	labels = {}
+	offset = 0
+	for item in items:
+		if isinstance(item, tuple) and item[0] == 'label':
+			labels[item[1]] = address + offset
+		elif isinstance(item, tuple):
+			offset = offset + (3 if len(item) == 3 else 2)
+		else:
+			offset = offset + 1
+	code = []
+	for item in items:
+		if isinstance(item, tuple) and item[0] == 'label':
+			continue
+		if isinstance(item, tuple):
+			here = address + len(code)
+			if len(item) == 3:
+				displacement = labels[item[1]] - here - 3
+				code.extend([item[0], (displacement >> 8) & 0xFF, displacement & 0xFF])
+			else:
+				displacement = labels[item[1]] - here - 2
+				if not -0x80 <= displacement < 0x80:
+					raise ValueError('Branch to %s out of range' % item[1])
+				code.extend([item[0], displacement & 0xFF])
+		else:
+			code.append(item)
+	return code
+
+def lookupRoutine(address, word, page=MAP_AREA >> 16):
+	"""
+	Returns the code of table_lookup_byte (word False) or table_lookup_word assembled at address
+
+	The map address in page is passed in r0 and the value is returned in r0, a convention
+	of this generator: the ROM routines take the table on the stack. The routine
+	reads the 8.8 indices from the RAM variables of the map header (through DP, which must
+	be page 0), interpolates a + (b - a) * fraction / 256 on the magnitude of the difference
+	along x and then y, adds the adder and returns with prts.
+	"""
+	size = 2 if word else 1
+	#Header offsets, see h8_maps.STRUCTS
+	adder, indexX, indexY, nrows = (2, 4, 6, 8) if word else (1, 2, 4, 6)
+	data2d = indexY
+	data3d = nrows + size
+
+	def load(reg, displacement, base):
+		#Zero extended cell at @(displacement, base) into reg
+		if word:
+			return [0xE8 | base, displacement, 0x80 | reg]
+		return [MOV_I | reg, 0, 0, 0xE0 | base, displacement, 0x80 | reg]
+
+	def low(reg):
+		#and.w #0xFF, reg
+		return [0x0C, 0x00, 0xFF, 0x50 | reg]
+
+	shll = lambda reg: [0xA8 | reg, 0x1A] if word else []
+	items = [LDC_IMM8, page, LDC_EP, 0xA8, 0x85]
+	#r3 = x index
+	items += [0xED, indexX, 0x80, 0xD8, 0x83]
+	items += [0xDD, 0x05, 0x00, 0x03] if word else [0xD5, 0x04, 0x03]
+	items += [(BEQ, 'map3d')]
+	#2D: r4 = cell x0
+	items += [0xAB, 0x84, 0xAC, 0x10] + low(4) + shll(4) + [0xAD, 0x24]
+	items += load(1, data2d, 4) + load(2, data2d + size, 4) + low(3) + [(BSR16, 'interpolate', 16)]
+	items += [('label', 'finish')] + load(4, adder, 5) + [0xAC, 0x21, 0xA9, 0x80] + list(PRTS)
+
+	#3D: y index pushed, r1 = y0 * nrows, r4 = cell (x0, y0), r0 = row stride
+	items += [('label', 'map3d'), 0xED, indexY, 0x80, 0xD8, 0x82, 0xBF, 0x92]
+	items += [0xAA, 0x81, 0xA9, 0x10] + low(1) + load(0, nrows, 5)
+	items += [0xA8, 0xA9, 0xAA, 0x81] + shll(1) + shll(0) + [0xAD, 0x21]
+	items += [0xAB, 0x84, 0xAC, 0x10] + low(4) + shll(4) + [0xA9, 0x24, 0xBF, 0x94, 0xBF, 0x90] + low(3)
+	items += load(1, data3d, 4) + load(2, data3d + size, 4) + [(BSR16, 'interpolate', 16)]
+	#Row y0 + 1 with the top value pushed
+	items += [0xCF, 0x80, 0xCF, 0x84, 0xBF, 0x91, 0xA8, 0x24]
+	items += load(1, data3d, 4) + load(2, data3d + size, 4) + [(BSR16, 'interpolate', 16)]
+	items += [0xA9, 0x82, 0xCF, 0x81, 0xCF, 0x83] + low(3) + [(BSR16, 'interpolate', 16), (BRA16, 'finish', 16)]
+
+	#r1 = interpolation of r1 and r2 at fraction r3, r3 and r5 are kept
+	items += [('label', 'interpolate'), 0xA9, 0x72, (BCS, 'down'), 0xA9, 0x32, (BSR, 'scale'), 0xAA, 0x21, RTS]
+	items += [('label', 'down'), 0xA9, 0x84, 0xAA, 0x34, 0xAC, 0x82, (BSR, 'scale'), 0xAA, 0x31, RTS]
+	#r2 = r2 * r3 >> 8 with mulxu.w into r2:r3
+	items += [('label', 'scale'), 0xBF, 0x93, 0xAB, 0xAA, 0xAA, 0x10, 0xAB, 0x10] + low(3)
+	items += [0xAB, 0x42, 0xCF, 0x83, RTS]
+	return _assemble(address, items)
+
+def _putDword(data, addr, value):
+	_put(data, addr, struct.pack('>I', value))
+
+def _putWord(data, addr, value):
+	_put(data, addr, struct.pack('>H', value))
+
+def synthRom(seed=0, mutStart=h8_analysis.MUT_TABLE_START, mutEnd=h8_analysis.MUT_TABLE_END,
+		signatures=h8_signatures.KNOWN_SIGNATURES):
+	"""
+	Returns a Synthetic ROM for a seed
+
+	functions maps each signature name to the address of the function it was placed in,
+	dtcBlocks lists the DTC register information block addresses, mutPointers the MUT
+	table entries in order and flashCode the (start, end) copy_flash_code is called with.
+	axes lists the axis_table addresses and maps the (address, kind) of every map.
+	"""
+	rng = random.Random(seed)
+	data = _filler(seed, h8_rom.ROM_SIZE)
+
+	#Page 0 code area is blanked so only the generated code decodes
+	data[0:SIGNATURE_END] = bytearray(b'\xFF' * SIGNATURE_END)
+
+	#Vector table, every exception vector points at the reset handler or a shared rte
+	_putDword(data, h8_analysis.VECTOR_TABLE_START, RESET_HANDLER)
+	for addr in range(h8_analysis.VECTOR_TABLE_START + 4, h8_analysis.DTC_VECTORS_START, 4):
+		_putDword(data, addr, DEFAULT_HANDLER)
+	_put(data, DEFAULT_HANDLER, [RTE])
+
+	#DTC vectors each point at an 8 byte register information block
+	dtcBlocks = []
+	for i, addr in enumerate(range(h8_analysis.DTC_VECTORS_START, h8_analysis.VECTOR_TABLE_END, 4)):
+		block = DTC_BLOCKS + i * 8
+		_putDword(data, addr, block)
+		_put(data, block, struct.pack('>HHHH', rng.randrange(0x10000), rng.randrange(RAM_START, RAM_END),
+			rng.randrange(RAM_START, RAM_END), rng.randrange(1, 0x100)))
+		dtcBlocks.append(block)
+
+	#Signature functions at random non overlapping addresses, called from the reset handler
+	functions = {}
+	reset = []
+	slot = (SIGNATURE_END - SIGNATURE_START) // max(len(signatures), 1)
+	for i, signature in enumerate(signatures):
+		values = [rng.randrange(0x100) if v is None else v for v in h8_signatures.parsePattern(signature.pattern)]
+		start = SIGNATURE_START + i * slot
+		address = start + rng.randrange(0, max(slot - len(values) - 1, 1))
+		_put(data, address, values + [RTS])
+		functions[signature.name] = address
+		reset.extend([JSR, (address >> 8) & 0xFF, address & 0xFF])
+	#Reflash code copied from page 2 into RAM, ldc.b #2, ep / mov:i #start, r4 / mov:i #end, r1 / pjsr copy_flash_code
+	copyFlashCode = h8_analysis.KNOWN_FUNCTIONS[2].address
+	flashStart = FLASH_SOURCE + rng.randrange(0, 0x100)
+	flashEnd = flashStart + rng.randrange(0x400, 0xA00)
+	reset.extend([LDC_IMM8, flashStart >> 16, LDC_EP,
+		MOV_I | 4, (flashStart >> 8) & 0xFF, flashStart & 0xFF,
+		MOV_I | 1, (flashEnd >> 8) & 0xFF, flashEnd & 0xFF,
+		PJSR, copyFlashCode >> 16, (copyFlashCode >> 8) & 0xFF, copyFlashCode & 0xFF])
+
+	#Axis tables with ascending breakpoints, each one looked up with mov:i #axis, r0 / pjsr axis_lookup
+	lookups = dict((f.name, f.address) for f in h8_analysis.KNOWN_FUNCTIONS)
+	address = MAP_AREA
+	axes = []
+	for i in range(AXES):
+		length = rng.randrange(4, 17)
+		points = sorted(rng.sample(range(0x10000), length))
+		_put(data, address, struct.pack('>HHH', RAM_START + 0x100 + i * 2, RAM_START + 0x200 + i * 2, length))
+		_put(data, address + 6, struct.pack('>%dH' % length, *points))
+		axes.append((address, RAM_START + 0x100 + i * 2, length))
+		address = address + 6 + length * 2
+
+	#Maps over those axes, each one looked up with mov:i #map, r0 / pjsr table_lookup_byte or table_lookup_word
+	maps = []
+	calls = []
+	for i in range(MAPS):
+		kind = MAP_KINDS[i % len(MAP_KINDS)]
+		word = kind.endswith('word')
+		x = axes[rng.randrange(AXES)]
+		y = axes[rng.randrange(AXES)]
+		if kind.startswith('map_3d'):
+			header = struct.pack('>HHHHH' if word else '>BBHHB', 3, rng.randrange(0x100), x[1], y[1], x[2])
+			count = x[2] * y[2]
+		else:
+			header = struct.pack('>HHH' if word else '>BBH', 2, rng.randrange(0x100), x[1])
+			count = x[2]
+		values = [rng.randrange(0x10000 if word else 0x100) for j in range(count)]
+		_put(data, address, header + struct.pack(('>%dH' if word else '>%dB') % count, *values))
+		maps.append((address, kind))
+		calls.append((address, lookups['table_lookup_word' if word else 'table_lookup_byte']))
+		#Next structure starts on a word boundary
+		address = address + len(header) + count * (2 if word else 1)
+		address = address + (address & 1)
+	for axis in axes:
+		calls.append((axis[0], lookups['axis_lookup']))
+	for structure, routine in calls:
+		reset.extend([MOV_I, (structure >> 8) & 0xFF, structure & 0xFF,
+			PJSR, routine >> 16, (routine >> 8) & 0xFF, routine & 0xFF])
+
+	#The MUT handler reads entries with mov:g.w @(table:16, r0), r0
+	reset.extend([MOV_DISP16, (mutStart >> 8) & 0xFF, mutStart & 0xFF, 0x80])
+	_put(data, RESET_HANDLER, reset + [BRA, 0xFE])
+
+	#Fixed address functions only need to decode, the table lookups also run
+	for function in h8_analysis.KNOWN_FUNCTIONS:
+		_put(data, function.address, [RTS])
+	for name in ('table_lookup_byte', 'table_lookup_word'):
+		_put(data, lookups[name], lookupRoutine(lookups[name], name.endswith('word')))
+	_put(data, copyFlashCode, COPY_FLASH_CODE)
+
+	#MUT table of RAM pointers, odd entries address the low byte of a word
+	mutPointers = []
+	for addr in range(mutStart, mutEnd + 1, 2):
+		pointer = rng.randrange(RAM_START, RAM_END)
+		_putWord(data, addr, pointer)
+		mutPointers.append(pointer)
+
+	return Synthetic(data, seed, functions, dtcBlocks, mutPointers, (flashStart, flashEnd), [a[0] for a in axes], maps)
+
+def writeFleet(directory, count, seed=0):
+	"""
+	Writes count synthetic ROMs named synth_<seed>.bin to directory and returns their paths
+	"""
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+	paths = []
+	for i in range(seed, seed + count):
+		path = os.path.join(directory, 'synth_%06d.bin' % i)
+		with open(path, 'wb') as f:
+			f.write(synthRom(i).data)
+		paths.append(path)
+	return paths
+
+def main():
+	parser = argparse.ArgumentParser(description='Write synthetic H8/500 ROM dumps')
+	parser.add_argument('outDir')
+	parser.add_argument('--count', type=int, default=1)
+	parser.add_argument('--seed', type=int, default=0)
+	args = parser.parse_args()
+
+	paths = writeFleet(args.outDir, args.count, args.seed)
+	print('Wrote %d ROMs to %s' % (len(paths), args.outDir))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,325 @@
+"""
+Headless cross reference graph
+
+Cross references are collected from h8_decoder disassemblies: calls and jumps between
+code, absolute reads and writes of RAM and registers, 16 bit displacements addressing
+tables, immediates holding the address of a known ROM table or RAM variable, and the vector
+table entries. Absolute operands use the br and dp h8_pages finds at each instruction, and
+a displacement the page register of its base register (dp for R0-R3, ep for R4 and R5, tp
+for R6 and R7). Displacements whose page is not a known constant are left out. An immediate
+is not page relative, so it is only kept when it matches a table h8_mapscan found looked up
+by the code, or a RAM variable some instruction accesses. Edges are stored in
+compressed sparse row arrays in both directions so the references from or to an address
+are one binary search and one slice:
+
+   nodes    sorted unique source (or target) keys
+   indptr   edges of nodes[i] are indptr[i]:indptr[i + 1]
+   targets  key at the other end of each edge
+   kinds    XREF_* bits of each edge
+   owners   function entry key of the instruction making the reference (-1 for vectors)
+
+Keys are romIndex << 24 | address so one graph can hold a whole fleet of ROMs.
+
+	python h8_xrefs.py ROM_DIR GRAPH.npz
+	python h8_xrefs.py --graph GRAPH.npz --to 0xF0A0 [--rom 0]
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+
+import numpy
+
+import h8_analysis
+import h8_decoder
+import h8_mapscan
+import h8_pages
+import h8_rom
+
+XREF_CALL = 0x01
+XREF_JUMP = 0x02
+XREF_READ = 0x04
+XREF_WRITE = 0x08
+#Displacement or immediate holding the address of a table or variable
+XREF_OFFSET = 0x10
+XREF_VECTOR = 0x20
+
+XREF_CODE = XREF_CALL | XREF_JUMP | XREF_VECTOR
+XREF_DATA = XREF_READ | XREF_WRITE | XREF_OFFSET
+XREF_ALL = 0xFF
+
+KEY_SHIFT = 24
+ADDRESS_MASK = (1 << KEY_SHIFT) - 1
+
+Csr = collections.namedtuple('Csr', 'nodes indptr targets kinds owners')
+
+def key(romIndex, address):
+	return (romIndex << KEY_SHIFT) | address
+
+def splitKeys(keys):
+	"""
+	Returns (rom indices, addresses) of an array of keys
+	"""
+	keys = numpy.asarray(keys, dtype=numpy.int64)
+	return keys >> KEY_SHIFT, keys & ADDRESS_MASK
+
+#Index in an h8_pages state of the page register a displacement off each base register uses
+_DISPLACEMENT_PAGES = (1, 1, 1, 1, 2, 2, 3, 3)
+
+def _displacementPage(pages, insn):
+	#Page of a 16 bit displacement, None when the code does not set its page register to a constant.
+	#The state is read before VARYING is replaced with the defaults the decoder resolves with
+	state = pages.insnStates().get(insn.address, pages.default)
+	page = state[_DISPLACEMENT_PAGES[insn.eareg]]
+	return None if page == h8_pages.VARYING else page
+
+def romStructures(disassembly):
+	"""
+	Returns {16 bit address: address} of the maps and axis tables h8_mapscan finds looked up by the code
+	Addresses whose low 16 bits are shared by several structures are left out
+	"""
+	axes, maps = h8_mapscan.scanMaps(disassembly.rom, disassembly)
+	found = {}
+	for structure in axes + maps:
+		low = structure.address & 0xFFFF
+		found[low] = None if found.get(low, structure.address) != structure.address else structure.address
+	return dict((low, address) for low, address in found.items() if address is not None)
+
+def edges(disassembly, romIndex=0, structures=None, pages=None):
+	"""
+	Returns (sources, targets, kinds, owners) arrays for every reference in a disassembly
+	structures is {16 bit value: address} of the ROM tables an immediate can hold, romStructures() by default.
+	pages is the h8_pages.PageRegisters of the disassembly, propagated again when None.
+	"""
+	if pages is None:
+		pages = h8_pages.propagate(disassembly)
+	sources = []
+	targets = []
+	kinds = []
+	owners = []
+	base = romIndex << KEY_SHIFT
+	owner = {}
+
+	def ownerOf(addr):
+		entry = owner.get(addr)
+		if entry is None:
+			found = disassembly.functionContaining(addr)
+			entry = owner[addr] = -1 if found is None else base | found
+		return entry
+
+	def add(source, target, kind):
+		sources.append(base | source)
+		targets.append(base | target)
+		kinds.append(kind)
+		owners.append(ownerOf(source))
+
+	if structures is None:
+		structures = romStructures(disassembly)
+	memory = disassembly.memory
+	for addr, insn in disassembly.insns.items():
+		flow = insn.flow
+		if insn.target is not None:
+			add(addr, insn.target, XREF_CALL if flow == h8_decoder.FLOW_CALL else XREF_JUMP)
+		if insn.ea == h8_decoder.EA_DISP and insn.value > 0xFF:
+			page = _displacementPage(pages, insn)
+			if page is not None:
+				add(addr, (page << 16) | insn.value, XREF_OFFSET)
+		elif insn.mnemonic == 'mov:i' and insn.imm > 0xFF:
+			if insn.imm in structures:
+				add(addr, structures[insn.imm], XREF_OFFSET)
+			elif h8_rom.RAM_START <= insn.imm < h8_rom.REGISTERS_END and insn.imm in memory:
+				add(addr, insn.imm, XREF_OFFSET)
+
+	for address, accesses in disassembly.memory.items():
+		for addr, access in accesses:
+			kind = 0
+			if access & h8_decoder.ACCESS_READ:
+				kind = kind | XREF_READ
+			if access & h8_decoder.ACCESS_WRITE:
+				kind = kind | XREF_WRITE
+			add(addr, address, kind or XREF_READ)
+
+	rom = disassembly.rom
+	for addr in range(h8_analysis.VECTOR_TABLE_START, h8_analysis.VECTOR_TABLE_END, 4):
+		target = rom.Dword(addr)
+		if target >= 0x200 and (rom.isMapped(target) or h8_rom.RAM_START <= target < h8_rom.REGISTERS_END):
+			sources.append(base | addr)
+			targets.append(base | target)
+			kinds.append(XREF_VECTOR)
+			owners.append(-1)
+
+	return (numpy.array(sources, dtype=numpy.int64), numpy.array(targets, dtype=numpy.int64),
+		numpy.array(kinds, dtype=numpy.uint8), numpy.array(owners, dtype=numpy.int64))
+
+def _csr(sources, targets, kinds, owners):
+	#Sorts edges by source and compresses the sources into nodes/indptr
+	order = numpy.lexsort((targets, sources))
+	sources = sources[order]
+	nodes, starts = numpy.unique(sources, return_index=True)
+	indptr = numpy.append(starts, len(sources)).astype(numpy.int64)
+	return Csr(nodes, indptr, targets[order], kinds[order], owners[order])
+
+class XrefGraph(object):
+	"""
+	Cross reference graph over one or more ROMs
+
+	forward is indexed by the referencing address, reverse by the referenced address.
+	"""
+
+	def __init__(self, forward, reverse, names=()):
+		self.forward = forward
+		self.reverse = reverse
+		#ROM path or name per rom index
+		self.names = list(names)
+
+	@classmethod
+	def fromEdges(cls, sources, targets, kinds, owners, names=()):
+		forward = _csr(sources, targets, kinds, owners)
+		#Reverse edges keep the owner of the referencing instruction
+		reverse = _csr(targets, sources, kinds, owners)
+		return cls(forward, reverse, names)
+
+	@classmethod
+	def build(cls, disassemblies, names=()):
+		"""
+		Builds the graph of a list of disassemblies, the list index is the rom index in the keys
+		"""
+		parts = [edges(disassembly, i) for i, disassembly in enumerate(disassemblies)]
+		if not parts:
+			empty = numpy.zeros(0, dtype=numpy.int64)
+			return cls.fromEdges(empty, empty, numpy.zeros(0, dtype=numpy.uint8), empty, names)
+		return cls.fromEdges(*[numpy.concatenate(columns) for columns in zip(*parts)], names=names)
+
+	def __len__(self):
+		return len(self.forward.targets)
+
+	@staticmethod
+	def _row(csr, nodeKey):
+		i = numpy.searchsorted(csr.nodes, nodeKey)
+		if i == len(csr.nodes) or csr.nodes[i] != nodeKey:
+			return slice(0, 0)
+		return slice(csr.indptr[i], csr.indptr[i + 1])
+
+	def _select(self, csr, nodeKey, kinds, column):
+		row = self._row(csr, nodeKey)
+		values = column[row]
+		if kinds != XREF_ALL:
+			values = values[(csr.kinds[row] & kinds) != 0]
+		return values
+
+	def refsFrom(self, nodeKey, kinds=XREF_ALL):
+		"""
+		Returns the keys referenced by the instruction (or vector) at nodeKey
+		"""
+		return self._select(self.forward, nodeKey, kinds, self.forward.targets)
+
+	def refsTo(self, nodeKey, kinds=XREF_ALL):
+		"""
+		Returns the keys of the instructions (and vectors) referencing nodeKey
+		"""
+		return self._select(self.reverse, nodeKey, kinds, self.reverse.targets)
+
+	def functionsReferencing(self, nodeKey, kinds=XREF_ALL):
+		"""
+		Returns the sorted unique function entry keys whose code references nodeKey
+		e.g. functionsReferencing(key(0, rpmAddress), XREF_READ) for the functions reading RPM
+		"""
+		owners = self._select(self.reverse, nodeKey, kinds, self.reverse.owners)
+		return numpy.unique(owners[owners >= 0])
+
+	def _expand(self, csr, frontier, kinds, column):
+		#Every edge of every node in frontier in one vectorized gather
+		positions = numpy.searchsorted(csr.nodes, frontier)
+		positions = positions[positions < len(csr.nodes)]
+		positions = positions[numpy.isin(csr.nodes[positions], frontier)]
+		if len(positions) == 0:
+			return column[:0]
+		starts = csr.indptr[positions]
+		counts = csr.indptr[positions + 1] - starts
+		offsets = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts) + numpy.arange(counts.sum())
+		values = column[offsets]
+		if kinds != XREF_ALL:
+			values = values[(csr.kinds[offsets] & kinds) != 0]
+		return values
+
+	def reaching(self, nodeKey, kinds=XREF_CODE, maxDepth=None):
+		"""
+		Returns every function entry and vector key from which nodeKey can be reached through kinds edges
+		Walks callers of callers (and the vectors pointing at them) breadth first
+		"""
+		seen = numpy.array([nodeKey], dtype=numpy.int64)
+		frontier = seen
+		depth = 0
+		while len(frontier) and (maxDepth is None or depth < maxDepth):
+			#Instructions referencing the frontier and the functions they are in
+			owners = self._expand(self.reverse, frontier, kinds, self.reverse.owners)
+			sources = self._expand(self.reverse, frontier, kinds, self.reverse.targets)
+			vectors = sources[self._isVector(sources)]
+			found = numpy.unique(numpy.concatenate((owners[owners >= 0], vectors)))
+			frontier = numpy.setdiff1d(found, seen, assume_unique=True)
+			seen = numpy.union1d(seen, frontier)
+			depth = depth + 1
+		return numpy.setdiff1d(seen, [nodeKey])
+
+	@staticmethod
+	def _isVector(keys):
+		addresses = keys & ADDRESS_MASK
+		return (addresses >= h8_analysis.VECTOR_TABLE_START) & (addresses < h8_analysis.VECTOR_TABLE_END)
+
+	def save(self, path):
+		arrays = {'names': numpy.array(self.names, dtype=object)}
+		for prefix, csr in (('forward', self.forward), ('reverse', self.reverse)):
+			for field in Csr._fields:
+				arrays['%s_%s' % (prefix, field)] = getattr(csr, field)
+		numpy.savez(path, **arrays)
+
+	@classmethod
+	def load(cls, path):
+		data = numpy.load(path, allow_pickle=True)
+		forward = Csr(*[data['forward_%s' % field] for field in Csr._fields])
+		reverse = Csr(*[data['reverse_%s' % field] for field in Csr._fields])
+		return cls(forward, reverse, [str(name) for name in data['names']])
+
+def buildFleet(paths):
+	"""
+	Disassembles every ROM in paths and returns their combined XrefGraph, rom indices follow paths
+	"""
+	parts = []
+	for i, path in enumerate(paths):
+		with h8_rom.RomSpace(path) as rom:
+			disassembly = h8_decoder.disassemble(rom)
+			parts.append(edges(disassembly, i, pages=h8_pages.resolvePages(disassembly)))
+	if not parts:
+		return XrefGraph.build([], paths)
+	return XrefGraph.fromEdges(*[numpy.concatenate(columns) for columns in zip(*parts)], names=paths)
+
+def main():
+	#Imported here to keep the module importable without the batch tooling
+	import h8_batch
+
+	parser = argparse.ArgumentParser(description='Build or query a cross reference graph of ROM dumps')
+	parser.add_argument('romDir', nargs='?', help='directory of ROM dumps to build the graph from')
+	parser.add_argument('output', nargs='?', help='file to save the graph to')
+	parser.add_argument('--graph', help='saved graph to query')
+	parser.add_argument('--to', type=lambda x: int(x, 0), help='address to list the references to')
+	parser.add_argument('--rom', type=int, default=0, help='rom index of the address')
+	args = parser.parse_args()
+
+	if args.graph:
+		graph = XrefGraph.load(args.graph)
+	else:
+		graph = buildFleet(h8_batch.findRoms(args.romDir))
+		if args.output:
+			graph.save(args.output)
+		print('%d references over %d ROMs' % (len(graph), len(graph.names)))
+
+	if args.to is not None:
+		nodeKey = key(args.rom, args.to)
+		for source in graph.refsTo(nodeKey):
+			print('%X' % (int(source) & ADDRESS_MASK))
+		functions = graph.functionsReferencing(nodeKey)
+		print('Functions: ' + ' '.join('%X' % (int(f) & ADDRESS_MASK) for f in functions))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import h8_annotations
+import h8_annotdb
+import h8_definitions
+
+def _plan(n):
+	plan = h8_annotations.AnnotationPlan()
+	plan.name(0x100 + n, 'name_%d' % n, 'check')
+	plan.comment(0x200, 'comment %d' % n)
+	plan.makeType(0x300, 'word')
+	return plan
+
+class AnnotationDatabaseTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'annotations.db')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def testTwoRoms(self):
+		with h8_annotdb.AnnotationDatabase(self.path) as db:
+			db.write('registers', _plan(0))
+			db.write('mut_table', _plan(1), 'aaaa')
+			db.write('mut_table', _plan(2), 'bbbb')
+			#Exporting the first ROM again only replaces its own plan
+			db.write('mut_table', _plan(3), 'aaaa')
+
+		with h8_annotdb.AnnotationDatabase(self.path) as db:
+			self.assertEqual(db.steps(), [('mut_table', 'aaaa'), ('mut_table', 'bbbb'), ('registers', None)])
+			self.assertEqual(db.steps('bbbb'), [('mut_table', 'bbbb'), ('registers', None)])
+			self.assertEqual(list(db.read(['mut_table'], 'aaaa')), list(_plan(3)))
+			self.assertEqual(list(db.read(['mut_table'], 'bbbb')), list(_plan(2)))
+			self.assertEqual(db.names('bbbb'), {0x100: 'name_0', 0x102: 'name_2'})
+			self.assertEqual(len(db.read(rom='aaaa')), len(_plan(0)) + len(_plan(3)))
+			self.assertEqual(list(db.between(0x100, 0x101, 'aaaa')), [(0x100, h8_annotations.NAME, ('name_0', 'check'))])
+
+	def testFamilies(self):
+		#Registers are stored per family, a ROM of one family never reads another family's
+		first = h8_definitions.Definitions('first', 'chip_a', {}, {}, {})
+		second = h8_definitions.Definitions('second', 'chip_b', {}, {}, {})
+		with h8_annotdb.AnnotationDatabase(self.path) as db:
+			db.write('registers', _plan(0), h8_annotdb.familyKey(first))
+			db.write('registers', _plan(1), h8_annotdb.familyKey(second))
+			db.write('mut_table', _plan(2), 'aaaa')
+
+		with h8_annotdb.AnnotationDatabase(self.path) as db:
+			keys = ('aaaa', h8_annotdb.familyKey(second))
+			self.assertEqual(db.steps(keys), [('mut_table', 'aaaa'), ('registers', 'family:second/chip_b')])
+			self.assertEqual(list(db.read(['registers'], keys)), list(_plan(1)))
+			self.assertEqual(db.names(keys), {0x101: 'name_1', 0x102: 'name_2'})
+
+	def testSchemaVersion(self):
+		h8_annotdb.AnnotationDatabase(self.path).close()
+		import sqlite3
+		db = sqlite3.connect(self.path)
+		db.execute('PRAGMA user_version = 2')
+		db.close()
+		self.assertRaises(ValueError, h8_annotdb.AnnotationDatabase, self.path)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,50 @@
+import random
+import unittest
+
+import numpy
+
+import h8_checksum
+import h8_rom
+import h8_synth
+
+class ChecksumTest(unittest.TestCase):
+
+	def setUp(self):
+		self.data = bytes(h8_synth.synthRom(0).data)
+
+	def _patchRandomly(self, checksum, spec, seed=0):
+		rng = random.Random(seed)
+		for i in range(200):
+			addr = rng.randrange(h8_rom.ROM_START, h8_rom.ROM_END - 8)
+			checksum.patch(addr, [rng.randrange(0x100) for j in range(rng.randrange(1, 8))])
+			self.assertEqual(checksum.sum, int(h8_checksum.wordSum(checksum.image, spec)))
+
+	def testIncrementalSum(self):
+		spec = h8_checksum.DEFAULT_SPEC
+		checksum = h8_checksum.Checksum(self.data, spec)
+		self._patchRandomly(checksum, spec)
+		checksum.fix()
+		self.assertTrue(checksum.valid)
+		self.assertTrue(h8_checksum.verify(checksum.tobytes(), spec).valid)
+
+	def testStoredSum(self):
+		spec = h8_checksum.ChecksumSpec(0x10000, 0x20000, 0x1FFFE)
+		checksum = h8_checksum.Checksum(self.data, spec)
+		self._patchRandomly(checksum, spec, 1)
+		self.assertEqual(checksum.fix(), 0x1FFFE)
+		self.assertTrue(h8_checksum.verify(checksum.tobytes(), spec).valid)
+
+	def testStackedImages(self):
+		images = numpy.stack([numpy.frombuffer(bytes(h8_synth.synthRom(seed).data), numpy.uint8) for seed in range(3)])
+		sums = h8_checksum.wordSum(images)
+		self.assertEqual([int(s) for s in sums], [int(h8_checksum.wordSum(image)) for image in images])
+
+	def testSpecAlignment(self):
+		self.assertRaises(ValueError, h8_checksum.ChecksumSpec, 0x10001, 0x30000, None, 0, 0x2FFFE)
+		self.assertRaises(ValueError, h8_checksum.ChecksumSpec, 0x10000, 0x2FFFF, None, 0, 0x2FFFC)
+		self.assertRaises(ValueError, h8_checksum.ChecksumSpec, 0x10000, 0x30000, 0x2FFFF)
+		self.assertRaises(ValueError, h8_checksum.ChecksumSpec, 0x10000, 0x20000, None, 0, 0x2FFFE)
+		self.assertRaises(ValueError, h8_checksum.ChecksumSpec, 0x10000, 0x30000)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+import h8_analysis
+import h8_decoder
+import h8_rom
+import h8_synth
+
+def _decode(values, address=0x10200):
+	return h8_decoder.decode(bytearray(values + [0] * 6), 0, address)
+
+class DecodeTest(unittest.TestCase):
+
+	def testImmediate(self):
+		insn = _decode([0x58, 0x12, 0x34])
+		self.assertEqual((insn.mnemonic, insn.reg, insn.imm, insn.size), ('mov:i', 0, 0x1234, 3))
+
+	def testDisplacement(self):
+		insn = _decode([0xFC, 0x12, 0x34, 0x80])
+		self.assertEqual((insn.mnemonic, insn.ea, insn.eareg, insn.value, insn.opsize),
+			('mov:g', h8_decoder.EA_DISP, 4, 0x1234, 2))
+		self.assertEqual(h8_decoder.formatInsn(insn), 'mov:g.w @(0x1234,r4), r0')
+
+	def testCalls(self):
+		insn = _decode([0x03, 0x01, 0x46, 0x56])
+		self.assertEqual((insn.mnemonic, insn.flow, insn.target), ('pjsr', h8_decoder.FLOW_CALL, 0x14656))
+		insn = _decode([0x18, 0x04, 0x00])
+		self.assertEqual((insn.mnemonic, insn.target), ('jsr', 0x10400))
+		insn = _decode([0x1E, 0x01, 0x00])
+		self.assertEqual((insn.mnemonic, insn.target), ('bsr', 0x10303))
+
+	def testBitRegister(self):
+		insn = _decode([0xD4, 0x49])
+		self.assertEqual((insn.mnemonic, insn.imm, insn.reg, insn.eareg), ('bset', h8_decoder.BIT_REGISTER, 1, 4))
+		self.assertEqual(h8_decoder.formatInsn(insn), 'bset.b r1, @r4')
+
+	def testControl(self):
+		insn = _decode([0x04, 0x02, 0x8C])
+		self.assertEqual((insn.mnemonic, insn.reg, insn.value), ('ldc', 4, 2))
+
+class DisassembleTest(unittest.TestCase):
+
+	def setUp(self):
+		self.synthetic = h8_synth.synthRom(0)
+		self.rom = h8_rom.RomSpace(data=bytes(self.synthetic.data))
+
+	def testSyntheticRom(self):
+		disassembly = h8_decoder.disassemble(self.rom)
+		for function in h8_analysis.KNOWN_FUNCTIONS:
+			self.assertIn(function.address, disassembly.functions)
+		self.assertIn(h8_synth.RESET_HANDLER, disassembly.functions)
+		lookup = [f.address for f in h8_analysis.KNOWN_FUNCTIONS if f.name == 'table_lookup_byte'][0]
+		self.assertEqual(disassembly.insns[lookup].mnemonic, 'ldc')
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+import numpy
+
+import h8_diff
+import h8_synth
+
+class DiffTest(unittest.TestCase):
+
+	def setUp(self):
+		self.reference = numpy.frombuffer(bytes(h8_synth.synthRom(0).data), numpy.uint8)
+
+	def _diff(self, patches, annotations):
+		other = self.reference.copy()
+		for offset, value in patches:
+			other[offset] = value
+		return h8_diff.diffImages(self.reference, other, annotations)
+
+	def testIdentical(self):
+		self.assertEqual(h8_diff.diffImages(self.reference, self.reference.copy()), [])
+
+	def testMirror(self):
+		#Functions are found at their page 0 mirror address, changes are reported in 10000-2FFFF
+		annotations = h8_diff.defaultAnnotations(functions=[(0x3B71, 0x3B80, 'sub_3B71')])
+		changes = self._diff([(0x3B72, self.reference[0x3B72] ^ 0xFF), (0x6, self.reference[0x6] ^ 1)], annotations)
+		self.assertEqual([(c.start, c.end) for c in changes], [(0x10006, 0x10007), (0x13B72, 0x13B73)])
+		self.assertEqual(changes[0].annotations, [('vector', '0x004')])
+		self.assertEqual(changes[1].annotations, [('function', 'sub_3B71')])
+
+	def testCancellingChanges(self):
+		#Two changes in one block that cancel in a linear sum of its words, with another change in the page
+		patches = [(0xA07, (int(self.reference[0xA07]) + 0xEB) & 0xFF), (0xA0F, (int(self.reference[0xA0F]) + 1) & 0xFF),
+			(0x5000, self.reference[0x5000] ^ 0xFF)]
+		changes = self._diff(patches, None)
+		self.assertEqual([(c.start, c.end) for c in changes], [(0x10A07, 0x10A08), (0x10A0F, 0x10A10), (0x15000, 0x15001)])
+
+	def testMerge(self):
+		changes = self._diff([(0x8000, 0), (0x8003, 0), (0x8100, 0)], None)
+		self.assertEqual([(c.start, c.end) for c in changes], [(0x18000, 0x18004), (0x18100, 0x18101)])
+
+if __name__ == '__main__':
+	unittest.main()
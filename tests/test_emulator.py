@@ -0,0 +1,54 @@
+import struct
+import unittest
+
+import h8_emulator
+import h8_rom
+import h8_synth
+
+CALLER = 0x10200
+
+def _rom(code):
+	#copy_flash_code as h8_synth generates it, called from a hand assembled reset handler
+	data = bytearray(b'\xFF' * h8_rom.ROM_SIZE)
+	data[0:4] = struct.pack('>I', CALLER)
+	for address, values in ((h8_emulator.COPY_FLASH_CODE, h8_synth.COPY_FLASH_CODE), (CALLER, code)):
+		offset = h8_rom.romOffset(address)
+		data[offset:offset + len(values)] = bytearray(values)
+	return h8_rom.RomSpace(data=bytes(data))
+
+def _caller(start, end, ep=None):
+	#[ldc.b #ep, ep /] mov:i #start, r4 / mov:i #end, r1 / pjsr copy_flash_code / rts
+	code = [0x04, ep, 0x8C] if ep is not None else []
+	target = h8_emulator.COPY_FLASH_CODE
+	return code + [0x5C, start >> 8, start & 0xFF, 0x59, end >> 8, end & 0xFF,
+		0x03, target >> 16, (target >> 8) & 0xFF, target & 0xFF, 0x19]
+
+class FlashCopyTest(unittest.TestCase):
+
+	def testSyntheticRom(self):
+		synthetic = h8_synth.synthRom(0)
+		copy = h8_emulator.flashCopy(h8_rom.RomSpace(data=bytes(synthetic.data)))
+		start, end = synthetic.flashCode
+		self.assertEqual((copy.start, copy.end), (start, end))
+		self.assertEqual((copy.destination, copy.length), (h8_synth.FLASH_DESTINATION, end - start))
+
+	def testUnbackedStart(self):
+		#Without EP set the source is in page 0 above the mirror, which the ROM does not back
+		self.assertIsNone(h8_emulator.flashCopy(_rom(_caller(0x5000, 0x5100))))
+		copy = h8_emulator.flashCopy(_rom(_caller(0x5000, 0x5100, 2)))
+		self.assertEqual((copy.start, copy.length), (0x25000, 0x100))
+
+	def testEmptyRange(self):
+		self.assertIsNone(h8_emulator.flashCopy(_rom(_caller(0x5100, 0x5000, 2))))
+
+	def testNotEmulated(self):
+		#trapa #3, movfpe and pjmp @r4 raise EmulationError naming the instruction
+		for code, name in (([0x08, 0x13], 'trapa'), ([0x15, 0xFE, 0x80, 0x00, 0x80], 'movfpe'), ([0x11, 0xC4], 'pjmp')):
+			emulator = h8_emulator.Emulator(_rom(code))
+			emulator.reset()
+			with self.assertRaises(h8_emulator.EmulationError) as context:
+				emulator.run(CALLER, stepOver=False)
+			self.assertIn(name, str(context.exception))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,100 @@
+import collections
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import h8_analysis
+import h8_annotations
+import h8_bench
+import h8_mock_ida
+import h8_rom
+import h8_synth
+
+class IdaScriptTest(unittest.TestCase):
+	"""
+	Runs the steps of h8_ida_disam.py against the mock IDA API on synthetic ROMs
+	"""
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def _run(self, synthetic):
+		path = os.path.join(self.directory, 'synth_%d.bin' % synthetic.seed)
+		with open(path, 'wb') as f:
+			f.write(bytes(synthetic.data))
+		ida = h8_mock_ida.MockIda()
+		self.namespace = ida.loadScript(h8_bench.SCRIPT)
+		ida.reset(path)
+		for name, args in h8_bench.PHASES:
+			self.namespace[name](*args)
+		return ida
+
+	def testSteps(self):
+		synthetic = h8_synth.synthRom(0)
+		ida = self._run(synthetic)
+		names = ida.names
+		for function in h8_analysis.KNOWN_FUNCTIONS:
+			self.assertEqual(names.get(function.address), function.name)
+		self.assertEqual(names.get(h8_analysis.MUT_TABLE_START), 'MUT_00')
+		for name, address in synthetic.functions.items():
+			self.assertEqual(names.get(address), name)
+		for address, kind in synthetic.maps:
+			self.assertIn(address, names)
+
+	def testSharedDtcBlock(self):
+		#Point every DTC vector at one of two blocks
+		synthetic = h8_synth.synthRom(1)
+		data = synthetic.data
+		blocks = synthetic.dtcBlocks[:2]
+		for i, addr in enumerate(range(h8_analysis.DTC_VECTORS_START, h8_analysis.VECTOR_TABLE_END, 4)):
+			offset = h8_rom.romOffset(addr)
+			data[offset:offset + 4] = struct.pack('>I', blocks[i % 2])
+		ida = self._run(synthetic)
+		counters = collections.Counter(name.rsplit('_', 1)[1] for name in ida.names.values() if name.startswith('DTC_vec_DTMR_'))
+		self.assertEqual(sorted(counters), ['0', '1'])
+		self.assertEqual(ida.names.get(blocks[0]), 'DTC_vec_DTMR_0')
+		self.assertEqual(ida.names.get(blocks[1]), 'DTC_vec_DTMR_1')
+
+	def testReconcileVectors(self):
+		#One block renamed by hand and one holding the name an older run applied
+		synthetic = h8_synth.synthRom(2)
+		ida = self._run(synthetic)
+		namespace = self.namespace
+		first, second = synthetic.dtcBlocks[:2]
+		self.assertEqual(ida.names.get(second), 'DTC_vec_DTMR_1')
+		previous = h8_annotations.AnnotationPlan()
+		for ea, kind, args in namespace['committedPlans']['vectors'].entries:
+			if ea == second and kind == h8_annotations.NAME:
+				args = ('DTC_old_1',) + args[1:]
+			previous.entries.append((ea, kind, args))
+		ida.MakeNameEx(first, 'my_block', h8_mock_ida.SN_NOCHECK)
+		ida.MakeNameEx(second, 'DTC_old_1', h8_mock_ida.SN_NOCHECK)
+		ida.MakeNameEx(synthetic.dtcBlocks[2], '', h8_mock_ida.SN_NOCHECK)
+
+		namespace['RECONCILE'] = True
+		namespace['previousPlans']['vectors'] = previous
+		namespace['createVTEntries']()
+		self.assertEqual(ida.names.get(first), 'my_block')
+		self.assertEqual(ida.names.get(second), 'DTC_vec_DTMR_1')
+		self.assertEqual(ida.names.get(synthetic.dtcBlocks[2]), 'DTC_vec_DTMR_2')
+
+	def testReconcilePlan(self):
+		plan = h8_annotations.AnnotationPlan()
+		plan.entries.extend([(0x100, h8_annotations.NAME, ('new_100', 'nocheck')), (0x200, h8_annotations.NAME, ('new_200', 'nocheck')),
+			(0x300, h8_annotations.COMMENT, ('planned',)), (0x400, h8_annotations.NAME, ('same', 'nocheck'))])
+		previous = h8_annotations.AnnotationPlan()
+		previous.entries.extend([(0x100, h8_annotations.NAME, ('old_100', 'nocheck')), (0x200, h8_annotations.NAME, ('old_200', 'nocheck'))])
+		current = {0x100: 'old_100', 0x200: 'edited', 0x300: '', 0x400: 'same'}
+		state = dict((slot, current[entry[0]]) for slot, (value, entry) in h8_annotations.slots(plan).items())
+		changes, kept = h8_annotations.reconcilePlan(plan, state, previous)
+		#Stale and unset slots change, the edited name is kept and the current one left alone
+		self.assertEqual(sorted(ea for ea, kind, args in changes.entries), [0x100, 0x300])
+		self.assertEqual(kept, 1)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+
+import numpy
+
+import h8_interp
+import h8_maps
+import h8_rom
+import h8_synth
+
+class InterpTest(unittest.TestCase):
+
+	def testTruncation(self):
+		data = numpy.array([0xF0, 0xFF], numpy.uint8)
+		self.assertEqual(list(h8_interp.lookup2d(data, [0, 0x100], 0x20)), [0x10, 0x1F])
+		self.assertEqual(h8_interp.lookupScalar(data, 0x100, None, 0x20), 0x1F)
+		#Without an unsigned array or a size nothing is truncated
+		self.assertEqual(list(h8_interp.lookup2d([0xF0, 0xFF], [0], 0x20)), [0x110])
+
+	def testScalarReference(self):
+		data = numpy.arange(12, dtype='>u2').reshape(3, 4) * 0x1111
+		xs = numpy.arange(0, 0x400, 0x33)
+		ys = (xs * 7) % 0x300
+		self.assertEqual(h8_interp.validate(data, xs, ys, 0x8000), [])
+
+	def testSyntheticRoutines(self):
+		#Every synthetic map against h8_synth's stand-in table_lookup_byte/word run in h8_emulator
+		#This checks the model and the emulator agree, the ROM routines are not modelled
+		for seed in range(3):
+			synthetic = h8_synth.synthRom(seed)
+			rom = h8_rom.RomSpace(data=bytes(synthetic.data))
+			axes, maps = h8_maps.extractMaps(rom, synthetic.maps, synthetic.axes)
+			index = h8_maps.axisIndex(axes.values())
+			self.assertEqual(len(maps), len(synthetic.maps))
+			for table in maps.values():
+				mismatches = h8_interp.validateMap(rom, table, index[table.indexX], index.get(table.indexY), 12)
+				self.assertEqual(mismatches, [], '%s at %X' % (table.kind, table.address))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+
+import h8_analysis
+import h8_decoder
+import h8_definitions
+import h8_mutlocate
+import h8_rom
+import h8_synth
+
+class MutLocateTest(unittest.TestCase):
+
+	def testKnownIds(self):
+		known = h8_mutlocate.knownMutIds()
+		#Only the variable requests of the catalogue, not the commands
+		self.assertIn(0x21, known)
+		self.assertEqual([i for i in known if i >= h8_analysis.MUT_COMMANDS_START], [])
+		self.assertEqual(set(known), set(i for i in h8_definitions.load().mutIds if i < 0xC0))
+
+	def testSyntheticRoms(self):
+		for seed in range(3):
+			synthetic = h8_synth.synthRom(seed)
+			rom = h8_rom.RomSpace(data=bytes(synthetic.data))
+			found = h8_mutlocate.locateMutTable(rom, references=h8_decoder.disassemble(rom).values)
+			self.assertEqual(found[0], h8_analysis.MUT_TABLE_START)
+			self.assertGreaterEqual(found[1], h8_analysis.MUT_TABLE_END)
+
+if __name__ == '__main__':
+	unittest.main()
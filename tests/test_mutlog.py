@@ -0,0 +1,77 @@
+import io
+import unittest
+
+import numpy
+
+import h8_mutlog
+
+class MutlogTest(unittest.TestCase):
+
+	def setUp(self):
+		self.channels = h8_mutlog.channels(labels={})
+
+	def _decode(self, data, dtype, chunkRecords):
+		return list(h8_mutlog.decode(io.BytesIO(data), self.channels, dtype, chunkRecords))
+
+	def _merged(self, chunks):
+		#{request: (record numbers, responses)} over every chunk
+		merged = {}
+		for chunk in chunks:
+			for name, column in chunk.columns.items():
+				index, values = merged.setdefault(int(name[4:], 16), ([], []))
+				index.extend(int(i) for i in column.index)
+				values.extend(int(v) for v in column.values)
+		return merged
+
+	def testStreaming(self):
+		#Records split across reads land in the right chunk and column
+		records = [(i % 3, i) for i in range(10)]
+		data = bytes(bytearray(b for record in records for b in record))
+		chunks = self._decode(data, h8_mutlog.PAIR, 4)
+		self.assertEqual([(c.start, c.records, c.dropped, c.trailing) for c in chunks], [(0, 4, 0, 0), (4, 4, 0, 0), (8, 2, 0, 0)])
+		merged = self._merged(chunks)
+		self.assertEqual(merged[0], ([0, 3, 6, 9], [0, 3, 6, 9]))
+		self.assertEqual(merged[2], ([2, 5, 8], [2, 5, 8]))
+
+	def testTimestamped(self):
+		records = numpy.zeros(5, h8_mutlog.TIMESTAMPED)
+		records['time'] = [10, 20, 30, 40, 50]
+		records['request'] = [1, 2, 1, 2, 1]
+		records['response'] = [5, 6, 7, 8, 9]
+		merged = self._merged(self._decode(records.tobytes(), h8_mutlog.TIMESTAMPED, 2))
+		self.assertEqual(merged[1], ([10, 30, 50], [5, 7, 9]))
+
+	def testTrailing(self):
+		chunks = self._decode(b'\x01\x02\x03\x04\x05', h8_mutlog.PAIR, 8)
+		self.assertEqual([(c.records, c.trailing) for c in chunks], [(2, 0), (0, 1)])
+		reader = h8_mutlog.readRecords(io.BytesIO(b'\x01\x02\x03'), h8_mutlog.PAIR)
+		self.assertEqual(len(list(reader)[0]), 1)
+		self.assertEqual(reader.trailing, 1)
+
+	def testEchoResync(self):
+		#The echo of the third record is lost, only that record is dropped
+		records = [(i, i, 0x80 + i) for i in range(1, 9)]
+		data = bytearray(b for record in records for b in record)
+		del data[7]
+		for chunkRecords in (2, 3, 100):
+			chunks = self._decode(bytes(data), h8_mutlog.ECHO, chunkRecords)
+			self.assertEqual(sum(c.dropped for c in chunks), 1)
+			self.assertEqual(sum(c.records for c in chunks), 7)
+			self.assertEqual(sum(c.trailing for c in chunks), 0)
+			merged = self._merged(chunks)
+			self.assertNotIn(3, merged)
+			self.assertEqual(dict((mutId, values) for mutId, (index, values) in merged.items()),
+				dict((i, [0x80 + i]) for i in range(1, 9) if i != 3))
+			index = [merged[i][0][0] for i in sorted(merged)]
+			self.assertEqual(index, sorted(index))
+
+	def testEchoGarbage(self):
+		#Noise between records costs the records it overlaps, a partial record at the end is reported
+		data = b'\x01\x01\x10' + b'\x05\x06\x07\x08\x09\x0A' + b'\x02\x02\x20' + b'\x03\x03'
+		chunks = self._decode(data, h8_mutlog.ECHO, 100)
+		self.assertEqual(sum(c.records for c in chunks), 2)
+		self.assertEqual(sum(c.dropped for c in chunks), 2)
+		self.assertEqual(sum(c.trailing for c in chunks), 2)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy
+
+import h8_analysis
+import h8_mutlog
+import h8_mutsim
+import h8_rom
+import h8_synth
+
+class MutsimTest(unittest.TestCase):
+
+	def setUp(self):
+		self.synthetic = h8_synth.synthRom(0)
+		self.rom = h8_rom.RomSpace(data=bytes(self.synthetic.data))
+		#Requests from 0x11 on are past this table
+		self.table = (h8_analysis.MUT_TABLE_START, h8_analysis.MUT_TABLE_START + 0x20)
+		self.now = [0.0]
+
+	def _ecu(self, trace=None, echo=False):
+		return h8_mutsim.SimulatedEcu(self.rom, self.table, trace=trace, echo=echo, clock=lambda: self.now[0])
+
+	def _trace(self, records):
+		trace = numpy.zeros(len(records), h8_mutlog.TIMESTAMPED)
+		for i, record in enumerate(records):
+			trace[i] = record
+		return trace
+
+	def testRespond(self):
+		ecu = self._ecu(echo=True)
+		pointer = self.synthetic.mutPointers[1]
+		ecu.memory[pointer] = 0x42
+		self.assertEqual(ecu.respond(b'\x01\x50'), b'\x01\x42\x50' + bytes(bytearray([h8_mutsim.NO_ENTRY])))
+		self.assertEqual(ecu.requests, 2)
+
+	def testReplay(self):
+		#Writes apply as time passes and the trace loops, requests past the table leave NO_ENTRY alone
+		ecu = self._ecu(self._trace([(100, 1, 0x10), (100, 0x50, 0x77), (200, 2, 0x20), (300, 1, 0x30)]))
+		self.assertEqual(ecu.respond(b'\x01\x02\x50'), b'\x10\x00\x00')
+		self.now[0] = 0.1
+		self.assertEqual(ecu.respond(b'\x01\x02\x50'), b'\x10\x20\x00')
+		self.now[0] = 0.2
+		self.assertEqual(ecu.respond(b'\x01\x02\x50'), b'\x30\x20\x00')
+		#One full pass and part of the next
+		self.now[0] = 0.25
+		self.assertEqual(ecu.respond(b'\x01\x02\x50'), b'\x10\x20\x00')
+
+	def testTraceOutsideTable(self):
+		ecu = self._ecu(self._trace([(0, 0x50, 0x77), (10, 0x60, 0x55)]))
+		self.now[0] = 1.0
+		self.assertEqual(ecu.respond(b'\x50\x60'), bytes(bytearray([h8_mutsim.NO_ENTRY] * 2)))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+
+import h8_decoder
+import h8_pages
+import h8_rom
+import h8_xrefs
+
+#Entry A: ldc.b #1, dp / bsr F / ldc.b #2, ep / mov:g.w @(0x1234,r4), r0 / mov:i #0xF000, r1 / mov:i #0x4321, r2 /
+#mov:g.w @(0x3333,r1), r0 / rts
+ENTRY_A = 0x10200
+#Entry B: ldc.b #2, dp / bsr F / rts
+ENTRY_B = 0x10300
+#F: mov:g.w @0x5678, r0 / mov:g.w r0, @0xF000 / mov:g.w @(0x2222,r1), r0 / rts, called with dp 1 and dp 2
+FUNCTION = 0x10400
+DISPLACEMENT = ENTRY_A + 9
+
+def _bsr(source, target):
+	displacement = (target - source - 3) & 0xFFFF
+	return [0x1E, displacement >> 8, displacement & 0xFF]
+
+def _rom():
+	data = bytearray(b'\xFF' * h8_rom.ROM_SIZE)
+	code = {
+		ENTRY_A: [0x04, 0x01, 0x8D] + _bsr(ENTRY_A + 3, FUNCTION) + [0x04, 0x02, 0x8C, 0xFC, 0x12, 0x34, 0x80,
+			0x59, 0xF0, 0x00, 0x5A, 0x43, 0x21, 0xF9, 0x33, 0x33, 0x80, 0x19],
+		ENTRY_B: [0x04, 0x02, 0x8D] + _bsr(ENTRY_B + 3, FUNCTION) + [0x19],
+		FUNCTION: [0x1D, 0x56, 0x78, 0x80, 0x1D, 0xF0, 0x00, 0x90, 0xF9, 0x22, 0x22, 0x80, 0x19],
+	}
+	for address, values in code.items():
+		offset = h8_rom.romOffset(address)
+		data[offset:offset + len(values)] = bytearray(values)
+	return h8_rom.RomSpace(data=bytes(data))
+
+class PageRegistersTest(unittest.TestCase):
+
+	def setUp(self):
+		self.disassembly = h8_decoder.disassemble(_rom(), [ENTRY_A, ENTRY_B])
+		self.pages = h8_pages.resolvePages(self.disassembly)
+
+	def testStates(self):
+		states = self.pages.insnStates()
+		self.assertEqual(states[ENTRY_A + 3].dp, 1)
+		self.assertEqual(states[ENTRY_B + 3].dp, 2)
+		#The callers disagree
+		self.assertEqual(states[FUNCTION].dp, h8_pages.VARYING)
+		self.assertEqual(self.pages.at(FUNCTION).dp, 0)
+		#F does not write dp so A keeps its own after the call
+		self.assertEqual(states[DISPLACEMENT].dp, 1)
+		self.assertEqual(states[ENTRY_A].ep, h8_pages.VARYING)
+		self.assertEqual(states[DISPLACEMENT].ep, 2)
+
+	def testRanges(self):
+		ranges = self.pages.ranges()
+		#dp goes back to its default at B and where the callers of F disagree, ep is not a segment register range
+		self.assertEqual(ranges, [(ENTRY_A + 3, 'dp', 1), (ENTRY_B, 'dp', 0), (ENTRY_B + 3, 'dp', 2), (FUNCTION, 'dp', 0)])
+
+	def testPages(self):
+		pages = self.pages.pages()
+		self.assertEqual(pages[DISPLACEMENT], (0, 1, 2, h8_pages.VARYING))
+		self.assertNotIn(FUNCTION, pages)
+		self.assertEqual(self.disassembly.pageOf(DISPLACEMENT), (0, 1))
+
+	def testXrefs(self):
+		sources, targets, kinds, owners = h8_xrefs.edges(self.disassembly, structures={}, pages=self.pages)
+		offsets = set((int(s), int(t)) for s, t, k in zip(sources, targets, kinds) if k == h8_xrefs.XREF_OFFSET)
+		#@(d:16,r4) pages through ep, not dp
+		self.assertIn((DISPLACEMENT, 0x21234), offsets)
+		#An immediate is kept when it is a RAM variable the code accesses, never paged
+		self.assertIn((DISPLACEMENT + 4, 0xF000), offsets)
+		self.assertEqual([o for o in offsets if o[0] == DISPLACEMENT + 7], [])
+		#@(d:16,r1) pages through dp, and is left out where dp is VARYING
+		self.assertIn((DISPLACEMENT + 10, 0x13333), offsets)
+		self.assertEqual([o for o in offsets if o[0] >= FUNCTION], [])
+		structures = h8_xrefs.edges(self.disassembly, structures={0x4321: 0x14321}, pages=self.pages)
+		self.assertIn((DISPLACEMENT + 7, 0x14321), set(zip(structures[0].tolist(), structures[1].tolist())))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,67 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import h8_pipeline
+import h8_synth
+
+def _failing(values, options):
+	raise RuntimeError('stage failed')
+
+class PipelineTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'synth.bin')
+		with open(self.path, 'wb') as f:
+			f.write(bytes(h8_synth.synthRom(0).data))
+		self.outDir = os.path.join(self.directory, 'out')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def _run(self, stages=h8_pipeline.STAGES):
+		results = h8_pipeline.Pipeline(self.path, self.outDir, stages=stages).run(threads=2)
+		return dict((result.name, result.status) for result in results)
+
+	def testRerunLoads(self):
+		first = self._run()
+		self.assertEqual(set(first.values()), set(['done']))
+		self.assertTrue(os.path.exists(os.path.join(self.outDir, 'synth.bin', 'annotations.db')))
+		#Nothing runs again, not even load and disassembly
+		second = self._run()
+		checkpointed = [stage.name for stage in h8_pipeline.STAGES if stage.checkpoint]
+		self.assertEqual(second, dict((name, 'loaded') for name in checkpointed))
+
+	def testResume(self):
+		#maps fails, export reads it and is skipped, the other stages finish
+		stages = tuple(stage._replace(function=_failing) if stage.name == 'maps' else stage for stage in h8_pipeline.STAGES)
+		first = self._run(stages)
+		self.assertEqual(first['maps'], 'failed')
+		self.assertEqual(first['export'], 'skipped')
+		self.assertEqual(first['mut'], 'done')
+		self.assertFalse(os.path.exists(os.path.join(self.outDir, 'synth.bin', 'maps.json')))
+
+		#The rerun starts at the failed stage with the inputs it needs
+		second = self._run()
+		self.assertEqual(dict((name, status) for name, status in second.items() if status != 'loaded'),
+			{'load': 'done', 'disassembly': 'done', 'maps': 'done', 'export': 'done'})
+
+	def testStaleCheckpoint(self):
+		#Only the stage whose checkpoint key does not match runs again, its readers keep theirs
+		self._run()
+		path = os.path.join(self.outDir, 'synth.bin', 'mut.json')
+		with open(path) as f:
+			stored = json.load(f)
+		stored['key'] = 'stale'
+		with open(path, 'w') as f:
+			json.dump(stored, f)
+		results = self._run()
+		self.assertEqual(results['mut'], 'done')
+		self.assertEqual(results['export'], 'loaded')
+		self.assertEqual(results['maps'], 'loaded')
+
+if __name__ == '__main__':
+	unittest.main()